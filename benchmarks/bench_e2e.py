@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import FakeAWS, FakeGitHub, FakeOnePassword
+
+AWS_PROFILE = 'bench'
+AWS_REGION = 'us-east-1'
+
+def write_aws_config(root):
+    # A static profile lets boto3 build real sessions without touching SSO
+    config_path = os.path.join(root, 'aws-config')
+    with open(config_path, 'w') as f:
+        f.write(f"[profile {AWS_PROFILE}]\nregion = {AWS_REGION}\n"
+                "aws_access_key_id = bench\naws_secret_access_key = bench\n")
+    os.environ['AWS_CONFIG_FILE'] = config_path
+    os.environ['AWS_SHARED_CREDENTIALS_FILE'] = os.path.join(root, 'aws-credentials')
+
+def configure_git(root):
+    # Isolate the local git commands from the user's own configuration
+    global_config = os.path.join(root, 'gitconfig')
+    with open(global_config, 'w') as f:
+        f.write("[init]\n\tdefaultBranch = main\n[user]\n\tname = bench\n\temail = bench@example.com\n")
+    os.environ['GIT_CONFIG_GLOBAL'] = global_config
+    os.environ['GIT_CONFIG_NOSYSTEM'] = '1'
+
+def write_manifest(path, count, working_dir, run_id, state_locking, replica_regions=(), replicate=False):
+    optional = {}
+    if replica_regions:
+        optional['backend_regions'] = list(replica_regions)
+        if replicate:
+            optional['backend_replication_role'] = 'arn:aws:iam::123456789012:role/bench-replication'
+    with open(path, 'w') as f:
+        for index in range(count):
+            f.write(json.dumps({
+                'project_name': f"bench-{run_id}-{index}",
+                'working_dir': working_dir,
+                'jira_ticket': f"BENCH-{index}",
+                'aws_sso_profile': AWS_PROFILE,
+                'aws_region': AWS_REGION,
+                'onepassword_vault': 'bench-vault',
+                'onepassword_item': 'bench-item',
+                'environment': 'staging',
+                'test_email': 'bench@example.com',
+                'state_locking': state_locking,
+                **optional
+            }) + '\n')
+
+@contextmanager
+def suppressed_output(enabled):
+    # Redirects the file descriptors too, so git's own output is hidden as well
+    if not enabled:
+        yield
+        return
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+        os.dup2(devnull.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            for fd in saved:
+                os.close(fd)
+
+def run_main(main_module, argv, quiet):
+    saved_argv = sys.argv
+    sys.argv = ['main.py'] + argv
+    try:
+        with suppressed_output(quiet):
+            start = time.perf_counter()
+            main_module.main()
+            return time.perf_counter() - start
+    finally:
+        sys.argv = saved_argv
+
+def run_scenario(main_module, services, action, count, args, paths):
+    from src.aws_utils import clear_aws_cache
+    from src.secrets_manager import invalidate_secrets_cache
+    from src.tracing import get_spans, reset_trace
+
+    aws, github, op = services
+    # Every run starts cold: no cached secrets, sessions, clients or spans
+    for service in (aws, github):
+        service.calls.reset()
+    op.reset()
+    invalidate_secrets_cache()
+    clear_aws_cache()
+    reset_trace()
+
+    if action == 'audit':
+        argv = ['--audit', paths['report'], '--aws-profile', AWS_PROFILE, '--aws-region', AWS_REGION, '--inventory', paths['inventory']]
+    elif action == 'reap':
+        # The fleet is healthy, so the reaper must find nothing to delete
+        argv = ['--reap', '--min-age-hours', '0', '--aws-profile', AWS_PROFILE, '--aws-region', AWS_REGION, '--inventory', paths['inventory']]
+    else:
+        argv = ['--manifest', paths['manifest'], '--workers', str(args.workers), '--inventory', paths['inventory'],
+                '--github-writes-per-minute', str(args.github_writes_per_minute)]
+    if action == 'destroy':
+        argv.append('--destroy')
+    wall = run_main(main_module, argv, not args.verbose)
+
+    aws_calls = aws.calls.snapshot()
+    github_calls = github.calls.snapshot()
+    return {
+        'projects': count,
+        'action': action,
+        'wall_seconds': wall,
+        'projects_per_second': count / wall if wall else 0.0,
+        'aws_calls': sum(aws_calls.values()),
+        'github_calls': sum(github_calls.values()),
+        'op_calls': op.call_count(),
+        'git_commands': sum(1 for item in get_spans() if item['category'] == 'git'),
+        'calls': dict(sorted({**aws_calls, **github_calls}.items())),
+    }
+
+def check_state(services, action, count, paths, state_locking, regions=1):
+    aws, github, _ = services
+    if action == 'audit':
+        with open(paths['report'], 'r') as f:
+            summary = json.load(f)['summary']
+        expected = {'backends': count, 'healthy': count, 'orphan_lock_tables': 0}
+        return [f"{value} audited {name} expected, found {summary[name]}" for name, value in expected.items() if summary[name] != value]
+    expected = 0 if action == 'destroy' else count
+    expected_tables = expected if state_locking == 'dynamodb' else 0
+    actual = {'buckets': (len(aws.buckets), expected * regions), 'tables': (len(aws.tables), expected_tables),
+              'repositories': (len(github.repositories), expected)}
+    return [f"{wanted} {name} expected, found {found}" for name, (found, wanted) in actual.items() if found != wanted]
+
+def print_results(results, details):
+    print(f"\n{'PROJECTS':>8}  {'ACTION':<9} {'WALL':>8} {'PROJ/S':>7} {'AWS':>6} {'GITHUB':>7} {'OP':>4} {'GIT':>5}  CHECK")
+    for result in results:
+        check = 'ok' if not result['errors'] else '; '.join(result['errors'])
+        print(f"{result['projects']:>8}  {result['action']:<9} {result['wall_seconds']:>7.2f}s {result['projects_per_second']:>7.1f} "
+              f"{result['aws_calls']:>6} {result['github_calls']:>7} {result['op_calls']:>4} {result['git_commands']:>5}  {check}")
+        if details:
+            for name, calls in result['calls'].items():
+                print(f"{'':>20}{calls:>7}  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run provisioning, an audit and teardown end to end against local stand-ins for AWS, GitHub and 1Password")
+    parser.add_argument("--projects", type=int, nargs='+', default=[1, 10, 100], help="Project counts to benchmark")
+    parser.add_argument("--workers", type=int, default=8, help="Number of projects processed concurrently")
+    parser.add_argument("--aws-latency", type=float, default=0.02, help="Seconds added to every S3 and DynamoDB call")
+    parser.add_argument("--waiter-delay", type=float, default=0.5, help="Seconds a DynamoDB table takes to become active or disappear")
+    parser.add_argument("--github-latency", type=float, default=0.04, help="Seconds added to every GitHub API request")
+    parser.add_argument("--github-writes-per-minute", type=int, default=0,
+                        help="Write pacing passed to the provisioner (default 0: unpaced, as the fake has no secondary limit unless --github-secondary-limit is set)")
+    parser.add_argument("--github-secondary-limit", type=int, default=0,
+                        help="Content-creating requests per minute the fake GitHub accepts before answering 403 with Retry-After")
+    parser.add_argument("--op-latency", type=float, default=0.25, help="Seconds every `op` invocation takes")
+    parser.add_argument("--objects-per-bucket", type=int, default=20, help="State object versions stored in each bucket before teardown")
+    parser.add_argument("--state-locking", choices=('dynamodb', 's3'), default='dynamodb',
+                        help="State locking of the provisioned backends; 's3' skips the DynamoDB tables and their waiters")
+    parser.add_argument("--replica-regions", nargs='+', default=[], metavar="REGION",
+                        help="Further backend regions; every project gets a replica state bucket in each of them")
+    parser.add_argument("--replicate", action="store_true", help="Configure S3 replication to the replica buckets")
+    parser.add_argument("--details", action="store_true", help="Show the call count of every API operation")
+    parser.add_argument("--json", metavar="PATH", help="Also write the results to PATH as JSON")
+    parser.add_argument("--verbose", action="store_true", help="Show the provisioner's own output")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory with the fake remotes, manifests and inventories")
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='project-factory-bench-')
+    write_aws_config(root)
+    configure_git(root)
+
+    aws = FakeAWS(latency=args.aws_latency, waiter_delay=args.waiter_delay)
+    op = FakeOnePassword(root, latency=args.op_latency).install()
+    with FakeGitHub(os.path.join(root, 'remotes'), latency=args.github_latency,
+                    secondary_writes_per_minute=args.github_secondary_limit) as github:
+        # The provisioner is imported only now, so it picks up the fake GitHub URL
+        os.environ['GITHUB_API_URL'] = github.url
+        import main as main_module
+        from src import aws_utils
+        # Real botocore clients, whose calls the fake AWS answers once they are validated
+        get_aws_client = aws_utils.get_aws_client
+        aws_utils.get_aws_client = lambda session, service_name: aws.attach(get_aws_client(session, service_name))
+
+        services = (aws, github, op)
+        results = []
+        for count in args.projects:
+            paths = {
+                'manifest': os.path.join(root, f"manifest-{count}.jsonl"),
+                'inventory': os.path.join(root, f"inventory-{count}.db"),
+                'report': os.path.join(root, f"audit-{count}.json"),
+            }
+            working_dir = os.path.join(root, f"work-{count}")
+            os.makedirs(working_dir, exist_ok=True)
+            write_manifest(paths['manifest'], count, working_dir, count, args.state_locking, args.replica_regions, args.replicate)
+
+            for action in ('provision', 'audit', 'reap', 'destroy'):
+                if action == 'destroy':
+                    for bucket_name in list(aws.buckets):
+                        aws.put_objects(bucket_name, args.objects_per_bucket)
+                result = run_scenario(main_module, services, action, count, args, paths)
+                result['errors'] = check_state(services, action, count, paths, args.state_locking, 1 + len(args.replica_regions))
+                results.append(result)
+                print(f"{action} of {count} projects: {result['wall_seconds']:.2f}s", flush=True)
+
+    print_results(results, args.details)
+    print(f"\nLatencies: AWS {args.aws_latency}s (waiters {args.waiter_delay}s), GitHub {args.github_latency}s, op {args.op_latency}s; "
+          f"{args.workers} workers; {args.state_locking} state locking"
+          + (f"; replicas in {', '.join(args.replica_regions)}{' (replicated)' if args.replicate else ''}." if args.replica_regions else '.'))
+    if args.keep:
+        print(f"Scratch files kept in {root}")
+    else:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if any(result['errors'] for result in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src import template_utils
+from src.template_utils import render_project_files
+from main import render_context
+
+def project_context(index, environment):
+    # Built by main like a real render, so every variable the templates use is set
+    config = {
+        'project_name': f"bench-project-{index}",
+        'aws_region': 'us-east-1',
+        'environment': environment,
+        'jira_ticket': f"BENCH-{index}",
+        'test_email': 'bench@example.com'
+    }
+    return render_context(config, environment, f"bench-project-{index}-{environment}-terraform-state-abcde")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure template rendering throughput")
+    parser.add_argument("--projects", type=int, default=1000, help="Number of projects to render")
+    parser.add_argument("--environment", default="staging", help="Environment to render tfvars for")
+    parser.add_argument("--min-rate", type=float, help="Exit with an error if fewer projects/sec are rendered")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    template_utils.get_template_env()
+    warmup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for index in range(args.projects):
+        render_project_files(project_context(index, args.environment))
+    elapsed = time.perf_counter() - start
+    rate = args.projects / elapsed if elapsed else float('inf')
+
+    print(f"Template engine warm-up: {warmup * 1000:.1f} ms (bytecode cache: {template_utils.TEMPLATE_CACHE_DIR})")
+    print(f"Rendered {args.projects} projects in {elapsed:.3f}s: {rate:.0f} projects/sec")
+
+    if args.min_rate is not None and rate < args.min_rate:
+        print(f"Render throughput {rate:.0f} projects/sec is below the minimum of {args.min_rate:.0f}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SDK_MODULES = ('boto3', 'botocore', 'github', 'jinja2')
+
+# Every command is run as `python -X importtime main.py ...`. Commands listed
+# with forbidden modules fail the benchmark if any of them gets imported.
+COMMANDS = {
+    'validate-config': (['--validate-config', '--config', '{config}'], SDK_MODULES),
+    'list': (['--list', '--inventory', '{inventory}'], SDK_MODULES),
+    'render': (['--render', '--config', '{config}', '--inventory', '{inventory}'], ('boto3', 'botocore', 'github')),
+}
+# For comparison: the cost of loading everything a cloud action needs
+FULL_IMPORT = ['-c', 'import main, src.aws_utils, src.github_utils, src.template_utils']
+
+def write_config(root):
+    config_path = os.path.join(root, 'config.json')
+    with open(config_path, 'w') as f:
+        json.dump({
+            'project_name': 'startup-bench',
+            'working_dir': os.path.join(root, 'work'),
+            'jira_ticket': 'BENCH-1',
+            'aws_sso_profile': 'bench',
+            'aws_region': 'us-east-1',
+            'onepassword_vault': 'bench-vault',
+            'onepassword_item': 'bench-item',
+            'environment': 'staging',
+            'test_email': 'bench@example.com'
+        }, f)
+    return config_path
+
+def parse_importtime(stderr):
+    # Lines look like "import time:  self [us] | cumulative | imported package",
+    # with nested imports indented under the module that triggered them
+    modules = {}
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative)
+        if not name[1:].startswith(' '):
+            total += int(cumulative)
+    return total, modules
+
+def run_command(argv):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + argv, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - start
+    total, modules = parse_importtime(result.stderr)
+    return {'returncode': result.returncode, 'wall': wall, 'import_us': total, 'modules': modules}
+
+def measure(argv, runs, forbidden=()):
+    samples = [run_command(argv) for _ in range(runs)]
+    modules = samples[-1]['modules']
+    slowest = sorted(((name, us) for name, us in modules.items() if '.' not in name), key=lambda item: item[1], reverse=True)
+    return {
+        'wall_ms': statistics.median(sample['wall'] for sample in samples) * 1000,
+        'import_ms': statistics.median(sample['import_us'] for sample in samples) / 1000,
+        'modules': len(modules),
+        'slowest': [[name, us / 1000] for name, us in slowest[:5]],
+        'returncode': samples[-1]['returncode'],
+        'forbidden': sorted(name for name in modules if name.split('.')[0] in forbidden),
+    }
+
+def git_commit():
+    result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True)
+    return result.stdout.strip() or None
+
+def load_history(path):
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure startup time and import cost of the provisioner's commands")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per command; the median is reported")
+    parser.add_argument("--history", metavar="PATH", help="Append the results to PATH (JSONL) and compare with the previous entry")
+    parser.add_argument("--max-import-ms", type=float, help="Exit with an error if an SDK-free command spends longer than this importing")
+    parser.add_argument("--details", action="store_true", help="Show the slowest top-level imports of every command")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='project-factory-startup-') as root:
+        values = {'config': write_config(root), 'inventory': os.path.join(root, 'inventory.db')}
+        results = {}
+        for name, (argv, forbidden) in COMMANDS.items():
+            results[name] = measure(['main.py'] + [arg.format(**values) for arg in argv], max(1, args.runs), forbidden)
+        results['full import'] = measure(FULL_IMPORT, max(1, args.runs))
+
+    history = load_history(args.history)
+    previous = history[-1]['results'] if history else {}
+
+    print(f"{'COMMAND':<16} {'WALL':>9} {'IMPORTS':>9} {'MODULES':>8} {'PREVIOUS':>9}")
+    for name, result in results.items():
+        before = previous.get(name, {}).get('import_ms')
+        before_text = f"{before:.1f}ms" if before is not None else '-'
+        print(f"{name:<16} {result['wall_ms']:>7.1f}ms {result['import_ms']:>7.1f}ms {result['modules']:>8} {before_text:>9}")
+        if args.details:
+            for module, ms in result['slowest']:
+                print(f"{'':>18}{ms:>7.1f}ms  {module}")
+
+    failures = []
+    for name, result in results.items():
+        if result['returncode'] != 0:
+            failures.append(f"{name} exited with status {result['returncode']}")
+        if result['forbidden']:
+            failures.append(f"{name} imported {', '.join(result['forbidden'][:5])}")
+        if args.max_import_ms is not None and name in COMMANDS and result['import_ms'] > args.max_import_ms:
+            failures.append(f"{name} spent {result['import_ms']:.1f}ms importing (limit {args.max_import_ms:.1f}ms)")
+
+    if args.history:
+        with open(args.history, 'a') as f:
+            f.write(json.dumps({
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'commit': git_commit(),
+                'python': platform.python_version(),
+                'results': results,
+            }) + '\n')
+
+    for failure in failures:
+        print(failure)
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
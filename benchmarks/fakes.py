@@ -0,0 +1,767 @@
+import functools
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from botocore import xform_name
+from botocore.awsrequest import AWSResponse
+from botocore.exceptions import ClientError
+
+# Local stand-ins for the services the provisioner talks to, each with a
+# configurable per-call latency and a count of the calls it served. Buckets and
+# tables remember their region; listings and table calls only see their own.
+
+class CallCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def add(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+def _client_error(code, message, operation, status=400):
+    return ClientError({'Error': {'Code': code, 'Message': message}, 'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+
+def _page(items, start, limit):
+    # One page of items from index start; returns the page and whether more follow
+    page = items[start:start + limit]
+    return page, start + limit < len(items)
+
+
+class FakeS3Client:
+    def __init__(self, aws, region):
+        self._aws = aws
+        self._region = region
+
+    def create_bucket(self, Bucket, CreateBucketConfiguration=None):
+        self._aws.call('s3.CreateBucket')
+        region = (CreateBucketConfiguration or {}).get('LocationConstraint', 'us-east-1')
+        with self._aws.lock:
+            if Bucket in self._aws.buckets:
+                raise _client_error('BucketAlreadyOwnedByYou', f"Bucket {Bucket} already exists", 'CreateBucket', 409)
+            self._aws.buckets[Bucket] = {'objects': [], 'tags': [], 'policy': None, 'versioning': None, 'replication': None,
+                                         'region': region, 'created': datetime.now(timezone.utc)}
+        return {'Location': f"/{Bucket}"}
+
+    def _bucket(self, bucket_name, operation):
+        bucket = self._aws.buckets.get(bucket_name)
+        if bucket is None:
+            raise _client_error('NoSuchBucket', 'The specified bucket does not exist', operation, 404)
+        return bucket
+
+    def put_bucket_versioning(self, Bucket, VersioningConfiguration):
+        self._aws.call('s3.PutBucketVersioning')
+        with self._aws.lock:
+            self._bucket(Bucket, 'PutBucketVersioning')['versioning'] = VersioningConfiguration['Status']
+        return {}
+
+    def put_bucket_tagging(self, Bucket, Tagging):
+        self._aws.call('s3.PutBucketTagging')
+        with self._aws.lock:
+            self._bucket(Bucket, 'PutBucketTagging')['tags'] = list(Tagging['TagSet'])
+        return {}
+
+    def get_bucket_tagging(self, Bucket):
+        self._aws.call('s3.GetBucketTagging')
+        with self._aws.lock:
+            tags = list(self._bucket(Bucket, 'GetBucketTagging')['tags'])
+        if not tags:
+            raise _client_error('NoSuchTagSet', 'The TagSet does not exist', 'GetBucketTagging', 404)
+        return {'TagSet': tags}
+
+    def put_bucket_policy(self, Bucket, Policy):
+        self._aws.call('s3.PutBucketPolicy')
+        with self._aws.lock:
+            self._bucket(Bucket, 'PutBucketPolicy')['policy'] = Policy
+        return {}
+
+    def put_bucket_replication(self, Bucket, ReplicationConfiguration):
+        self._aws.call('s3.PutBucketReplication')
+        with self._aws.lock:
+            bucket = self._bucket(Bucket, 'PutBucketReplication')
+            for rule in ReplicationConfiguration['Rules']:
+                self._bucket(rule['Destination']['Bucket'].rpartition(':')[2], 'PutBucketReplication')
+            bucket['replication'] = ReplicationConfiguration
+        return {}
+
+    def get_bucket_versioning(self, Bucket):
+        self._aws.call('s3.GetBucketVersioning')
+        with self._aws.lock:
+            status = self._bucket(Bucket, 'GetBucketVersioning')['versioning']
+        return {'Status': status} if status else {}
+
+    def get_bucket_policy(self, Bucket):
+        self._aws.call('s3.GetBucketPolicy')
+        with self._aws.lock:
+            policy = self._bucket(Bucket, 'GetBucketPolicy')['policy']
+        if policy is None:
+            raise _client_error('NoSuchBucketPolicy', 'The bucket policy does not exist', 'GetBucketPolicy', 404)
+        return {'Policy': policy}
+
+    def list_buckets(self, MaxBuckets=10000, ContinuationToken=None, BucketRegion=None, Prefix=None):
+        # The continuation token is the name of the last bucket returned
+        self._aws.call('s3.ListBuckets')
+        with self._aws.lock:
+            buckets = [{'Name': name, 'CreationDate': bucket['created'], 'BucketRegion': bucket['region']}
+                       for name, bucket in sorted(self._aws.buckets.items())
+                       if BucketRegion in (None, bucket['region']) and name.startswith(Prefix or '') and name > (ContinuationToken or '')]
+        page, more = _page(buckets, 0, MaxBuckets)
+        return dict({'Buckets': page, 'Owner': {'ID': 'bench'}}, **({'ContinuationToken': page[-1]['Name']} if more else {}))
+
+    def list_object_versions(self, Bucket, MaxKeys=1000, KeyMarker=None, VersionIdMarker=None):
+        # Versions are listed in (key, version) order, so a listing resumes
+        # correctly after its marker even while earlier versions are deleted
+        self._aws.call('s3.ListObjectVersions')
+        marker = (KeyMarker or '', VersionIdMarker or '')
+        with self._aws.lock:
+            versions = sorted((obj for obj in self._bucket(Bucket, 'ListObjectVersions')['objects']
+                               if (obj['Key'], obj['VersionId']) > marker), key=lambda obj: (obj['Key'], obj['VersionId']))
+        page, more = _page(versions, 0, MaxKeys)
+        response = {'Versions': page, 'DeleteMarkers': [], 'IsTruncated': more}
+        if more:
+            response.update(NextKeyMarker=page[-1]['Key'], NextVersionIdMarker=page[-1]['VersionId'])
+        return response
+
+    def delete_objects(self, Bucket, Delete):
+        self._aws.call('s3.DeleteObjects')
+        with self._aws.lock:
+            bucket = self._bucket(Bucket, 'DeleteObjects')
+            deleted = {(obj['Key'], obj['VersionId']) for obj in Delete['Objects']}
+            bucket['objects'] = [obj for obj in bucket['objects'] if (obj['Key'], obj['VersionId']) not in deleted]
+        return {} if Delete.get('Quiet') else {'Deleted': Delete['Objects']}
+
+    def delete_bucket(self, Bucket):
+        self._aws.call('s3.DeleteBucket')
+        with self._aws.lock:
+            if self._bucket(Bucket, 'DeleteBucket')['objects']:
+                raise _client_error('BucketNotEmpty', 'The bucket you tried to delete is not empty', 'DeleteBucket', 409)
+            del self._aws.buckets[Bucket]
+        return {}
+
+
+class FakeDynamoDBClient:
+    # Tables take waiter_delay to become active or to disappear. DescribeTable
+    # blocks until a transition is over, so botocore's waiters succeed on their
+    # first poll instead of sleeping their 20-second polling interval.
+    def __init__(self, aws, region):
+        self._aws = aws
+        self._region = region
+
+    def _table(self, table_name):
+        table = self._aws.tables.get(table_name)
+        return table if table is not None and table['region'] == self._region else None
+
+    def _not_found(self, table_name, operation):
+        return _client_error('ResourceNotFoundException', f"Requested resource not found: Table: {table_name} not found", operation)
+
+    def create_table(self, TableName, **kwargs):
+        self._aws.call('dynamodb.CreateTable')
+        with self._aws.lock:
+            if TableName in self._aws.tables or TableName in self._aws.deleting:
+                raise _client_error('ResourceInUseException', f"Table already exists: {TableName}", 'CreateTable')
+            self._aws.tables[TableName] = dict(kwargs, TableStatus='CREATING', CreationDateTime=datetime.now(timezone.utc),
+                                               region=self._region, ready_at=time.monotonic() + self._aws.waiter_delay)
+        return {'TableDescription': {'TableName': TableName, 'TableStatus': 'CREATING'}}
+
+    def delete_table(self, TableName):
+        self._aws.call('dynamodb.DeleteTable')
+        with self._aws.lock:
+            if self._table(TableName) is None:
+                raise self._not_found(TableName, 'DeleteTable')
+            del self._aws.tables[TableName]
+            self._aws.deleting[TableName] = time.monotonic() + self._aws.waiter_delay
+        return {'TableDescription': {'TableName': TableName, 'TableStatus': 'DELETING'}}
+
+    def describe_table(self, TableName):
+        self._aws.call('dynamodb.DescribeTable')
+        with self._aws.lock:
+            table = self._table(TableName)
+            wait_until = table['ready_at'] if table is not None else self._aws.deleting.get(TableName, 0)
+        delay = wait_until - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        with self._aws.lock:
+            self._aws.deleting.pop(TableName, None)
+            table = self._table(TableName)
+            if table is None:
+                raise self._not_found(TableName, 'DescribeTable')
+            table['TableStatus'] = 'ACTIVE'
+            description = {key: value for key, value in table.items() if key not in ('region', 'ready_at', 'items')}
+            return {'Table': dict(description, TableName=TableName)}
+
+    def list_tables(self, ExclusiveStartTableName=None, Limit=100):
+        self._aws.call('dynamodb.ListTables')
+        with self._aws.lock:
+            names = sorted(name for name, table in self._aws.tables.items()
+                           if table['region'] == self._region and name > (ExclusiveStartTableName or ''))
+        page, more = _page(names, 0, Limit)
+        return dict({'TableNames': page}, **({'LastEvaluatedTableName': page[-1]} if more else {}))
+
+    def scan(self, TableName, **kwargs):
+        # Only held locks are ever stored, as {'LockID': ..., 'Info': ...} items
+        self._aws.call('dynamodb.Scan')
+        with self._aws.lock:
+            table = self._table(TableName)
+            if table is None:
+                raise self._not_found(TableName, 'Scan')
+            items = [{'LockID': {'S': item['LockID']}} for item in table.get('items', [])]
+            return {'Items': items, 'Count': len(items), 'ScannedCount': len(items)}
+
+
+class FakeTaggingClient:
+    # Resource Groups Tagging API: every tagged bucket of the region, with its
+    # tags; the pagination token is the offset of the next page
+    def __init__(self, aws, region):
+        self._aws = aws
+        self._region = region
+
+    def get_resources(self, ResourceTypeFilters=None, ResourcesPerPage=100, PaginationToken=''):
+        self._aws.call('tagging.GetResources')
+        with self._aws.lock:
+            buckets = [{'ResourceARN': f"arn:aws:s3:::{name}", 'Tags': list(bucket['tags'])}
+                       for name, bucket in sorted(self._aws.buckets.items()) if bucket['tags'] and bucket['region'] == self._region]
+        start = int(PaginationToken or 0)
+        page, more = _page(buckets, start, ResourcesPerPage)
+        return {'ResourceTagMappingList': page, 'PaginationToken': str(start + ResourcesPerPage) if more else ''}
+
+
+class FakeSTSClient:
+    def __init__(self, aws, region):
+        self._aws = aws
+
+    def get_caller_identity(self):
+        self._aws.call('sts.GetCallerIdentity')
+        return {'Account': '123456789012', 'UserId': 'BENCH', 'Arn': 'arn:aws:sts::123456789012:assumed-role/bench/bench'}
+
+
+def _keep_params(params, context, **kwargs):
+    # The caller's parameters, before botocore's own handlers add to them
+    context['fake_aws_params'] = dict(params)
+
+
+class FakeAWS:
+    # In-process S3, DynamoDB, tagging and STS APIs holding buckets, objects and
+    # tables in memory. They sit behind real botocore clients: attach() answers a
+    # client's calls from memory once botocore has validated and serialized them,
+    # so operation models, parameter validation, paginators, waiters, modeled
+    # exceptions and event hooks all run as they do against AWS.
+    SERVICES = {'s3': FakeS3Client, 'dynamodb': FakeDynamoDBClient, 'resourcegroupstaggingapi': FakeTaggingClient, 'sts': FakeSTSClient}
+
+    def __init__(self, latency=0.0, waiter_delay=0.0):
+        self.latency = latency
+        self.waiter_delay = waiter_delay
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.tables = {}
+        # Deleted tables, until they have disappeared
+        self.deleting = {}
+        self.calls = CallCounter()
+        self._clients = {}
+
+    def call(self, name):
+        self.calls.add(name)
+        if self.latency:
+            time.sleep(self.latency)
+
+    def client(self, service_name, region='us-east-1'):
+        with self.lock:
+            key = (service_name, region)
+            if key not in self._clients:
+                self._clients[key] = self.SERVICES[service_name](self, region)
+            return self._clients[key]
+
+    def attach(self, client):
+        # Returns the botocore client, whose calls are now served by the fake
+        backend = self.client(client.meta.service_model.service_name, client.meta.region_name)
+        client.meta.events.register('provide-client-params', _keep_params, unique_id='fake-aws-params')
+        client.meta.events.register('before-call', functools.partial(self._serve, backend), unique_id='fake-aws-serve')
+        return client
+
+    def _serve(self, backend, model, context, **kwargs):
+        # Returning a response from before-call skips the HTTP request; errors
+        # are returned the same way, so botocore raises its modeled exceptions
+        operation = getattr(backend, xform_name(model.name), None)
+        if operation is None:
+            raise NotImplementedError(f"{model.service_model.service_name}.{model.name} is not implemented by the fake AWS")
+        try:
+            return AWSResponse(None, 200, {}, None), operation(**context['fake_aws_params'])
+        except ClientError as e:
+            return AWSResponse(None, e.response['ResponseMetadata']['HTTPStatusCode'], {}, None), e.response
+
+    def put_objects(self, bucket_name, count):
+        with self.lock:
+            bucket = self.buckets[bucket_name]
+            for index in range(count):
+                bucket['objects'].append({'Key': 'terraform.tfstate', 'VersionId': f"v{len(bucket['objects'])}-{index}"})
+
+
+ZERO_SHA = '0' * 40
+
+
+class FakeGitHub:
+    # Serves the subset of the GitHub REST API that PyGithub uses here. Each
+    # repository is backed by a real bare git repository, so blobs, trees,
+    # commits and refs created through the API can be fetched and pushed with git.
+    def __init__(self, root, owner='bench-user', latency=0.0, rate_limit=5000, secondary_writes_per_minute=0,
+                 oauth_scopes='repo, delete_repo'):
+        self.root = root
+        self.owner = owner
+        self.oauth_scopes = oauth_scopes
+        self.latency = latency
+        self.calls = CallCounter()
+        # Primary limit per hour, and the secondary limit on content-creating requests
+        self.rate_limit = rate_limit
+        self.secondary_writes_per_minute = secondary_writes_per_minute
+        self._rate_remaining = rate_limit
+        self._rate_reset = int(time.time()) + 3600
+        self._recent_writes = []
+        self._lock = threading.Lock()
+        self._repo_locks = {}
+        self._repos = {}
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        os.makedirs(self.root, exist_ok=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-github', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    @property
+    def repositories(self):
+        with self._lock:
+            return sorted(self._repos)
+
+    # Git plumbing on the backing repositories
+
+    def _git(self, git_dir, *args, input=None, env=None):
+        result = subprocess.run(
+            ['git', f"--git-dir={git_dir}"] + list(args),
+            input=input, capture_output=True, text=True, check=True,
+            env=dict(os.environ, **(env or {}))
+        )
+        return result.stdout.strip()
+
+    def _write_blob(self, git_dir, content):
+        data = content.encode('utf-8')
+        store = b'blob %d\0' % len(data) + data
+        sha = hashlib.sha1(store).hexdigest()
+        path = os.path.join(git_dir, 'objects', sha[:2], sha[2:])
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(zlib.compress(store))
+            os.replace(tmp_path, path)
+        return sha
+
+    def _write_tree(self, git_dir, base_tree, entries):
+        # entries are (mode, sha, path); a mode of '0' removes the path
+        with tempfile.NamedTemporaryFile(dir=git_dir, suffix='.index', delete=False) as f:
+            index_file = f.name
+        os.remove(index_file)
+        try:
+            env = {'GIT_INDEX_FILE': index_file}
+            if base_tree:
+                self._git(git_dir, 'read-tree', base_tree, env=env)
+            index_info = ''.join(f"{mode} {sha}\t{path}\n" for mode, sha, path in entries)
+            self._git(git_dir, 'update-index', '--index-info', input=index_info, env=env)
+            return self._git(git_dir, 'write-tree', env=env)
+        finally:
+            if os.path.exists(index_file):
+                os.remove(index_file)
+
+    def _commit_tree(self, git_dir, tree, parents, message):
+        args = ['commit-tree', tree]
+        for parent in parents:
+            args += ['-p', parent]
+        return self._git(git_dir, *args, '-m', message, env={
+            'GIT_AUTHOR_NAME': self.owner, 'GIT_AUTHOR_EMAIL': f"{self.owner}@example.com",
+            'GIT_COMMITTER_NAME': self.owner, 'GIT_COMMITTER_EMAIL': f"{self.owner}@example.com",
+        })
+
+    def _resolve_ref(self, git_dir, ref):
+        result = subprocess.run(['git', f"--git-dir={git_dir}", 'rev-parse', '--verify', '--quiet', f"refs/{ref}"],
+                                capture_output=True, text=True)
+        return result.stdout.strip() if result.returncode == 0 else None
+
+    # JSON representations
+
+    def _repo_url(self, name):
+        return f"{self.url}/repos/{self.owner}/{name}"
+
+    def _repo_json(self, name):
+        repo = self._repos[name]
+        return {
+            'id': repo['id'],
+            'name': name,
+            'full_name': f"{self.owner}/{name}",
+            'owner': {'login': self.owner, 'url': f"{self.url}/users/{self.owner}"},
+            'private': True,
+            'url': self._repo_url(name),
+            'html_url': f"{self.url}/{self.owner}/{name}",
+            'clone_url': repo['git_dir'],
+            'default_branch': repo['default_branch'],
+        }
+
+    def _ref_json(self, name, ref, sha):
+        return {
+            'ref': f"refs/{ref}",
+            'node_id': ref,
+            'url': f"{self._repo_url(name)}/git/refs/{ref}",
+            'object': {'sha': sha, 'type': 'commit', 'url': f"{self._repo_url(name)}/git/commits/{sha}"},
+        }
+
+    def _commit_json(self, name, sha):
+        git_dir = self._repos[name]['git_dir']
+        header, _, message = self._git(git_dir, 'cat-file', 'commit', sha).partition('\n\n')
+        fields = [line.split(' ', 1) for line in header.splitlines()]
+        tree = next(value for key, value in fields if key == 'tree')
+        parents = [value for key, value in fields if key == 'parent']
+        return {
+            'sha': sha,
+            'url': f"{self._repo_url(name)}/git/commits/{sha}",
+            'message': message,
+            'tree': {'sha': tree, 'url': f"{self._repo_url(name)}/git/trees/{tree}"},
+            'parents': [{'sha': parent, 'url': f"{self._repo_url(name)}/git/commits/{parent}"} for parent in parents],
+        }
+
+    def _tree_json(self, name, sha, recursive):
+        git_dir = self._repos[name]['git_dir']
+        args = ['ls-tree', '-r', sha] if recursive else ['ls-tree', sha]
+        elements = []
+        for line in self._git(git_dir, *args).splitlines():
+            info, path = line.split('\t', 1)
+            mode, kind, object_sha = info.split()
+            elements.append({'path': path, 'mode': mode, 'type': kind, 'sha': object_sha,
+                             'url': f"{self._repo_url(name)}/git/{kind}s/{object_sha}"})
+        return {'sha': sha, 'url': f"{self._repo_url(name)}/git/trees/{sha}", 'tree': elements, 'truncated': False}
+
+    # API operations, each returning (status, body)
+
+    def _repo_lock(self, name):
+        with self._lock:
+            return self._repo_locks.setdefault(name, threading.Lock())
+
+    def get_user(self, body, query):
+        return 200, {'login': self.owner, 'url': f"{self.url}/users/{self.owner}", 'type': 'User'}
+
+    def create_repo(self, body, query):
+        name = body['name']
+        git_dir = os.path.join(self.root, f"{name}.git")
+        with self._repo_lock(name):
+            with self._lock:
+                if name in self._repos:
+                    return 422, {'message': 'Repository creation failed.',
+                                 'errors': [{'resource': 'Repository', 'field': 'name', 'message': 'name already exists on this account'}]}
+            subprocess.run(['git', 'init', '--quiet', '--bare', git_dir], check=True)
+            default_branch = 'main'
+            if body.get('auto_init'):
+                readme = self._write_blob(git_dir, f"# {name}\n")
+                tree = self._write_tree(git_dir, None, [('100644', readme, 'README.md')])
+                commit = self._commit_tree(git_dir, tree, [], 'Initial commit')
+                self._git(git_dir, 'update-ref', f"refs/heads/{default_branch}", commit)
+            self._git(git_dir, 'symbolic-ref', 'HEAD', f"refs/heads/{default_branch}")
+            with self._lock:
+                self._repos[name] = {'id': len(self._repos) + 1, 'git_dir': git_dir, 'default_branch': default_branch}
+                return 201, self._repo_json(name)
+
+    def get_repo(self, body, query, owner, repo):
+        with self._lock:
+            if owner != self.owner or repo not in self._repos:
+                return 404, {'message': 'Not Found'}
+            return 200, self._repo_json(repo)
+
+    def edit_repo(self, body, query, owner, repo):
+        with self._repo_lock(repo):
+            if repo not in self._repos:
+                return 404, {'message': 'Not Found'}
+            git_dir = self._repos[repo]['git_dir']
+            if 'default_branch' in body:
+                if not self._resolve_ref(git_dir, f"heads/{body['default_branch']}"):
+                    return 422, {'message': 'Validation Failed'}
+                self._git(git_dir, 'symbolic-ref', 'HEAD', f"refs/heads/{body['default_branch']}")
+                self._repos[repo]['default_branch'] = body['default_branch']
+            with self._lock:
+                return 200, self._repo_json(repo)
+
+    def delete_repo(self, body, query, owner, repo):
+        with self._repo_lock(repo):
+            with self._lock:
+                entry = self._repos.pop(repo, None)
+            if entry is None:
+                return 404, {'message': 'Not Found'}
+            shutil.rmtree(entry['git_dir'], ignore_errors=True)
+            return 204, None
+
+    def get_ref(self, body, query, owner, repo, ref):
+        with self._repo_lock(repo):
+            if repo not in self._repos:
+                return 404, {'message': 'Not Found'}
+            sha = self._resolve_ref(self._repos[repo]['git_dir'], ref)
+            if not sha:
+                return 404, {'message': 'Not Found'}
+            return 200, self._ref_json(repo, ref, sha)
+
+    def create_ref(self, body, query, owner, repo):
+        ref = body['ref'][len('refs/'):]
+        with self._repo_lock(repo):
+            if repo not in self._repos:
+                return 404, {'message': 'Not Found'}
+            git_dir = self._repos[repo]['git_dir']
+            if self._resolve_ref(git_dir, ref):
+                return 422, {'message': 'Reference already exists'}
+            self._git(git_dir, 'update-ref', f"refs/{ref}", body['sha'])
+            return 201, self._ref_json(repo, ref, body['sha'])
+
+    def update_ref(self, body, query, owner, repo, ref):
+        with self._repo_lock(repo):
+            if repo not in self._repos:
+                return 404, {'message': 'Not Found'}
+            git_dir = self._repos[repo]['git_dir']
+            current = self._resolve_ref(git_dir, ref)
+            if not current:
+                return 422, {'message': 'Reference does not exist'}
+            if not body.get('force'):
+                is_ancestor = subprocess.run(['git', f"--git-dir={git_dir}", 'merge-base', '--is-ancestor', current, body['sha']])
+                if is_ancestor.returncode != 0:
+                    return 422, {'message': 'Update is not a fast forward'}
+            self._git(git_dir, 'update-ref', f"refs/{ref}", body['sha'])
+            return 200, self._ref_json(repo, ref, body['sha'])
+
+    def delete_ref(self, body, query, owner, repo, ref):
+        with self._repo_lock(repo):
+            if repo not in self._repos:
+                return 404, {'message': 'Not Found'}
+            git_dir = self._repos[repo]['git_dir']
+            if not self._resolve_ref(git_dir, ref):
+                return 422, {'message': 'Reference does not exist'}
+            self._git(git_dir, 'update-ref', '-d', f"refs/{ref}")
+            return 204, None
+
+    def list_branches(self, body, query, owner, repo):
+        with self._repo_lock(repo):
+            if repo not in self._repos:
+                return 404, {'message': 'Not Found'}
+            heads = self._git(self._repos[repo]['git_dir'], 'for-each-ref', '--format=%(refname:strip=2) %(objectname)', 'refs/heads')
+            return 200, [{'name': branch, 'commit': {'sha': sha, 'url': f"{self._repo_url(repo)}/commits/{sha}"}, 'protected': False}
+                         for branch, sha in (line.split() for line in heads.splitlines())]
+
+    def get_commit(self, body, query, owner, repo, sha):
+        with self._repo_lock(repo):
+            if repo not in self._repos:
+                return 404, {'message': 'Not Found'}
+            return 200, self._commit_json(repo, sha)
+
+    def create_commit(self, body, query, owner, repo):
+        with self._repo_lock(repo):
+            if repo not in self._repos:
+                return 404, {'message': 'Not Found'}
+            sha = self._commit_tree(self._repos[repo]['git_dir'], body['tree'], body.get('parents', []), body['message'])
+            return 201, self._commit_json(repo, sha)
+
+    def get_tree(self, body, query, owner, repo, sha):
+        with self._repo_lock(repo):
+            if repo not in self._repos:
+                return 404, {'message': 'Not Found'}
+            return 200, self._tree_json(repo, sha, query.get('recursive') not in (None, '0', 'false'))
+
+    def create_tree(self, body, query, owner, repo):
+        with self._repo_lock(repo):
+            if repo not in self._repos:
+                return 404, {'message': 'Not Found'}
+            git_dir = self._repos[repo]['git_dir']
+            entries = []
+            for element in body['tree']:
+                if 'content' in element:
+                    entries.append((element['mode'], self._write_blob(git_dir, element['content']), element['path']))
+                elif element.get('sha'):
+                    entries.append((element['mode'], element['sha'], element['path']))
+                else:
+                    entries.append(('0', ZERO_SHA, element['path']))
+            sha = self._write_tree(git_dir, body.get('base_tree'), entries)
+            return 201, self._tree_json(repo, sha, True)
+
+    _REPO = r'/repos/(?P<owner>[^/]+)/(?P<repo>[^/]+)'
+    ROUTES = [
+        ('GET', r'/user', 'get_user'),
+        ('POST', r'/user/repos', 'create_repo'),
+        ('GET', _REPO, 'get_repo'),
+        ('PATCH', _REPO, 'edit_repo'),
+        ('DELETE', _REPO, 'delete_repo'),
+        ('GET', _REPO + r'/branches', 'list_branches'),
+        ('POST', _REPO + r'/git/refs', 'create_ref'),
+        ('GET', _REPO + r'/git/refs?/(?P<ref>.+)', 'get_ref'),
+        ('PATCH', _REPO + r'/git/refs?/(?P<ref>.+)', 'update_ref'),
+        ('DELETE', _REPO + r'/git/refs?/(?P<ref>.+)', 'delete_ref'),
+        ('GET', _REPO + r'/git/commits/(?P<sha>[0-9a-f]+)', 'get_commit'),
+        ('POST', _REPO + r'/git/commits', 'create_commit'),
+        ('GET', _REPO + r'/git/trees/(?P<sha>[0-9a-f]+)', 'get_tree'),
+        ('POST', _REPO + r'/git/trees', 'create_tree'),
+    ]
+
+    def _rate_limit_headers(self):
+        return {
+            'X-RateLimit-Limit': str(self.rate_limit),
+            'X-RateLimit-Remaining': str(self._rate_remaining),
+            'X-RateLimit-Reset': str(self._rate_reset),
+            'X-RateLimit-Used': str(self.rate_limit - self._rate_remaining),
+        }
+
+    def _check_rate_limits(self, method):
+        # Returns a rate-limit error response, or None when the request may proceed
+        with self._lock:
+            now = time.time()
+            if now >= self._rate_reset:
+                self._rate_remaining = self.rate_limit
+                self._rate_reset = int(now) + 3600
+            if self._rate_remaining == 0:
+                return 403, {'message': f"API rate limit exceeded for user {self.owner}."}, self._rate_limit_headers()
+            if method != 'GET' and self.secondary_writes_per_minute:
+                self._recent_writes = [t for t in self._recent_writes if t > now - 60]
+                if len(self._recent_writes) >= self.secondary_writes_per_minute:
+                    retry_after = int(self._recent_writes[0] + 60 - now) + 1
+                    headers = dict(self._rate_limit_headers(), **{'Retry-After': str(retry_after)})
+                    return 403, {'message': 'You have exceeded a secondary rate limit. Please wait a few minutes before you try again.'}, headers
+                self._recent_writes.append(now)
+            self._rate_remaining -= 1
+            return None
+
+    def dispatch(self, method, path, query, body, if_none_match=None):
+        # Returns (status, body, headers)
+        for route_method, pattern, operation in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if route_method == method and match:
+                self.calls.add(f"github.{operation}")
+                if self.latency:
+                    time.sleep(self.latency)
+                limited = self._check_rate_limits(method)
+                if limited:
+                    self.calls.add('github.rate_limited')
+                    return limited
+                status, payload = getattr(self, operation)(body, query, **match.groupdict())
+                headers = {}
+                if method == 'GET' and status == 200:
+                    headers['ETag'] = f'"{hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()}"'
+                    if if_none_match == headers['ETag']:
+                        # Conditional requests answered with 304 do not count against the limit
+                        self.calls.add('github.not_modified')
+                        with self._lock:
+                            self._rate_remaining += 1
+                        status, payload = 304, None
+                with self._lock:
+                    headers.update(self._rate_limit_headers())
+                if self.oauth_scopes is not None:
+                    headers['X-OAuth-Scopes'] = self.oauth_scopes
+                return status, payload, headers
+        self.calls.add('github.unsupported')
+        return 404, {'message': f"Not Found: {method} {path} is not supported by the fake"}, {}
+
+    def _handler_class(self):
+        github = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # HTTP/1.1 keeps PyGithub's pooled connections alive between requests
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _handle(self):
+                path, _, query_string = self.path.partition('?')
+                query = dict(part.partition('=')[::2] for part in query_string.split('&') if part)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else {}
+                try:
+                    status, payload, headers = github.dispatch(self.command, path, query, body, self.headers.get('If-None-Match'))
+                except subprocess.CalledProcessError as e:
+                    status, payload, headers = 500, {'message': f"git failed: {e.stderr}"}, {}
+
+                data = b'' if payload is None else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+FAKE_OP_SCRIPT = """#!{python}
+import json, os, sys, time
+time.sleep(float(os.environ.get('FAKE_OP_LATENCY', '0')))
+with open(os.environ['FAKE_OP_LOG'], 'a') as f:
+    f.write(' '.join(sys.argv[1:]) + '\\n')
+print(json.dumps({{'id': 'bench', 'fields': [
+    {{'id': 'github_token', 'label': 'github_token', 'value': 'bench-token'}},
+]}}))
+"""
+
+class FakeOnePassword:
+    # Puts an `op` executable first on PATH that answers every `op item get`
+    # with the same item and logs each invocation
+    def __init__(self, root, latency=0.0):
+        self.bin_dir = os.path.join(root, 'bin')
+        self.log_path = os.path.join(root, 'op-calls.log')
+        self.latency = latency
+
+    def install(self):
+        os.makedirs(self.bin_dir, exist_ok=True)
+        op_path = os.path.join(self.bin_dir, 'op')
+        with open(op_path, 'w') as f:
+            f.write(FAKE_OP_SCRIPT.format(python=sys.executable))
+        os.chmod(op_path, 0o755)
+        os.environ['PATH'] = self.bin_dir + os.pathsep + os.environ.get('PATH', '')
+        os.environ['FAKE_OP_LATENCY'] = str(self.latency)
+        os.environ['FAKE_OP_LOG'] = self.log_path
+        return self
+
+    def call_count(self):
+        try:
+            with open(self.log_path) as f:
+                return sum(1 for _ in f)
+        except FileNotFoundError:
+            return 0
+
+    def reset(self):
+        if os.path.exists(self.log_path):
+            os.remove(self.log_path)
@@ -1,12 +1,23 @@
 import argparse
 import os
 import json
+import re
 import shutil
-from src.aws_utils import setup_terraform_backend, destroy_terraform_backend
-from src.github_utils import create_github_repo, commit_and_push, create_github_workflows, delete_github_repo, init_local_repo_and_push
-from src.terraform_utils import create_terraform_template, create_tfvars_files
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from src.defaults import DEFAULT_MAX_POOL_CONNECTIONS, DEFAULT_GITHUB_POOL_SIZE, DEFAULT_GITHUB_WRITES_PER_MINUTE, DEFAULT_REAP_WORKERS, DEFAULT_REAP_MIN_AGE_HOURS, DEFAULT_SERVER_WORKERS, DEFAULT_MAX_QUEUE, DEFAULT_LISTEN, STATE_LOCKING_MODES, S3_LOCKING_MIN_TERRAFORM_VERSION
 from src.secrets_manager import get_secrets
-from github import GithubException
+from src.batch_utils import iter_manifest, run_manifest, print_manifest_summary
+from src.task_graph import SUCCEEDED, run_task_graph, print_task_timings
+from src.journal import journal_path, load_journal, record_step, remove_journal
+from src.tracing import span, trace_project, submit_in_context, write_trace, print_trace_summary
+from src.inventory import S3_BUCKET, DYNAMODB_TABLE, GITHUB_REPO, configure_inventory, record_resource, remove_resources, lookup_resources, lookup_resource_names, print_inventory
+from src.regions import REGION_PATTERN, backend_regions, environment_region, state_region, replica_regions
+
+# boto3, PyGithub and Jinja2 are only imported by the actions that use them
+# (src.aws_utils, src.github_utils, src.template_utils), so validating a config,
+# rendering locally and querying the inventory start without loading the SDKs.
+CLOUD_ACTIONS = ('provision', 'destroy', 'sync')
 
 def load_config(config_path):
     with open(config_path, 'r') as f:
@@ -28,20 +39,160 @@ def validate_config(config):
     if missing_keys:
         raise ValueError(f"Missing required keys in config.json: {', '.join(missing_keys)}")
 
+    environments = config['environment']
+    if isinstance(environments, str):
+        environments = [environments]
+    if not isinstance(environments, list) or not environments or not all(isinstance(e, str) and e for e in environments):
+        raise ValueError("'environment' must be an environment name or a non-empty list of environment names")
+    if len(set(environments)) != len(environments):
+        raise ValueError("'environment' lists the same environment more than once")
+
+    # Optional settings of the generated CI workflows
+    terraform_version = config.get('terraform_version')
+    if terraform_version not in (None, 'latest') and not (isinstance(terraform_version, str) and re.fullmatch(r'\d+\.\d+\.\d+(-[0-9A-Za-z.]+)?', terraform_version)):
+        raise ValueError("'terraform_version' must be an exact version such as '1.11.4', or 'latest'")
+    for key in ('terraform_cache', 'skip_empty_apply'):
+        if not isinstance(config.get(key, True), bool):
+            raise ValueError(f"'{key}' must be true or false")
+    if config.get('state_locking', 'dynamodb') not in STATE_LOCKING_MODES:
+        raise ValueError(f"'state_locking' must be one of {', '.join(STATE_LOCKING_MODES)}")
+    if config.get('state_locking') == 's3' and terraform_version not in (None, 'latest'):
+        if tuple(int(part) for part in terraform_version.split('-')[0].split('.')[:2]) < S3_LOCKING_MIN_TERRAFORM_VERSION:
+            raise ValueError(f"S3 native state locking needs Terraform {'.'.join(map(str, S3_LOCKING_MIN_TERRAFORM_VERSION))} or later, not {terraform_version}")
+
+    # Optional backend regions besides aws_region, and where each environment runs
+    regions = config.get('backend_regions', [])
+    if not isinstance(regions, list) or not all(isinstance(region, str) and REGION_PATTERN.fullmatch(region) for region in regions):
+        raise ValueError("'backend_regions' must be a list of AWS regions such as 'eu-west-1'")
+    environment_regions = config.get('environment_regions', {})
+    if not isinstance(environment_regions, dict) or not all(isinstance(region, str) and REGION_PATTERN.fullmatch(region) for region in environment_regions.values()):
+        raise ValueError("'environment_regions' must map environment names to AWS regions")
+    unknown = sorted(set(environment_regions) - set(environments))
+    if unknown:
+        raise ValueError(f"'environment_regions' names environments that are not configured: {', '.join(unknown)}")
+    role = config.get('backend_replication_role')
+    if role is not None:
+        if not (isinstance(role, str) and role.startswith('arn:aws')):
+            raise ValueError("'backend_replication_role' must be the ARN of the IAM role S3 replicates with")
+        if len(backend_regions(config)) < 2:
+            raise ValueError("'backend_replication_role' needs at least one region in 'backend_regions' besides 'aws_region'")
+
+# 'environment' is either one environment or a list of them, all set up in the
+# same run and sharing one GitHub repository with a branch per environment
+def config_environments(config):
+    environments = config['environment']
+    return [environments] if isinstance(environments, str) else list(environments)
+
+def describe_environments(environments):
+    if len(environments) == 1:
+        return f"environment '{environments[0]}'"
+    return f"environments {', '.join(repr(environment) for environment in environments)}"
+
+def project_directory(config, environment):
+    # A single environment is checked out in the project directory itself;
+    # several each get their own subdirectory
+    project_dir = os.path.join(config['working_dir'], config['project_name'])
+    if len(config_environments(config)) == 1:
+        return project_dir
+    return os.path.join(project_dir, environment)
+
+def uses_s3_locking(config):
+    return config.get('state_locking') == 's3'
+
+def lock_table(config, environment):
+    # Backends with S3 native locking have no lock table
+    if uses_s3_locking(config):
+        return None
+    return f"{config['project_name']}-{environment}-terraform-locks"
+
+def render_context(config, environment, s3_bucket=None):
+    from src.terraform_utils import resolve_terraform_version
+    return {
+        'project_name': config['project_name'],
+        'aws_region': environment_region(config, environment),
+        'backend_region': state_region(config, environment),
+        'environment': environment,
+        's3_bucket': s3_bucket,
+        'dynamodb_table': lock_table(config, environment),
+        'jira_ticket': config['jira_ticket'],
+        'test_email': config['test_email'],
+        'terraform_version': resolve_terraform_version(config.get('terraform_version')),
+        'terraform_cache': config.get('terraform_cache', True),
+        'skip_empty_apply': config.get('skip_empty_apply', True)
+    }
+
+def recorded_bucket(config, environment):
+    # The bucket name has a random suffix, so it is taken from the inventory or the journal.
+    # Of the environment's regional buckets, the state is in the one nearest to it.
+    rows = lookup_resources(config['project_name'], environment, S3_BUCKET)
+    recorded_buckets = [row['resource_name'] for row in rows if row['region'] in (state_region(config, environment), None)]
+    if not recorded_buckets and len(backend_regions(config)) == 1:
+        recorded_buckets = [row['resource_name'] for row in rows]
+    if recorded_buckets:
+        return recorded_buckets[0]
+    return load_journal(journal_path(config['working_dir'], config['project_name'], environment)).get('s3_bucket')
+
 def destroy_resources(config, secrets):
-    print(f"Destroying resources for project '{config['project_name']}' in environment '{config['environment']}'...")
-
-    # Destroy AWS resources
-    aws_success = destroy_terraform_backend(
-        config['project_name'],
-        config['aws_region'],
-        config['aws_sso_profile'],
-        config['environment']
-    )
+    from src.aws_utils import destroy_terraform_backend
+    from src.github_utils import delete_github_repo, delete_github_branches, list_github_branches
+    from github import GithubException, UnknownObjectException
+
+    project_name = config['project_name']
+    environments = config_environments(config)
+    print(f"Destroying resources for project '{project_name}' in {describe_environments(environments)}...")
 
-    # Delete GitHub repository
+    # Destroy every environment's AWS backend concurrently, in all of its
+    # regions, using the buckets recorded in the inventory when there are any
+    def destroy_backend(environment):
+        recorded = lookup_resources(project_name, environment)
+        recorded_buckets = {}
+        for row in recorded:
+            if row['resource_type'] == S3_BUCKET:
+                recorded_buckets.setdefault(row['region'] or config['aws_region'], []).append(row['resource_name'])
+        recorded_tables = [row for row in recorded if row['resource_type'] == DYNAMODB_TABLE]
+        # A table is only deleted if the backend still has one: a project that
+        # was migrated to S3 locking may be destroyed with either setting
+        has_lock_table = not uses_s3_locking(config) or bool(recorded_tables)
+        region = (recorded_tables[0]['region'] if recorded_tables else None) or state_region(config, environment)
+        with span('destroy_backend', 'step', environment=environment):
+            success = destroy_terraform_backend(
+                project_name,
+                region,
+                config['aws_sso_profile'],
+                environment,
+                bucket_names=recorded_buckets,
+                delete_lock_table=has_lock_table,
+                replica_regions=[other for other in dict.fromkeys(backend_regions(config) + list(recorded_buckets)) if other != region]
+            )
+        if success:
+            remove_resources(project_name, environment, (S3_BUCKET, DYNAMODB_TABLE))
+        return success
+
+    with ThreadPoolExecutor(max_workers=len(environments)) as executor:
+        futures = [submit_in_context(executor, destroy_backend, environment) for environment in environments]
+        aws_success = all([future.result() for future in futures])
+
+    # The repository is shared by all of the project's environments: while
+    # others still use it, only the destroyed environments' branches go. The
+    # inventory only knows the environments provisioned with it, so the
+    # repository's branches decide; recorded environments are preferred as the
+    # new default branch.
+    recorded = {row['environment'] for row in lookup_resources(project_name, resource_type=GITHUB_REPO)} - set(environments)
+    remaining = []
     try:
-        github_success = delete_github_repo(config['project_name'], secrets['github_token'])
+        with span('delete_repo', 'step'):
+            try:
+                branches = list_github_branches(project_name, secrets['github_token'])
+            except UnknownObjectException:
+                branches = []
+            remaining = sorted(set(branches) - set(environments), key=lambda branch: (branch not in recorded, branch))
+            if remaining:
+                github_success = delete_github_branches(project_name, secrets['github_token'], environments, remaining[0])
+            else:
+                github_success = delete_github_repo(project_name, secrets['github_token'])
+        if github_success:
+            for environment in environments:
+                remove_resources(project_name, environment, (GITHUB_REPO,))
     except GithubException as e:
         print(f"Error deleting GitHub repository: {e}")
         github_success = False
@@ -49,24 +200,31 @@ def destroy_resources(config, secrets):
         print(f"Unexpected error occurred while deleting GitHub repository: {e}")
         github_success = False
 
-    # Remove local project folder
-    local_project_path = os.path.join(config['working_dir'], config['project_name'])
-    try:
-        if os.path.exists(local_project_path):
-            shutil.rmtree(local_project_path)
-            print(f"Local project folder '{local_project_path}' removed successfully.")
-            local_success = True
-        else:
-            print(f"Local project folder '{local_project_path}' does not exist.")
-            local_success = True
-    except Exception as e:
-        print(f"Error removing local project folder: {e}")
-        local_success = False
+    # Remove local project folder, or only the destroyed environments' checkouts
+    project_root = os.path.join(config['working_dir'], project_name)
+    if remaining or recorded:
+        local_paths = [os.path.join(project_root, environment) for environment in environments]
+    else:
+        local_paths = [project_root]
+    local_success = True
+    for local_project_path in local_paths:
+        try:
+            if os.path.exists(local_project_path):
+                with span('remove_local', 'step'):
+                    shutil.rmtree(local_project_path)
+                print(f"Local project folder '{local_project_path}' removed successfully.")
+            else:
+                print(f"Local project folder '{local_project_path}' does not exist.")
+        except Exception as e:
+            print(f"Error removing local project folder: {e}")
+            local_success = False
 
     if aws_success and github_success and local_success:
-        print(f"All resources for project '{config['project_name']}' in environment '{config['environment']}' have been destroyed.")
+        for environment in environments:
+            remove_journal(journal_path(config['working_dir'], project_name, environment))
+        print(f"All resources for project '{project_name}' in {describe_environments(environments)} have been destroyed.")
     else:
-        print(f"Failed to destroy some or all resources for project '{config['project_name']}' in environment '{config['environment']}'.")
+        print(f"Failed to destroy some or all resources for project '{project_name}' in {describe_environments(environments)}.")
         if not aws_success:
             print("AWS resources destruction failed.")
         if not github_success:
@@ -74,170 +232,638 @@ def destroy_resources(config, secrets):
         if not local_success:
             print("Local project folder removal failed.")
 
-def create_scripts_folder(infrastructure_dir):
-    scripts_dir = os.path.join(infrastructure_dir, 'scripts')
-    os.makedirs(scripts_dir, exist_ok=True)
+    return aws_success and github_success and local_success
 
-    # Copy validate_vars.sh to the scripts folder
-    source_path = os.path.join(os.path.dirname(__file__), 'templates', 'scripts', 'validate_vars.sh')
-    dest_path = os.path.join(scripts_dir, 'validate_vars.sh')
-    shutil.copy2(source_path, dest_path)
+JOURNALED_STEPS = ('s3_bucket', 'dynamodb_table', 's3_replica', 'github_repo', 'bootstrap', 'local_repo')
+ENVIRONMENT_STEPS = ('s3_bucket', 'dynamodb_table', 'local_repo')
 
-    print(f"Created scripts folder and added validate_vars.sh")
-    return scripts_dir
+def _require(value, message):
+    if not value:
+        raise RuntimeError(message)
+    return value
 
-def main():
-    parser = argparse.ArgumentParser(description="Infrastructure Project Provisioner")
-    parser.add_argument("--config", default="config.json", help="Path to the configuration file")
-    parser.add_argument("--destroy", action="store_true", help="Destroy the created resources")
-    args = parser.parse_args()
+# Every environment keeps its own journal in the single-environment format:
+# per-environment steps are named '<step>:<environment>' in the task graph, and
+# the shared repository steps are recorded in every environment's journal.
+# Replica buckets are 's3_replica:<environment>:<region>' in the graph and
+# 's3_replica:<region>' in the journal.
+def _load_completed_steps(journals):
+    recorded = {environment: load_journal(path) for environment, path in journals.items()}
+    completed = {}
+    for environment, steps in recorded.items():
+        for step in ENVIRONMENT_STEPS:
+            if step in steps:
+                completed[f"{step}:{environment}"] = steps[step]
+        for step, output in steps.items():
+            if step.startswith('s3_replica:'):
+                completed[f"s3_replica:{environment}:{step.partition(':')[2]}"] = output
+        if 'github_repo' in steps:
+            completed['github_repo'] = steps['github_repo']
+    if all('bootstrap' in steps for steps in recorded.values()):
+        bootstraps = {environment: steps['bootstrap'] for environment, steps in recorded.items()}
+        repo = {key: value for key, value in next(iter(bootstraps.values())).items() if key != 'commit'}
+        completed['bootstrap'] = dict(repo, commits={environment: output['commit'] for environment, output in bootstraps.items()})
+    return completed
+
+def _record_completed_step(journals, name, output):
+    step, _, environment = name.partition(':')
+    if step not in JOURNALED_STEPS:
+        return
+    if environment:
+        environment, _, region = environment.partition(':')
+        record_step(journals[environment], f"{step}:{region}" if region else step, output)
+        return
+    for environment, path in journals.items():
+        if step == 'bootstrap':
+            repo = {key: value for key, value in output.items() if key != 'commits'}
+            record_step(path, step, dict(repo, commit=output['commits'][environment]))
+        else:
+            record_step(path, step, output)
+
+def provision_resources(config, secrets):
+    from src.aws_utils import get_aws_session, get_aws_client, create_s3_bucket, create_dynamodb_table, configure_state_replication
+    from src.github_utils import create_github_repo, get_github_repo, bootstrap_github_repo, init_local_repo_and_push
+    from src.template_utils import render_shared_files, render_environment_files, write_project_files
+
+    project_name = config['project_name']
+    environments = config_environments(config)
+
+    # Steps completed by an earlier, interrupted run are not repeated: their
+    # recorded outputs (bucket names, repository) are reused instead. Rendering
+    # is cheap and always redone.
+    journals = {environment: journal_path(config['working_dir'], project_name, environment) for environment in environments}
+    completed = _load_completed_steps(journals)
+
+    def s3_bucket_step(environment, region=None):
+        # The environment's state bucket, or with a region one of its replicas
+        def step(results):
+            bucket_region = region or state_region(config, environment)
+            session = get_aws_session(config['aws_sso_profile'], bucket_region)
+            created_bucket = _require(
+                create_s3_bucket(f"{project_name}-{environment}-terraform-state", session, project_name, config['jira_ticket'], environment,
+                                 config.get('state_locking', 'dynamodb'), 'replica' if region else 'primary'),
+                f"S3 bucket creation failed for environment '{environment}' in {bucket_region}"
+            )
+            record_resource(project_name, environment, S3_BUCKET, created_bucket, region=bucket_region)
+            return created_bucket
+        return step
+
+    def dynamodb_table_step(environment):
+        def step(results):
+            dynamodb_table = lock_table(config, environment)
+            session = get_aws_session(config['aws_sso_profile'], state_region(config, environment))
+            # A run interrupted while waiting for the table leaves it behind
+            # unrecorded; it is picked up again once the run got that far
+            resume = f"s3_bucket:{environment}" in completed
+            _require(create_dynamodb_table(dynamodb_table, session, resume), f"DynamoDB table creation failed for environment '{environment}'")
+            record_resource(project_name, environment, DYNAMODB_TABLE, dynamodb_table, region=state_region(config, environment))
+            return dynamodb_table
+        return step
+
+    def replication_step(environment):
+        def step(results):
+            s3_client = get_aws_client(get_aws_session(config['aws_sso_profile'], state_region(config, environment)), 's3')
+            replicas = {region: results[f"s3_replica:{environment}:{region}"] for region in replica_regions(config, environment)}
+            _require(configure_state_replication(s3_client, results[f"s3_bucket:{environment}"], replicas, config['backend_replication_role']),
+                     f"S3 replication setup failed for environment '{environment}'")
+            return sorted(replicas.values())
+        return step
+
+    def github_repo_step(results):
+        repo = _require(create_github_repo(project_name, secrets['github_token']), "GitHub repository creation failed")
+        for environment in environments:
+            record_resource(project_name, environment, GITHUB_REPO, repo.full_name, url=repo.html_url)
+        return {'full_name': repo.full_name, 'clone_url': repo.clone_url, 'html_url': repo.html_url}
+
+    def render_shared_step(results):
+        # Templates that do not depend on the environment are rendered once
+        return render_shared_files(render_context(config, environments[0]))
+
+    def render_step(environment):
+        def step(results):
+            environment_files = render_environment_files(render_context(config, environment, results[f"s3_bucket:{environment}"]))
+            files = dict(results['render_shared'], **environment_files)
+            write_project_files(project_directory(config, environment), files)
+            return files
+        return step
+
+    def bootstrap_step(results):
+        repo = get_github_repo(results['github_repo']['full_name'], secrets['github_token'])
+        commits = bootstrap_github_repo(
+            repo,
+            {environment: list(results[f"render:{environment}"].items()) for environment in environments},
+            f"Add infrastructure and workflows for {project_name}"
+        )
+        return dict(results['github_repo'], commits={environment: commit.sha for environment, commit in commits.items()})
+
+    def local_repo_step(environment):
+        def step(results):
+            project_dir = project_directory(config, environment)
+            _require(init_local_repo_and_push(project_dir, results['bootstrap']['clone_url'], environment, results[f"render:{environment}"]),
+                     f"Failed to initialize local repository or push '{environment}' branch to GitHub")
+            print(f"Local repository initialized and '{environment}' branch pushed to GitHub.")
+            return project_dir
+        return step
+
+    # Steps only wait for the outputs they actually use: every environment's
+    # backend, in every region, and the GitHub repository start at once, and
+    # rendering an environment only waits for its state bucket name. The
+    # repository is bootstrapped once, with a branch per environment.
+    tasks = {
+        'github_repo': (github_repo_step, []),
+        'render_shared': (render_shared_step, []),
+    }
+    for environment in environments:
+        tasks[f"s3_bucket:{environment}"] = (s3_bucket_step(environment), [])
+        # With S3 native locking there is no table to create and wait for
+        if not uses_s3_locking(config):
+            tasks[f"dynamodb_table:{environment}"] = (dynamodb_table_step(environment), [])
+        replicas = [f"s3_replica:{environment}:{region}" for region in replica_regions(config, environment)]
+        for region, name in zip(replica_regions(config, environment), replicas):
+            tasks[name] = (s3_bucket_step(environment, region), [])
+        if replicas and config.get('backend_replication_role'):
+            tasks[f"replication:{environment}"] = (replication_step(environment), [f"s3_bucket:{environment}"] + replicas)
+        tasks[f"render:{environment}"] = (render_step(environment), [f"s3_bucket:{environment}", 'render_shared'])
+        tasks[f"local_repo:{environment}"] = (local_repo_step(environment), ['bootstrap', f"render:{environment}"])
+    tasks['bootstrap'] = (bootstrap_step, ['github_repo'] + [f"render:{environment}" for environment in environments])
+
+    if completed:
+        print(f"Resuming provisioning of '{project_name}' ({', '.join(environments)}); already completed: {', '.join(completed)}")
+
+    results, timings = run_task_graph(
+        tasks,
+        completed=completed,
+        on_success=lambda name, output: _record_completed_step(journals, name, output)
+    )
+    print_task_timings(timings)
+
+    failed = [name for name, timing in timings.items() if timing['status'] not in SUCCEEDED]
+    if failed:
+        print(f"Failed to provision project '{project_name}' for {describe_environments(environments)}. Unfinished steps: {', '.join(failed)}")
+        if not any(name.startswith('render') for name in failed):
+            print("Terraform template and workflows are available locally.")
+        print("Run the same command again to resume from the first unfinished step.")
+        return False
+
+    print(f"Infrastructure project '{project_name}' has been provisioned successfully for {describe_environments(environments)}!")
+    print(f"GitHub repository: {results['bootstrap']['html_url']}")
+    for environment in environments:
+        print(f"Environment '{environment}' (branch '{environment}'):")
+        print(f"  Terraform backend:")
+        print(f"    S3 bucket: {results[f's3_bucket:{environment}']}")
+        if uses_s3_locking(config):
+            print(f"    State locking: S3 lockfile")
+        else:
+            print(f"    DynamoDB table: {results[f'dynamodb_table:{environment}']}")
+        print(f"    AWS Region: {state_region(config, environment)}")
+        replicas = [f"{results[f's3_replica:{environment}:{region}']} ({region})" for region in replica_regions(config, environment)]
+        if replicas:
+            print(f"    Replica buckets{' (replicated)' if config.get('backend_replication_role') else ''}: {', '.join(replicas)}")
+        print(f"  Local project directory: {project_directory(config, environment)}")
+    print("GitHub Actions workflows for deploy and destroy have been added to every environment's branch.")
+    print("\nNOTE: This project uses organization secrets for AWS roles:")
+    print("- 'AWS_ROLE_TO_ASSUME' for production environment")
+    print("- 'SANDBOX_AWS_ROLE_TO_ASSUME' for development environment")
+    print("Ensure these secrets are properly set in your GitHub organization settings.")
+    return True
+
+def sync_resources(config, secrets):
+    from src.github_utils import find_github_repo, sync_github_repo
+    from src.template_utils import render_shared_files, render_environment_files
+    from src.terraform_utils import parse_backend_bucket
+
+    project_name = config['project_name']
+    environments = config_environments(config)
+    print(f"Syncing generated files for project '{project_name}' in {describe_environments(environments)}...")
+
+    journals = {environment: load_journal(journal_path(config['working_dir'], project_name, environment)) for environment in environments}
+    recorded_repos = [name for environment in environments for name in lookup_resource_names(project_name, environment, GITHUB_REPO)]
+    journal_repos = [journal['github_repo']['full_name'] for journal in journals.values() if 'github_repo' in journal]
+    repo = find_github_repo(project_name, secrets['github_token'], (recorded_repos or journal_repos or [None])[0])
+
+    with span('render', 'step'):
+        shared_files = render_shared_files(render_context(config, environments[0]))
+
+    def sync_environment(environment):
+        # Projects created before the inventory and journal existed only have the
+        # bucket name in their deployed provider.tf
+        s3_bucket = recorded_bucket(config, environment)
+        if not s3_bucket:
+            provider_tf = repo.get_contents('infrastructure/provider.tf', ref=environment).decoded_content.decode('utf-8')
+            s3_bucket = parse_backend_bucket(provider_tf)
+        if not s3_bucket:
+            print(f"Could not determine the Terraform state bucket of project '{project_name}' in environment '{environment}'.")
+            return False
+
+        with span('render', 'step', environment=environment):
+            files = dict(shared_files, **render_environment_files(render_context(config, environment, s3_bucket)))
+        with span('sync_repo', 'step', environment=environment):
+            sync_github_repo(repo, environment, list(files.items()), f"Update generated files for {project_name}")
+        return True
+
+    # Each environment's branch is synced concurrently
+    with ThreadPoolExecutor(max_workers=len(environments)) as executor:
+        futures = [submit_in_context(executor, sync_environment, environment) for environment in environments]
+        return all([future.result() for future in futures])
+
+def render_resources(config):
+    from src.template_utils import render_shared_files, render_environment_files, write_project_files
+    from src.terraform_utils import parse_backend_bucket
+
+    project_name = config['project_name']
+    environments = config_environments(config)
+    print(f"Rendering project files for project '{project_name}' in {describe_environments(environments)}...")
+
+    with span('render', 'step'):
+        shared_files = render_shared_files(render_context(config, environments[0]))
+    for environment in environments:
+        project_dir = project_directory(config, environment)
+        # Keep the backend of an already provisioned project; a new one renders with
+        # the bucket name prefix, as its random suffix is only chosen on creation
+        s3_bucket = recorded_bucket(config, environment)
+        provider_path = os.path.join(project_dir, 'infrastructure', 'provider.tf')
+        if not s3_bucket and os.path.exists(provider_path):
+            with open(provider_path, 'r') as f:
+                s3_bucket = parse_backend_bucket(f.read())
+        if not s3_bucket:
+            s3_bucket = f"{project_name}-{environment}-terraform-state"
+            print(f"No state bucket recorded for environment '{environment}'; rendering with '{s3_bucket}'.")
+
+        with span('render', 'step', environment=environment):
+            files = dict(shared_files, **render_environment_files(render_context(config, environment, s3_bucket)))
+            write_project_files(project_dir, files)
+    return True
 
+def process_project(config, action='provision'):
+    validate_config(config)
+    # Validation and local rendering need neither secrets nor cloud access
+    if action == 'validate':
+        return True
+    if action == 'render':
+        return render_resources(config)
+    secrets = get_secrets(config)
+    if action == 'destroy':
+        return destroy_resources(config, secrets)
+    if action == 'sync':
+        return sync_resources(config, secrets)
+    return provision_resources(config, secrets)
+
+def preflight_blockers(configs, action):
+    # Read-only checks of everything the run depends on, before anything is
+    # created; returns the first failed check of each config, or None
+    from src.preflight import run_preflight, print_preflight_summary
+    print(f"Running preflight checks for {len(configs)} project{'s' if len(configs) != 1 else ''}...")
+    results, needs, duration = run_preflight(configs, action)
+    print_preflight_summary(results, needs, configs, duration)
+    return [next((key for key in keys if not results[key]['ok']), None) for keys in needs]
+
+def preflight(configs, action):
+    return not any(preflight_blockers(configs, action))
+
+def preflight_manifest(manifest_path, action):
+    # The whole manifest is checked up front, before any project has been
+    # touched; returns the entries and, by index, why each blocked one fails
+    entries = list(iter_manifest(manifest_path))
+    configs = []
+    indexes = []
+    blocked = {}
+    for index, entry in entries:
+        try:
+            if isinstance(entry, Exception):
+                raise entry
+            if not isinstance(entry, dict):
+                raise ValueError(f"manifest entry must be an object, got {type(entry).__name__}")
+            validate_config(entry)
+            configs.append(entry)
+            indexes.append(index)
+        except ValueError as e:
+            blocked[index] = e
+    for index, failed in zip(indexes, preflight_blockers(configs, action)):
+        if failed:
+            blocked[index] = RuntimeError(f"blocked by preflight check {failed[0]} ({failed[1]})")
+    return entries, blocked
+
+def run_manifest_mode(manifest_path, action, workers, check_first=False):
+    try:
+        entries = iter_manifest(manifest_path)
+        blocked = {}
+        if check_first and action in CLOUD_ACTIONS:
+            entries, blocked = preflight_manifest(manifest_path, action)
+            if blocked:
+                print(f"Preflight checks failed for {len(blocked)} of {len(entries)} manifest entries; running the rest.")
+        results = run_manifest(
+            entries,
+            lambda config: process_project(config, action),
+            max_workers=workers,
+            blocked=blocked
+        )
+    except json.JSONDecodeError as e:
+        print(f"Error parsing manifest: {e}")
+        return False
+    except FileNotFoundError:
+        print(f"Manifest file not found: {manifest_path}")
+        return False
+
+    print_manifest_summary(results)
+    return all(result['success'] for result in results)
+
+def run_config_mode(config_path, action, check_first=False):
     try:
-        config = load_config(args.config)
+        config = load_config(config_path)
         validate_config(config)
     except json.JSONDecodeError as e:
         print(f"Error parsing config.json: {e}")
-        return
+        return False
     except ValueError as e:
         print(f"Invalid config.json: {e}")
-        return
+        return False
     except FileNotFoundError:
-        print(f"Config file not found: {args.config}")
-        return
+        print(f"Config file not found: {config_path}")
+        return False
 
-    try:
-        secrets = get_secrets(config)
-    except ValueError as e:
-        print(f"Error retrieving secrets: {e}")
-        return
-    except Exception as e:
-        print(f"Unexpected error occurred while retrieving secrets: {e}")
-        return
+    if action == 'validate':
+        print(f"{config_path} is valid: project '{config['project_name']}' in {describe_environments(config_environments(config))}.")
+        return True
 
-    if args.destroy:
-        destroy_resources(config, secrets)
-        return
+    with trace_project(f"{config['project_name']} ({', '.join(config_environments(config))})"):
+        if action == 'render':
+            return render_resources(config)
 
-    # Setup Terraform backend
-    s3_bucket, dynamodb_table = setup_terraform_backend(
-        config['project_name'],
-        config['aws_region'],
-        config['aws_sso_profile'],
-        config['jira_ticket'],
-        config['environment']
-    )
+        if check_first and not preflight([config], action):
+            print("Preflight checks failed; nothing was changed.")
+            return False
 
-    if not s3_bucket or not dynamodb_table:
-        print("Failed to create Terraform backend. Exiting.")
-        return
+        try:
+            secrets = get_secrets(config)
+        except ValueError as e:
+            print(f"Error retrieving secrets: {e}")
+            return False
+        except Exception as e:
+            print(f"Unexpected error occurred while retrieving secrets: {e}")
+            return False
 
-    # Update config with the new S3 bucket name
-    config['s3_bucket'] = s3_bucket
+        if action == 'destroy':
+            return destroy_resources(config, secrets)
+        elif action == 'sync':
+            from github import GithubException
+            try:
+                return sync_resources(config, secrets)
+            except GithubException as e:
+                print(f"Error syncing GitHub repository: {e}")
+                return False
+        else:
+            return provision_resources(config, secrets)
 
-    # Create project directory
-    project_dir = os.path.join(config['working_dir'], config['project_name'])
-    os.makedirs(project_dir, exist_ok=True)
-
-    # Create infrastructure directory
-    infrastructure_dir = os.path.join(project_dir, 'infrastructure')
-    os.makedirs(infrastructure_dir, exist_ok=True)
-
-    # Create Terraform template
-    tf_dir = create_terraform_template(
-        config['project_name'],
-        infrastructure_dir,
-        s3_bucket,
-        dynamodb_table,
-        config['aws_region'],
-        config['environment'],
-        config['jira_ticket'],
-        config['test_email']
-    )
+def fleet_target(args):
+    # Fleet-wide commands take the AWS profile and region from --aws-profile and
+    # --aws-region, falling back to the configuration file
+    config = {}
+    if not (args.aws_profile and args.aws_region):
+        try:
+            config = load_config(args.config)
+        except (FileNotFoundError, json.JSONDecodeError) as e:
+            print(f"Could not read {args.config} for the AWS profile and region: {e}")
+    profile = args.aws_profile or config.get('aws_sso_profile')
+    region = args.aws_region or config.get('aws_region')
+    if not (profile and region):
+        print("An AWS profile and region are required: pass --aws-profile and --aws-region or set them in the configuration file.")
+        return None, None
+    return profile, region
 
-    # Create scripts folder and add validate_vars.sh
-    scripts_dir = create_scripts_folder(infrastructure_dir)
+def run_audit(args):
+    from src.audit import audit_backends, print_audit_summary
+    profile, region = fleet_target(args)
+    if not region:
+        return False
+    report = audit_backends(profile, region)
+    if args.audit == '-':
+        print(json.dumps(report, indent=2))
+    else:
+        with open(args.audit, 'w') as f:
+            json.dump(report, f, indent=2)
+        print_audit_summary(report)
+        print(f"Audit report written to {args.audit}")
+    return report['summary']['unhealthy'] == 0
 
-    # Create tfvars file
-    tfvars_config = {
-        'project_name': config['project_name'],
-        'aws_region': config['aws_region'],
-        'environment': config['environment'],
-        'jira_ticket': config['jira_ticket'],
-        'test_email': config['test_email']
-    }
-    create_tfvars_files(tf_dir, tfvars_config)
-
-    # Create GitHub workflows
-    deploy_path, destroy_path = create_github_workflows(
-        project_dir,
-        config['environment'],
-        config['project_name'],
-        config['aws_region']
+def run_reaper(args):
+    from src.reaper import reap_orphans
+    profile, region = fleet_target(args)
+    if not region:
+        return False
+
+    repo_exists = None
+    if args.check_repos:
+        from src.github_utils import github_repo_exists
+        try:
+            github_token = get_secrets(load_config(args.config))['github_token']
+        except (FileNotFoundError, json.JSONDecodeError, KeyError, ValueError) as e:
+            print(f"--check-repos needs the 1Password item of {args.config}: {e}")
+            return False
+        repo_exists = lambda project_name: github_repo_exists(project_name, github_token)
+
+    print(f"{'Dry run: listing' if args.dry_run else 'Reaping'} orphaned Terraform backends in {region}...")
+    return reap_orphans(
+        profile,
+        region,
+        dry_run=args.dry_run,
+        max_workers=max(1, args.reap_workers),
+        min_age_hours=max(0.0, args.min_age_hours),
+        include_non_empty=args.include_non_empty,
+        repo_exists=repo_exists
     )
 
-    # Setup GitHub repo
+def migration_configs(args):
+    if args.manifest:
+        entries = [entry for _, entry in iter_manifest(args.manifest)]
+    else:
+        entries = [load_config(args.config)]
+    configs = []
+    for entry in entries:
+        if isinstance(entry, Exception):
+            raise entry
+        validate_config(entry)
+        configs.append(dict(entry, state_locking='s3'))
+    return configs
+
+def run_locking_migration(args):
+    # Every project is first synced with S3 native locking, so its provider.tf
+    # stops using the table; the tables of the projects that synced are then
+    # deleted together
+    from src.migration import migrate_lock_tables
     try:
-        repo = create_github_repo(config['project_name'], secrets['github_token'], config['environment'])
-    except GithubException as e:
-        print(f"Error creating GitHub repository: {e}")
-        print("Terraform template and workflows are available locally.")
+        configs = migration_configs(args)
+    except (FileNotFoundError, json.JSONDecodeError, ValueError) as e:
+        print(f"Could not read the projects to migrate: {e}")
+        return False
+
+    synced = True
+    if not args.dry_run:
+        if not args.skip_preflight and not preflight(configs, 'sync'):
+            print("Preflight checks failed; nothing was changed.")
+            return False
+        print(f"Switching {len(configs)} project{'s' if len(configs) != 1 else ''} to S3 native state locking...")
+        results = run_manifest(enumerate(configs), lambda config: process_project(config, 'sync'), max_workers=max(1, args.workers))
+        print_manifest_summary(results)
+        synced = all(result['success'] for result in results)
+        configs = [config for config, result in zip(configs, results) if result['success']]
+
+    targets = []
+    for config in configs:
+        for environment in config_environments(config):
+            s3_bucket = recorded_bucket(config, environment)
+            targets.append({
+                'project_name': config['project_name'],
+                'environment': environment,
+                'aws_sso_profile': config['aws_sso_profile'],
+                'aws_region': state_region(config, environment),
+                'lock_table': f"{config['project_name']}-{environment}-terraform-locks",
+                'bucket_names': [s3_bucket] if s3_bucket else None,
+            })
+    print(f"{'Dry run: listing' if args.dry_run else 'Removing'} the lock tables of {len(targets)} backends...")
+    success = migrate_lock_tables(targets, dry_run=args.dry_run)
+    if not args.dry_run:
+        print('Set "state_locking": "s3" in the configuration of every migrated project, so later runs render the same backend.')
+    return success and synced
+
+def configure_clients(args):
+    from src.aws_utils import configure_aws_clients
+    from src.github_utils import configure_github_client
+    configure_aws_clients(max(1, args.aws_max_pool_connections))
+    configure_github_client(max(1, args.github_pool_size), max(0, args.github_writes_per_minute))
+
+def describe_job(config):
+    validate_config(config)
+    return [(config['project_name'], environment) for environment in config_environments(config)]
+
+def warm_up():
+    # Loaded once at startup so the first job does not pay for the SDK imports
+    # and template compilation; secrets stay cached between jobs for their TTL
+    import src.aws_utils, src.github_utils
+    from src.template_utils import get_template_env
+    get_template_env()
+
+def run_server(args):
+    from src.server import JobQueue, serve
+    configure_clients(args)
+    def run_job(action, config):
+        if not args.skip_preflight and not preflight([config], action):
+            return False
+        return process_project(config, action)
+
+    jobs = JobQueue(
+        run_job,
+        describe_job,
+        workers=max(1, args.server_workers),
+        max_queue=max(0, args.max_queue)
+    )
+    serve(jobs, listen=args.listen, socket_path=args.socket, warm_up=warm_up)
+
+def main():
+    parser = argparse.ArgumentParser(description="Infrastructure Project Provisioner")
+    parser.add_argument("--config", default="config.json", help="Path to the configuration file")
+    parser.add_argument("--manifest", help="Path to a JSON or JSONL manifest with one project configuration per entry")
+    parser.add_argument("--workers", type=int, default=8, help="Number of projects processed concurrently in manifest mode")
+    parser.add_argument("--destroy", action="store_true", help="Destroy the created resources")
+    parser.add_argument("--sync", action="store_true", help="Re-render the templates and commit only changed files to existing repositories")
+    parser.add_argument("--skip-preflight", action="store_true", help="Do not run the read-only checks that precede provision, destroy and sync")
+    parser.add_argument("--validate-config", action="store_true", help="Only check the configuration (or every manifest entry) and exit; needs no secrets or cloud access")
+    parser.add_argument("--validate", nargs='+', metavar="PATH",
+                        help="Check .tfvars files, directories of them, Terraform modules or project directories against the declared variables and exit")
+    parser.add_argument("--render", action="store_true", help="Only render the project files into the local project directories; needs no secrets or cloud access")
+    parser.add_argument("--audit", metavar="PATH", help="Check every Terraform backend in the region and write a JSON report to PATH ('-' for standard output)")
+    parser.add_argument("--reap", action="store_true",
+                        help="Delete state buckets and lock tables in the region that lost their partner or were superseded by a rerun")
+    parser.add_argument("--migrate-locking", action="store_true",
+                        help="Switch the projects of --config or --manifest to S3 native state locking and delete their DynamoDB lock tables")
+    parser.add_argument("--dry-run", action="store_true", help="With --reap or --migrate-locking, only list what would be deleted")
+    parser.add_argument("--reap-workers", type=int, default=DEFAULT_REAP_WORKERS, help="Number of orphaned resources inspected and deleted concurrently")
+    parser.add_argument("--min-age-hours", type=float, default=DEFAULT_REAP_MIN_AGE_HOURS,
+                        help="Only reap resources created at least this many hours ago, so runs in progress are left alone")
+    parser.add_argument("--include-non-empty", action="store_true", help="Also reap orphaned buckets that still contain objects")
+    parser.add_argument("--check-repos", action="store_true",
+                        help="Also reap the backends of projects without a GitHub repository (reads the GitHub token from the configuration's 1Password item)")
+    parser.add_argument("--aws-profile", help="AWS profile for fleet-wide commands such as --audit and --reap (default: aws_sso_profile from the configuration file)")
+    parser.add_argument("--aws-region", help="AWS region for fleet-wide commands such as --audit and --reap (default: aws_region from the configuration file)")
+    parser.add_argument("--aws-max-pool-connections", type=int, default=DEFAULT_MAX_POOL_CONNECTIONS,
+                        help="HTTP connection pool size of the AWS clients shared by all concurrent operations")
+    parser.add_argument("--github-pool-size", type=int, default=DEFAULT_GITHUB_POOL_SIZE,
+                        help="HTTP connection pool size of the GitHub client shared by all concurrent operations")
+    parser.add_argument("--github-writes-per-minute", type=int, default=DEFAULT_GITHUB_WRITES_PER_MINUTE,
+                        help="Pace content-creating GitHub requests to this rate to stay under GitHub's secondary rate limits (0 disables pacing)")
+    parser.add_argument("--trace", metavar="PATH", help="Write per-step and per-call timing spans to PATH (Chrome trace-event JSON, or JSONL if PATH ends in .jsonl)")
+    parser.add_argument("--serve", action="store_true", help="Run as a service that accepts provision, destroy and sync jobs over HTTP")
+    parser.add_argument("--listen", default=DEFAULT_LISTEN, metavar="HOST:PORT", help="Address the service listens on")
+    parser.add_argument("--socket", metavar="PATH", help="Listen on a Unix socket at PATH instead of a TCP address")
+    parser.add_argument("--server-workers", type=int, default=DEFAULT_SERVER_WORKERS, help="Number of jobs the service runs concurrently")
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help="Number of jobs the service accepts while all workers are busy")
+    parser.add_argument("--inventory", help="Path to the inventory database of provisioned resources")
+    parser.add_argument("--list", action="store_true", help="List every resource recorded in the inventory")
+    parser.add_argument("--show", metavar="PROJECT_NAME", help="Show the resources recorded for one project")
+    args = parser.parse_args()
+
+    if args.inventory:
+        configure_inventory(args.inventory)
+
+    # tfvars validation and inventory queries are answered locally and need no
+    # configuration or secrets
+    if args.validate:
+        from src.tfvars_validator import validate_paths
+        if not validate_paths(args.validate):
+            sys.exit(1)
         return
-    except Exception as e:
-        print(f"Unexpected error occurred while creating GitHub repository: {e}")
-        print("Terraform template and workflows are available locally.")
+    if args.list:
+        print_inventory(lookup_resources())
+        return
+    if args.show:
+        print_inventory(lookup_resources(project_name=args.show))
         return
 
-    if repo:
-        # Commit and push Terraform template and workflows
-        files_to_commit = [
-            (os.path.join(tf_dir, 'main.tf'), "infrastructure/main.tf"),
-            (os.path.join(tf_dir, 'variables.tf'), "infrastructure/variables.tf"),
-            (os.path.join(tf_dir, 'outputs.tf'), "infrastructure/outputs.tf"),
-            (os.path.join(tf_dir, 'provider.tf'), "infrastructure/provider.tf"),
-            (os.path.join(tf_dir, 'vars', f"{config['environment']}.tfvars"), f"infrastructure/vars/{config['environment']}.tfvars"),
-            (os.path.join(scripts_dir, 'validate_vars.sh'), "infrastructure/scripts/validate_vars.sh"),
-            (deploy_path, '.github/workflows/deploy.yml'),
-            (destroy_path, '.github/workflows/destroy.yml'),
-        ]
-
-        commit_errors = []
-        for local_path, repo_path in files_to_commit:
-            try:
-                with open(local_path, 'r') as f:
-                    content = f.read()
-                commit_and_push(repo, repo_path, f"Add {repo_path} for {config['project_name']}", content)
-            except GithubException as e:
-                commit_errors.append(f"Error committing {repo_path}: {e}")
-            except Exception as e:
-                commit_errors.append(f"Unexpected error committing {repo_path}: {e}")
-
-        if commit_errors:
-            print("Errors occurred while committing files:")
-            for error in commit_errors:
-                print(error)
-            print("Some files may not have been committed successfully.")
-        else:
-            # Initialize local repo and push to GitHub
-            repo_url = repo.clone_url
-            if init_local_repo_and_push(project_dir, repo_url, config['environment']):
-                print(f"Local repository initialized and '{config['environment']}' branch pushed to GitHub.")
-            else:
-                print(f"Failed to initialize local repository or push '{config['environment']}' branch to GitHub.")
-
-            print(f"Infrastructure project '{config['project_name']}' has been provisioned successfully for environment '{config['environment']}'!")
-            print(f"GitHub repository: {repo.html_url}")
-            print(f"Terraform backend:")
-            print(f"  S3 bucket: {s3_bucket}")
-            print(f"  DynamoDB table: {dynamodb_table}")
-            print(f"  AWS Region: {config['aws_region']}")
-            print(f"Local project directory: {project_dir}")
-            print("GitHub Actions workflows for deploy and destroy have been added to the repository.")
-            print("\nNOTE: This project uses organization secrets for AWS roles:")
-            print("- 'AWS_ROLE_TO_ASSUME' for production environment")
-            print("- 'SANDBOX_AWS_ROLE_TO_ASSUME' for development environment")
-            print("Ensure these secrets are properly set in your GitHub organization settings.")
+    if args.serve:
+        run_server(args)
+        return
+
+    if args.migrate_locking:
+        configure_clients(args)
+        success = run_locking_migration(args)
+        print_trace_summary()
+        if args.trace:
+            write_trace(args.trace)
+        if not success:
+            sys.exit(1)
+        return
+
+    # The audit and the reaper work on every backend in a region rather than one project
+    if args.audit or args.reap:
+        if args.audit and args.reap:
+            parser.error("--audit and --reap cannot be combined")
+        configure_clients(args)
+        success = run_audit(args) if args.audit else run_reaper(args)
+        if args.audit != '-':
+            print_trace_summary()
+        if args.trace:
+            write_trace(args.trace)
+        if not success:
+            sys.exit(1)
+        return
+
+    actions = [name for name, chosen in (('destroy', args.destroy), ('sync', args.sync), ('validate', args.validate_config), ('render', args.render)) if chosen]
+    if len(actions) > 1:
+        parser.error(f"{' and '.join('--' + ('validate-config' if name == 'validate' else name) for name in actions)} cannot be combined")
+    action = actions[0] if actions else 'provision'
+    if action in CLOUD_ACTIONS:
+        configure_clients(args)
+
+    if args.manifest:
+        success = run_manifest_mode(args.manifest, action, max(1, args.workers), check_first=not args.skip_preflight)
     else:
-        print("Failed to create GitHub repository. Terraform template and workflows are available locally.")
+        success = run_config_mode(args.config, action, check_first=not args.skip_preflight)
+
+    print_trace_summary()
+    if args.trace:
+        write_trace(args.trace)
+    # Local checks are meant to gate CI jobs, so they report failure in the exit code
+    if action not in CLOUD_ACTIONS and not success:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
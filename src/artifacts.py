@@ -0,0 +1,58 @@
+import hashlib
+import os
+import stat
+import threading
+import zlib
+
+# Generated files are kept in memory as an artifact tree: a dict of paths,
+# relative to the project directory, to artifacts. An artifact is a dict with
+# the file's bytes ('data'), its git mode ('mode') and its git blob hash
+# ('sha'). The hash is computed once, when the file is rendered, and reused
+# by the disk writer, the GitHub upload and the local git commit.
+FILE_MODE = '100644'
+EXECUTABLE_MODE = '100755'
+
+def file_mode(path):
+    return EXECUTABLE_MODE if path.endswith('.sh') else FILE_MODE
+
+def git_blob_sha(content):
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+def make_artifact(path, content):
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    return {'data': data, 'mode': file_mode(path), 'sha': git_blob_sha(data)}
+
+def artifact_text(artifact):
+    return artifact['data'].decode('utf-8')
+
+def write_artifacts(project_dir, tree):
+    for relative_path, artifact in tree.items():
+        path = os.path.join(project_dir, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(artifact['data'])
+        if artifact['mode'] == EXECUTABLE_MODE:
+            os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+def write_loose_objects(git_dir, tree):
+    # Stores every blob git does not have loose yet under its known hash, so git
+    # never reads or hashes the files again; shared content is written once.
+    # Returns the number of objects written.
+    written = 0
+    blobs = {artifact['sha']: artifact['data'] for artifact in tree.values()}
+    for sha, data in blobs.items():
+        path = os.path.join(git_dir, 'objects', sha[:2], sha[2:])
+        if os.path.exists(path):
+            continue
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(zlib.compress(b'blob %d\0' % len(data) + data))
+        os.replace(tmp_path, path)
+        written += 1
+    return written
+
+def index_info(tree):
+    # Input for `git update-index --index-info`
+    return ''.join(f"{artifact['mode']} {artifact['sha']}\t{path}\n" for path, artifact in sorted(tree.items()))
@@ -0,0 +1,184 @@
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from botocore.exceptions import ClientError
+from src.aws_utils import STATE_LOCKING_TAG, BACKEND_ROLE_TAG, get_aws_session, get_aws_client
+from src.inventory import S3_BUCKET, lookup_resources
+from src.tracing import span, submit_in_context
+
+DEFAULT_AUDIT_WORKERS = 32
+BACKEND_BUCKET_PATTERN = re.compile(r'(?P<prefix>.+)-terraform-state-[a-z0-9]{5}')
+LOCK_TABLE_SUFFIX = '-terraform-locks'
+REQUIRED_TAGS = ('Project', 'JiraTicket', 'Environment')
+
+def _error_detail(e):
+    error = e.response.get('Error', {})
+    return f"{error.get('Code')}: {error.get('Message')}"
+
+def find_backend_buckets(tagging_client):
+    # A handful of paginated GetResources calls return every tagged bucket in the
+    # region together with its tags, instead of one GetBucketTagging per bucket
+    buckets = {}
+    paginator = tagging_client.get_paginator('get_resources')
+    for page in paginator.paginate(ResourceTypeFilters=['s3:bucket'], ResourcesPerPage=100):
+        for resource in page.get('ResourceTagMappingList', []):
+            name = resource['ResourceARN'].split(':::', 1)[-1]
+            if BACKEND_BUCKET_PATTERN.fullmatch(name):
+                buckets[name] = {tag['Key']: tag['Value'] for tag in resource.get('Tags', [])}
+    return buckets
+
+def find_lock_tables(dynamodb_client):
+    tables = set()
+    paginator = dynamodb_client.get_paginator('list_tables')
+    for page in paginator.paginate(PaginationConfig={'PageSize': 100}):
+        tables.update(name for name in page.get('TableNames', []) if name.endswith(LOCK_TABLE_SUFFIX))
+    return tables
+
+def check_versioning(s3_client, bucket_name):
+    try:
+        status = s3_client.get_bucket_versioning(Bucket=bucket_name).get('Status')
+    except ClientError as e:
+        return {'ok': False, 'detail': _error_detail(e)}
+    if status != 'Enabled':
+        return {'ok': False, 'detail': f"versioning is {status.lower() if status else 'not enabled'}"}
+    return {'ok': True, 'detail': 'versioning is enabled'}
+
+def _enforces_tls(statement, bucket_name):
+    actions = statement.get('Action', [])
+    actions = [actions] if isinstance(actions, str) else actions
+    resources = statement.get('Resource', [])
+    resources = [resources] if isinstance(resources, str) else resources
+    principal = statement.get('Principal')
+    secure_transport = statement.get('Condition', {}).get('Bool', {}).get('aws:SecureTransport')
+    return (
+        statement.get('Effect') == 'Deny'
+        and principal in ('*', {'AWS': '*'})
+        and 's3:*' in actions
+        and str(secure_transport).lower() == 'false'
+        and {f"arn:aws:s3:::{bucket_name}", f"arn:aws:s3:::{bucket_name}/*"} <= set(resources)
+    )
+
+def check_policy(s3_client, bucket_name):
+    try:
+        policy = json.loads(s3_client.get_bucket_policy(Bucket=bucket_name)['Policy'])
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchBucketPolicy':
+            return {'ok': False, 'detail': 'bucket has no policy'}
+        return {'ok': False, 'detail': _error_detail(e)}
+    statements = policy.get('Statement', [])
+    statements = [statements] if isinstance(statements, dict) else statements
+    if not any(_enforces_tls(statement, bucket_name) for statement in statements):
+        return {'ok': False, 'detail': 'policy does not deny requests without TLS to the bucket and its objects'}
+    return {'ok': True, 'detail': 'policy denies requests without TLS'}
+
+def check_tags(tags, prefix):
+    if tags is None:
+        return {'ok': False, 'detail': 'bucket has no tags (recorded in the inventory, not found by the tag query)'}
+    missing = [key for key in REQUIRED_TAGS if not tags.get(key)]
+    if missing:
+        return {'ok': False, 'detail': f"missing tags: {', '.join(missing)}"}
+    if f"{tags['Project']}-{tags['Environment']}" != prefix:
+        return {'ok': False, 'detail': f"tags name project '{tags['Project']}' in environment '{tags['Environment']}', which does not match the bucket name"}
+    return {'ok': True, 'detail': 'Project, JiraTicket and Environment tags are set'}
+
+def check_lock_table(dynamodb_client, table_name, existing_tables):
+    if table_name not in existing_tables:
+        return {'ok': False, 'detail': f"lock table '{table_name}' does not exist"}
+    try:
+        table = dynamodb_client.describe_table(TableName=table_name)['Table']
+    except ClientError as e:
+        return {'ok': False, 'detail': _error_detail(e)}
+    if table.get('TableStatus') != 'ACTIVE':
+        return {'ok': False, 'detail': f"lock table is {table.get('TableStatus')}"}
+    attribute_types = {item['AttributeName']: item['AttributeType'] for item in table.get('AttributeDefinitions', [])}
+    if table.get('KeySchema') != [{'AttributeName': 'LockID', 'KeyType': 'HASH'}] or attribute_types.get('LockID') != 'S':
+        return {'ok': False, 'detail': "lock table is not keyed by a string 'LockID' hash key"}
+    return {'ok': True, 'detail': 'lock table is active and keyed by LockID'}
+
+def audit_backends(aws_sso_profile, region, max_workers=DEFAULT_AUDIT_WORKERS):
+    start = time.monotonic()
+    session = get_aws_session(aws_sso_profile, region)
+    s3_client = get_aws_client(session, 's3')
+    dynamodb_client = get_aws_client(session, 'dynamodb')
+    tagging_client = get_aws_client(session, 'resourcegroupstaggingapi')
+
+    with span('find_backends', 'step'):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            buckets_future = submit_in_context(executor, find_backend_buckets, tagging_client)
+            tables_future = submit_in_context(executor, find_lock_tables, dynamodb_client)
+            tagged_buckets = buckets_future.result()
+            lock_tables = tables_future.result()
+
+    # Buckets that lost their tags are invisible to the tag query; the inventory
+    # still knows the ones this tool created
+    inventory = {row['resource_name']: row for row in lookup_resources(resource_type=S3_BUCKET)
+                 if row['region'] in (None, region)}
+    bucket_names = sorted(set(tagged_buckets) | {name for name in inventory if BACKEND_BUCKET_PATTERN.fullmatch(name)})
+
+    # Every check of every backend is its own task, so one slow bucket does not
+    # hold up the checks of the others
+    backends = []
+    with span('check_backends', 'step', backends=len(bucket_names)):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for bucket_name in bucket_names:
+                prefix = BACKEND_BUCKET_PATTERN.fullmatch(bucket_name).group('prefix')
+                tags = tagged_buckets.get(bucket_name)
+                row = inventory.get(bucket_name)
+                # Backends that use S3 native locking, and replicas, have no table to check
+                s3_locked = (tags or {}).get(STATE_LOCKING_TAG) == 's3'
+                replica = (tags or {}).get(BACKEND_ROLE_TAG) == 'replica'
+                no_table = s3_locked or replica
+                backends.append({
+                    'bucket': bucket_name,
+                    'lock_table': None if no_table else f"{prefix}{LOCK_TABLE_SUFFIX}",
+                    'state_locking': 's3' if s3_locked else 'dynamodb',
+                    'role': 'replica' if replica else 'primary',
+                    'project': (tags or {}).get('Project') or (row['project_name'] if row else None),
+                    'environment': (tags or {}).get('Environment') or (row['environment'] if row else None),
+                    'jira_ticket': (tags or {}).get('JiraTicket'),
+                    'checks': {
+                        'versioning': submit_in_context(executor, check_versioning, s3_client, bucket_name),
+                        'policy': submit_in_context(executor, check_policy, s3_client, bucket_name),
+                        'tags': check_tags(tags, prefix),
+                        'lock_table': {'ok': True, 'detail': 'replica of a state bucket in another region'} if replica else
+                                      {'ok': True, 'detail': 'state is locked with S3 lockfiles'} if s3_locked else
+                                      submit_in_context(executor, check_lock_table, dynamodb_client, f"{prefix}{LOCK_TABLE_SUFFIX}", lock_tables),
+                    },
+                })
+            for backend in backends:
+                checks = backend['checks']
+                for name, check in checks.items():
+                    checks[name] = check if isinstance(check, dict) else check.result()
+                backend['issues'] = [f"{name}: {check['detail']}" for name, check in checks.items() if not check['ok']]
+                backend['healthy'] = not backend['issues']
+
+    # A table left behind by a backend that moved to S3 locking counts as an orphan
+    paired_tables = {backend['lock_table'] for backend in backends if backend['lock_table']}
+    orphan_tables = sorted(lock_tables - paired_tables)
+    unhealthy = sum(1 for backend in backends if not backend['healthy'])
+    return {
+        'generated_at': datetime.now(timezone.utc).isoformat(),
+        'aws_sso_profile': aws_sso_profile,
+        'region': region,
+        'duration_seconds': round(time.monotonic() - start, 3),
+        'summary': {
+            'backends': len(backends),
+            'healthy': len(backends) - unhealthy,
+            'unhealthy': unhealthy,
+            'orphan_lock_tables': len(orphan_tables),
+        },
+        'backends': backends,
+        'orphan_lock_tables': orphan_tables,
+    }
+
+def print_audit_summary(report):
+    summary = report['summary']
+    for backend in report['backends']:
+        if not backend['healthy']:
+            print(f"  UNHEALTHY {backend['bucket']}: {'; '.join(backend['issues'])}")
+    for table_name in report['orphan_lock_tables']:
+        print(f"  ORPHAN    {table_name}: no state bucket locks with it")
+    print(f"Audited {summary['backends']} backends in {report['region']} in {report['duration_seconds']:.1f}s: "
+          f"{summary['healthy']} healthy, {summary['unhealthy']} unhealthy, {summary['orphan_lock_tables']} orphan lock tables.")
@@ -1,18 +1,90 @@
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 import json
 import random
+import re
 import string
+import threading
+import time
 import botocore
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src.tracing import span, record_span, submit_in_context
+from src.defaults import DEFAULT_MAX_POOL_CONNECTIONS
+
+DELETE_BATCH_SIZE = 1000
+DEFAULT_TABLE_WORKERS = 16
+# Every state bucket is tagged with how its state is locked: 'dynamodb' (a
+# '-terraform-locks' table) or 's3' (Terraform's native lockfile in the bucket)
+STATE_LOCKING_TAG = 'StateLocking'
+# and with its role: 'primary' (the environment's state is written to it) or
+# 'replica' (a copy in another backend region, without a lock table)
+BACKEND_ROLE_TAG = 'BackendRole'
+DEFAULT_DELETE_WORKERS = 8
+DEFAULT_BUCKET_WORKERS = 4
+PROGRESS_INTERVAL = 5.0
+
+# Sessions and clients are shared by every operation in the process. boto3
+# sessions are not thread-safe, so sessions and clients are only ever created
+# under the lock; the clients themselves are safe to share between threads and
+# keep their HTTP connections warm.
+_cache_lock = threading.Lock()
+_sessions = {}
+_clients = {}
+_max_pool_connections = DEFAULT_MAX_POOL_CONNECTIONS
+
+def configure_aws_clients(max_pool_connections):
+    global _max_pool_connections
+    with _cache_lock:
+        if max_pool_connections != _max_pool_connections:
+            _max_pool_connections = max_pool_connections
+            _clients.clear()
 
 def get_aws_session(profile_name, region):
-    return boto3.Session(profile_name=profile_name, region_name=region)
+    key = (profile_name, region)
+    with _cache_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = boto3.Session(profile_name=profile_name, region_name=region)
+            _sessions[key] = session
+    return session
+
+def _before_aws_call(context, **kwargs):
+    context['trace_start'] = time.time()
+
+def _after_aws_call(http_response, parsed, model, context, **kwargs):
+    start = context.get('trace_start')
+    if start is None:
+        return
+    status = http_response.status_code
+    error = parsed.get('Error', {}).get('Code') if status >= 400 else None
+    record_span(
+        f"{model.service_model.service_name}.{model.name}", 'aws', start, time.time(),
+        'ok' if status < 400 else 'error', error=error, status=status
+    )
+
+def get_aws_client(session, service_name):
+    key = (session, service_name)
+    with _cache_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = session.client(service_name, config=Config(max_pool_connections=_max_pool_connections))
+            # Every API call made through the client is recorded as a trace span
+            client.meta.events.register('before-call', _before_aws_call)
+            client.meta.events.register('after-call', _after_aws_call)
+            _clients[key] = client
+    return client
+
+def clear_aws_cache():
+    with _cache_lock:
+        _clients.clear()
+        _sessions.clear()
 
 def generate_random_string(length):
     return ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
 
-def create_s3_bucket(bucket_name, session, project_name, jira_ticket, environment):
-    s3_client = session.client('s3')
+def create_s3_bucket(bucket_name, session, project_name, jira_ticket, environment, state_locking='dynamodb', role='primary'):
+    s3_client = get_aws_client(session, 's3')
     region = session.region_name
 
     # Add a 5-character random string to the bucket name
@@ -42,6 +114,8 @@ def create_s3_bucket(bucket_name, session, project_name, jira_ticket, environmen
                     {'Key': 'Project', 'Value': project_name},
                     {'Key': 'JiraTicket', 'Value': jira_ticket},
                     {'Key': 'Environment', 'Value': environment},
+                    {'Key': STATE_LOCKING_TAG, 'Value': state_locking},
+                    {'Key': BACKEND_ROLE_TAG, 'Value': role},
                 ]
             }
         )
@@ -75,89 +149,233 @@ def create_s3_bucket(bucket_name, session, project_name, jira_ticket, environmen
         return False
     return bucket_name
 
-def create_dynamodb_table(table_name, session):
-    dynamodb = session.resource('dynamodb')
+def create_dynamodb_table(table_name, session, resume=False):
+    # With resume, a table that already exists is taken to be the one an
+    # interrupted run created, and is waited on instead of failing the step
+    dynamodb_client = get_aws_client(session, 'dynamodb')
     region = session.region_name
 
     try:
-        table = dynamodb.create_table(
-            TableName=table_name,
-            KeySchema=[
-                {'AttributeName': 'LockID', 'KeyType': 'HASH'}
-            ],
-            AttributeDefinitions=[
-                {'AttributeName': 'LockID', 'AttributeType': 'S'}
-            ],
-            BillingMode='PAY_PER_REQUEST'
-        )
-        table.wait_until_exists()
+        try:
+            dynamodb_client.create_table(
+                TableName=table_name,
+                KeySchema=[
+                    {'AttributeName': 'LockID', 'KeyType': 'HASH'}
+                ],
+                AttributeDefinitions=[
+                    {'AttributeName': 'LockID', 'AttributeType': 'S'}
+                ],
+                BillingMode='PAY_PER_REQUEST'
+            )
+        except ClientError as e:
+            if not resume or e.response['Error']['Code'] != 'ResourceInUseException':
+                raise
+            print(f"DynamoDB table '{table_name}' already exists from an interrupted run; waiting for it to become active.")
+        with span('dynamodb.wait_table_exists', 'aws', table=table_name):
+            dynamodb_client.get_waiter('table_exists').wait(TableName=table_name)
         print(f"DynamoDB table '{table_name}' created successfully in region {region}.")
     except ClientError as e:
         print(f"Error creating DynamoDB table: {e}")
         return False
     return True
 
-def setup_terraform_backend(project_name, region, aws_sso_profile, jira_ticket, environment):
-    session = get_aws_session(aws_sso_profile, region)
-    bucket_name = f"{project_name}-{environment}-terraform-state"
-    table_name = f"{project_name}-{environment}-terraform-locks"
+def configure_state_replication(s3_client, bucket_name, replicas, role_arn):
+    # Replicates every object of the state bucket to the replica buckets, one
+    # rule per replica region ({region: bucket name}); both sides are versioned
+    rules = [
+        {
+            'ID': f"state-to-{region}",
+            'Priority': priority,
+            'Status': 'Enabled',
+            'Filter': {},
+            'DeleteMarkerReplication': {'Status': 'Enabled'},
+            'Destination': {'Bucket': f"arn:aws:s3:::{replica}"},
+        }
+        for priority, (region, replica) in enumerate(sorted(replicas.items()), start=1)
+    ]
+    try:
+        s3_client.put_bucket_replication(Bucket=bucket_name, ReplicationConfiguration={'Role': role_arn, 'Rules': rules})
+        print(f"S3 bucket '{bucket_name}' replicates to {', '.join(f'{replica} ({region})' for region, replica in sorted(replicas.items()))}.")
+    except ClientError as e:
+        print(f"Error configuring replication of S3 bucket '{bucket_name}': {e}")
+        return False
+    return True
 
-    bucket_name = create_s3_bucket(bucket_name, session, project_name, jira_ticket, environment)
-    if bucket_name and create_dynamodb_table(table_name, session):
-        return bucket_name, table_name
-    return None, None
+def set_state_locking_tag(s3_client, bucket_name, state_locking):
+    # PutBucketTagging replaces the whole tag set, so the other tags are kept
+    try:
+        tags = s3_client.get_bucket_tagging(Bucket=bucket_name)['TagSet']
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'NoSuchTagSet':
+            raise
+        tags = []
+    tags = [tag for tag in tags if tag['Key'] != STATE_LOCKING_TAG] + [{'Key': STATE_LOCKING_TAG, 'Value': state_locking}]
+    s3_client.put_bucket_tagging(Bucket=bucket_name, Tagging={'TagSet': tags})
 
-def list_matching_s3_buckets(s3_client, project_name, environment):
-    buckets = s3_client.list_buckets()['Buckets']
-    prefix = f"{project_name}-{environment}-terraform-state-"
-    return [bucket['Name'] for bucket in buckets if bucket['Name'].startswith(prefix)]
+def _held_locks(dynamodb_client, table_name):
+    # Lock entries carry an 'Info' attribute; the state digests kept next to them do not
+    locks = []
+    kwargs = {'TableName': table_name, 'FilterExpression': 'attribute_exists(Info)', 'ProjectionExpression': 'LockID'}
+    while True:
+        page = dynamodb_client.scan(**kwargs)
+        locks += [item['LockID']['S'] for item in page.get('Items', [])]
+        if 'LastEvaluatedKey' not in page:
+            return locks
+        kwargs['ExclusiveStartKey'] = page['LastEvaluatedKey']
 
-def destroy_terraform_backend(project_name, region, aws_sso_profile, environment):
-    session = get_aws_session(aws_sso_profile, region)
-    s3_client = session.client('s3')
-    dynamodb_client = session.client('dynamodb')
+def _delete_lock_table(dynamodb_client, table_name):
+    try:
+        locks = _held_locks(dynamodb_client, table_name)
+        if locks:
+            return False, f"still holds a lock on {locks[0]}"
+        dynamodb_client.delete_table(TableName=table_name)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceNotFoundException':
+            return True, 'does not exist'
+        return False, str(e)
+    return True, 'deletion initiated'
 
-    table_name = f"{project_name}-{environment}-terraform-locks"
+def delete_lock_tables(dynamodb_client, table_names, max_workers=DEFAULT_TABLE_WORKERS):
+    # Deletions are started concurrently and not waited on: nothing uses the
+    # tables any more, so there is no reason to block until they are gone.
+    # Tables that still hold a Terraform lock are left alone.
+    if not table_names:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(len(table_names), max_workers)) as executor:
+        futures = {table_name: submit_in_context(executor, _delete_lock_table, dynamodb_client, table_name) for table_name in table_names}
+        return {table_name: future.result() for table_name, future in futures.items()}
 
-    # Find and delete matching S3 buckets
-    matching_buckets = list_matching_s3_buckets(s3_client, project_name, environment)
+def list_matching_s3_buckets(s3_client, project_name, environment, region=None):
+    # Only accept the exact random suffix so a project whose name extends this
+    # one is not matched by accident
+    pattern = re.compile(re.escape(f"{project_name}-{environment}-terraform-state-") + r"[a-z0-9]{5}")
+    filters = {'BucketRegion': region} if region else {}
+    paginator = s3_client.get_paginator('list_buckets')
+    return [bucket['Name'] for page in paginator.paginate(PaginationConfig={'PageSize': 1000}, **filters)
+            for bucket in page.get('Buckets', []) if pattern.fullmatch(bucket['Name'])]
 
-    for bucket_name in matching_buckets:
-        try:
-            # First, delete all objects in the bucket
-            paginator = s3_client.get_paginator('list_object_versions')
-            for page in paginator.paginate(Bucket=bucket_name):
-                objects_to_delete = []
-                if 'Versions' in page:
-                    objects_to_delete.extend(
-                        [{'Key': obj['Key'], 'VersionId': obj['VersionId']} for obj in page['Versions']]
-                    )
-                if 'DeleteMarkers' in page:
-                    objects_to_delete.extend(
-                        [{'Key': obj['Key'], 'VersionId': obj['VersionId']} for obj in page['DeleteMarkers']]
-                    )
-                if objects_to_delete:
-                    s3_client.delete_objects(Bucket=bucket_name, Delete={'Objects': objects_to_delete})
-
-            # Then, delete the bucket itself
-            s3_client.delete_bucket(Bucket=bucket_name)
-            print(f"S3 bucket '{bucket_name}' deleted successfully.")
-        except botocore.exceptions.ClientError as e:
-            if e.response['Error']['Code'] == 'NoSuchBucket':
-                print(f"S3 bucket '{bucket_name}' does not exist.")
-            else:
-                print(f"Error deleting S3 bucket '{bucket_name}': {e}")
-                return False
+def _delete_object_batch(s3_client, bucket_name, objects):
+    response = s3_client.delete_objects(Bucket=bucket_name, Delete={'Objects': objects, 'Quiet': True})
+    errors = response.get('Errors', [])
+    return len(objects) - len(errors), errors
+
+def empty_s3_bucket(s3_client, bucket_name, max_workers=DEFAULT_DELETE_WORKERS):
+    # Listing runs in this thread and keeps ahead of up to max_workers
+    # delete_objects batches in flight. Returns the number of deleted objects
+    # and the per-object errors reported by delete_objects.
+    start = time.monotonic()
+    last_report = start
+    deleted = 0
+    errors = []
+    batch = []
+    pending = set()
+
+    def collect(done):
+        nonlocal deleted
+        for future in done:
+            count, batch_errors = future.result()
+            deleted += count
+            errors.extend(batch_errors)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        paginator = s3_client.get_paginator('list_object_versions')
+        for page in paginator.paginate(Bucket=bucket_name, PaginationConfig={'PageSize': DELETE_BATCH_SIZE}):
+            for obj in page.get('Versions', []) + page.get('DeleteMarkers', []):
+                batch.append({'Key': obj['Key'], 'VersionId': obj['VersionId']})
+                if len(batch) == DELETE_BATCH_SIZE:
+                    pending.add(submit_in_context(executor, _delete_object_batch, s3_client, bucket_name, batch))
+                    batch = []
+
+            while len(pending) >= max_workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            done = {future for future in pending if future.done()}
+            pending -= done
+            collect(done)
+
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                print(f"S3 bucket '{bucket_name}': {deleted} objects deleted ({deleted / (now - start):.0f} objects/sec)")
+                last_report = now
+
+        if batch:
+            pending.add(submit_in_context(executor, _delete_object_batch, s3_client, bucket_name, batch))
+        done, _ = wait(pending)
+        collect(done)
+
+    elapsed = time.monotonic() - start
+    rate = deleted / elapsed if elapsed else 0.0
+    print(f"S3 bucket '{bucket_name}' emptied: {deleted} objects deleted in {elapsed:.1f}s ({rate:.0f} objects/sec), {len(errors)} failed.")
+    return deleted, errors
+
+def delete_s3_bucket(s3_client, bucket_name):
+    try:
+        # First, delete all objects in the bucket
+        _, errors = empty_s3_bucket(s3_client, bucket_name)
+        if errors:
+            print(f"Failed to delete {len(errors)} objects from S3 bucket '{bucket_name}':")
+            for error in errors[:10]:
+                print(f"  {error.get('Key')} ({error.get('VersionId')}): {error.get('Code')} {error.get('Message')}")
+            return False
+
+        # Then, delete the bucket itself
+        s3_client.delete_bucket(Bucket=bucket_name)
+        print(f"S3 bucket '{bucket_name}' deleted successfully.")
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] == 'NoSuchBucket':
+            print(f"S3 bucket '{bucket_name}' does not exist.")
+        else:
+            print(f"Error deleting S3 bucket '{bucket_name}': {e}")
+            return False
+    return True
+
+def _destroy_regional_buckets(project_name, region, aws_sso_profile, environment, bucket_names, filter_region):
+    s3_client = get_aws_client(get_aws_session(aws_sso_profile, region), 's3')
+
+    # Find and delete matching S3 buckets, several at a time. Known bucket names
+    # (from the inventory) avoid listing every bucket in the account.
+    if bucket_names is None:
+        matching_buckets = list_matching_s3_buckets(s3_client, project_name, environment, region if filter_region else None)
+    else:
+        matching_buckets = list(bucket_names)
 
     if not matching_buckets:
-        print(f"No matching S3 buckets found for project '{project_name}' and environment '{environment}'.")
+        print(f"No matching S3 buckets found for project '{project_name}' and environment '{environment}' in {region}.")
+        return True
+    with ThreadPoolExecutor(max_workers=min(len(matching_buckets), DEFAULT_BUCKET_WORKERS)) as executor:
+        futures = [submit_in_context(executor, delete_s3_bucket, s3_client, bucket_name) for bucket_name in matching_buckets]
+        return all([future.result() for future in futures])
+
+def destroy_terraform_backend(project_name, region, aws_sso_profile, environment, bucket_names=None, delete_lock_table=True,
+                              replica_regions=()):
+    # region holds the state bucket and lock table, replica_regions the
+    # environment's replica buckets. bucket_names maps regions to the buckets
+    # known to be there; the others are looked up. Every region is torn down at once.
+    regions = [region] + [replica_region for replica_region in replica_regions if replica_region != region]
+    bucket_names = bucket_names or {}
+    with ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        futures = [
+            submit_in_context(executor, _destroy_regional_buckets, project_name, bucket_region, aws_sso_profile, environment,
+                              bucket_names.get(bucket_region), len(regions) > 1)
+            for bucket_region in regions
+        ]
+        if not all([future.result() for future in futures]):
+            return False
+
+    # Backends with S3 native locking have no table to delete or wait for
+    if not delete_lock_table:
+        return True
+
+    dynamodb_client = get_aws_client(get_aws_session(aws_sso_profile, region), 'dynamodb')
+    table_name = f"{project_name}-{environment}-terraform-locks"
 
     # Delete DynamoDB table
     try:
         dynamodb_client.delete_table(TableName=table_name)
         print(f"DynamoDB table '{table_name}' deletion initiated.")
         waiter = dynamodb_client.get_waiter('table_not_exists')
-        waiter.wait(TableName=table_name)
+        with span('dynamodb.wait_table_not_exists', 'aws', table=table_name):
+            waiter.wait(TableName=table_name)
         print(f"DynamoDB table '{table_name}' deleted successfully.")
     except botocore.exceptions.ClientError as e:
         if e.response['Error']['Code'] == 'ResourceNotFoundException':
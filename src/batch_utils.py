@@ -0,0 +1,111 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src.tracing import span, trace_project
+
+# Manifests are either a JSON array of configs or JSONL with one config per line.
+# JSONL is streamed; a line that fails to parse is yielded as the exception so it
+# only fails its own project.
+def iter_manifest(manifest_path):
+    with open(manifest_path, 'r') as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+
+        if head == '[':
+            for index, entry in enumerate(json.load(f)):
+                yield index, entry
+            return
+
+        index = 0
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            try:
+                yield index, json.loads(line)
+            except json.JSONDecodeError as e:
+                yield index, ValueError(f"line {line_number}: {e}")
+            index += 1
+
+def _environment_label(environment):
+    # An entry may set up several environments of its project at once
+    if isinstance(environment, list):
+        return ', '.join(str(name) for name in environment)
+    return environment
+
+def _run_entry(index, entry, process_fn, error=None):
+    start = time.monotonic()
+    result = {
+        'index': index,
+        'project_name': entry.get('project_name') if isinstance(entry, dict) else None,
+        'environment': _environment_label(entry.get('environment')) if isinstance(entry, dict) else None,
+        'success': False,
+        'error': None,
+    }
+    try:
+        if error:
+            raise error
+        if isinstance(entry, Exception):
+            raise entry
+        if not isinstance(entry, dict):
+            raise ValueError(f"manifest entry must be an object, got {type(entry).__name__}")
+        # Label every span recorded for this entry with its project
+        with trace_project(f"{result['project_name']} ({result['environment']})"), span('project', 'step') as details:
+            result['success'] = bool(process_fn(entry))
+            if not result['success']:
+                details['outcome'] = 'failed'
+        if not result['success']:
+            result['error'] = "provisioning reported failure"
+    except Exception as e:
+        result['error'] = str(e)
+    result['duration'] = time.monotonic() - start
+    return result
+
+def run_manifest(entries, process_fn, max_workers=8, blocked=None):
+    # Only read a couple of entries ahead of the workers so large manifests are
+    # never fully loaded, and fail repeated (project, environment) pairs instead
+    # of letting them race each other. Entries in blocked (index -> error) are
+    # reported as failed without being processed.
+    blocked = blocked or {}
+    results = []
+    seen = set()
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for index, entry in entries:
+            error = blocked.get(index)
+            if isinstance(entry, dict):
+                environments = entry.get('environment')
+                if not isinstance(environments, list):
+                    environments = [environments]
+                for environment in environments:
+                    key = (entry.get('project_name'), environment if isinstance(environment, str) else None)
+                    if key in seen and not error:
+                        error = ValueError(f"duplicate manifest entry for project '{key[0]}' in environment '{key[1]}'")
+                    seen.add(key)
+
+            if len(pending) >= max_workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                results.extend(future.result() for future in done)
+            pending.add(executor.submit(_run_entry, index, entry, process_fn, error))
+
+        done, _ = wait(pending)
+        results.extend(future.result() for future in done)
+
+    return sorted(results, key=lambda result: result['index'])
+
+def print_manifest_summary(results):
+    succeeded = [result for result in results if result['success']]
+    failed = [result for result in results if not result['success']]
+
+    print("\nManifest summary:")
+    for result in results:
+        status = "OK    " if result['success'] else "FAILED"
+        name = result['project_name'] or f"<entry {result['index']}>"
+        line = f"  {status} {name} ({result['environment']}) in {result['duration']:.1f}s"
+        if result['error']:
+            line += f": {result['error']}"
+        print(line)
+    print(f"{len(succeeded)} succeeded, {len(failed)} failed, {len(results)} total.")
@@ -0,0 +1,17 @@
+# Defaults shared by the command line and the client modules. This module imports
+# nothing, so reading them does not load any cloud SDK.
+DEFAULT_MAX_POOL_CONNECTIONS = 50
+DEFAULT_GITHUB_POOL_SIZE = 20
+# GitHub asks for no more than 80 content-creating requests per minute
+DEFAULT_GITHUB_WRITES_PER_MINUTE = 80
+DEFAULT_REAP_WORKERS = 8
+# Backends younger than this may belong to a run that is still in progress
+DEFAULT_REAP_MIN_AGE_HOURS = 24
+DEFAULT_SERVER_WORKERS = 4
+# Jobs waiting beyond this are refused, so clients back off instead of piling up
+DEFAULT_MAX_QUEUE = 100
+DEFAULT_LISTEN = '127.0.0.1:8080'
+# How Terraform state is locked: a DynamoDB table per backend, or S3 native
+# lockfiles, which need Terraform 1.11 or later
+STATE_LOCKING_MODES = ('dynamodb', 's3')
+S3_LOCKING_MIN_TERRAFORM_VERSION = (1, 11)
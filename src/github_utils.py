@@ -1,74 +1,358 @@
 import os
-from jinja2 import Environment, FileSystemLoader
-from github import Github, GithubException
+import random
+import threading
+import time
+from contextlib import contextmanager
+from github import Auth, Github, GithubException, GithubRetry, InputGitTreeElement, UnknownObjectException
 import subprocess
+from src.artifacts import artifact_text, index_info, make_artifact, write_artifacts, write_loose_objects
+from src.template_utils import render_template
+from src.tracing import span, record_span
+from src.defaults import DEFAULT_GITHUB_POOL_SIZE, DEFAULT_GITHUB_WRITES_PER_MINUTE
 
-def create_github_repo(project_name, github_token, environment):
-    g = Github(github_token)
-    user = g.get_user()
+# Point at a GitHub Enterprise Server or a local stand-in by setting GITHUB_API_URL
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', 'https://api.github.com')
 
-    try:
-        repo = user.create_repo(project_name, private=True, auto_init=True)
-        print(f"GitHub repository '{project_name}' created successfully.")
+GITHUB_WRITE_BURST = 10
+GITHUB_MAX_RETRIES = 6
+GITHUB_BACKOFF_JITTER = 1.0
+GITHUB_BACKOFF_MAX = 60
+RATE_LIMIT_RESERVE = 100
+
+_SAFE_METHODS = ('GET', 'HEAD')
+
+class GitHubThrottle:
+    # Shared by every thread in the process, since GitHub's rate limits apply to
+    # the token rather than to a connection. Writes are paced to the configured
+    # rate (after an initial burst), the remaining primary quota is spread evenly
+    # until its reset once it runs low, and a rate-limited response pauses all
+    # requests instead of only the one being retried.
+    def __init__(self, writes_per_minute=DEFAULT_GITHUB_WRITES_PER_MINUTE, write_burst=GITHUB_WRITE_BURST):
+        self._lock = threading.Lock()
+        # The sustained rate leaves room for the burst, so no 60-second window
+        # ever holds more than writes_per_minute writes
+        self._write_burst = min(write_burst, writes_per_minute // 4)
+        self._write_interval = 60.0 / (writes_per_minute - self._write_burst) if writes_per_minute else 0.0
+        self._next_write = 0.0
+        self._request_interval = 0.0
+        self._next_request = 0.0
+        self._paused_until = 0.0
+
+    def wait(self, write=False):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._paused_until, self._next_request)
+            if self._request_interval:
+                self._next_request = start + self._request_interval
+            if write and self._write_interval:
+                start = max(start, self._next_write - self._write_burst * self._write_interval)
+                self._next_write = max(self._next_write, start) + self._write_interval
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def observe(self, remaining, reset_time):
+        if remaining < 0:
+            return
+        until_reset = max(reset_time - time.time(), 0.0)
+        with self._lock:
+            if remaining == 0:
+                self._paused_until = max(self._paused_until, time.monotonic() + until_reset + 1)
+                self._request_interval = 0.0
+            elif remaining <= RATE_LIMIT_RESERVE:
+                self._request_interval = until_reset / remaining
+            else:
+                self._request_interval = 0.0
+
+def _rate_limit_pause(headers):
+    retry_after = headers.get('Retry-After')
+    if retry_after and retry_after.isdigit():
+        return float(retry_after)
+    reset = headers.get('X-RateLimit-Reset')
+    if headers.get('X-RateLimit-Remaining') == '0' and reset and reset.isdigit():
+        return max(int(reset) - time.time(), 0.0) + 1
+    return None
+
+class RateLimitRetry(GithubRetry):
+    # Retries with exponential backoff and jitter, shares every rate-limit
+    # backoff with the other threads through the throttle, and only repeats a
+    # write when a rate limit rejected it, as it then never took effect
+    def __init__(self, throttle=None, **kwargs):
+        self.throttle = throttle
+        kwargs['status_forcelist'] = kwargs.get('status_forcelist', list(range(500, 600))) + [429]
+        super().__init__(**kwargs)
+
+    def new(self, **kwargs):
+        kwargs['throttle'] = self.throttle
+        return super().new(**kwargs)
+
+    def get_backoff_time(self):
+        # Jitter and the cap are applied here rather than through urllib3's
+        # backoff_jitter and backoff_max, which urllib3 1.26 does not have
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return 0
+        return min(backoff + random.uniform(0, GITHUB_BACKOFF_JITTER), GITHUB_BACKOFF_MAX)
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method not in _SAFE_METHODS and status_code not in (403, 429):
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
 
-        # Get the default branch
-        default_branch = repo.default_branch
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if error is not None and method not in _SAFE_METHODS and not self._is_connection_error(error):
+            raise error
+        if response is not None and response.status in (403, 429) and self.throttle is not None:
+            pause = _rate_limit_pause(response.headers)
+            if pause:
+                self.throttle.pause(pause)
+        return super().increment(method, url, response, error, _pool, _stacktrace)
 
-        # Create a new branch for the environment
-        sb = repo.get_branch(default_branch)
-        repo.create_git_ref(ref=f"refs/heads/{environment}", sha=sb.commit.sha)
-        print(f"Created new branch '{environment}'.")
+# One client per token is shared by the whole process, so every thread reuses
+# its pooled keep-alive connections and goes through the same throttle. The
+# authenticated user and fetched repositories are kept as well: the user's login
+# is only looked up once, and repositories are re-read with conditional
+# (ETag) requests, whose 304 responses do not count against the rate limit.
+_client_lock = threading.Lock()
+_clients = {}
+_users = {}
+_logins = {}
+_login_lock = threading.Lock()
+_repos = {}
+_pool_size = DEFAULT_GITHUB_POOL_SIZE
+_throttle = GitHubThrottle()
 
-        # Set the new branch as the default
-        repo.edit(default_branch=environment)
-        print(f"Set '{environment}' as the default branch.")
+def configure_github_client(pool_size=DEFAULT_GITHUB_POOL_SIZE, writes_per_minute=DEFAULT_GITHUB_WRITES_PER_MINUTE):
+    global _pool_size, _throttle
+    with _client_lock:
+        _pool_size = pool_size
+        _throttle = GitHubThrottle(writes_per_minute)
+        _clients.clear()
+        _users.clear()
+        _logins.clear()
+        _repos.clear()
 
-        # Delete the old default branch
-        repo.get_git_ref(f"heads/{default_branch}").delete()
-        print(f"Deleted old default branch '{default_branch}'.")
+def get_github_client(github_token):
+    with _client_lock:
+        client = _clients.get(github_token)
+        if client is None:
+            client = Github(
+                auth=Auth.Token(github_token),
+                base_url=GITHUB_API_URL,
+                pool_size=_pool_size,
+                retry=RateLimitRetry(throttle=_throttle, total=GITHUB_MAX_RETRIES, backoff_factor=1, allowed_methods=None),
+                # Pacing is left to the shared throttle
+                seconds_between_requests=None,
+                seconds_between_writes=None,
+            )
+            _clients[github_token] = client
+    return client
 
+def clear_github_cache():
+    with _client_lock:
+        _clients.clear()
+        _users.clear()
+        _logins.clear()
+        _repos.clear()
+
+def _get_user(github_token):
+    client = get_github_client(github_token)
+    with _client_lock:
+        user = _users.get(github_token)
+        if user is None:
+            user = _users[github_token] = client.get_user()
+    return user
+
+def _get_login(github_token):
+    user = _get_user(github_token)
+    with _login_lock:
+        login = _logins.get(github_token)
+        if login is None:
+            with _api_call(user.requester, 'github.get_user'):
+                login = _logins[github_token] = user.login
+    return login
+
+@contextmanager
+def _api_call(requester, name, write=False, **args):
+    throttle = _throttle
+    start = time.time()
+    if throttle.wait(write) > 0:
+        record_span('github.throttle', 'github', start, time.time(), call=name)
+    with span(name, 'github', **args) as details:
+        yield details
+    throttle.observe(requester.rate_limiting[0], requester.rate_limiting_resettime)
+
+def create_github_repo(project_name, github_token):
+    user = _get_user(github_token)
+
+    try:
+        # auto_init gives the repository a first commit, which the Git Data API needs
+        with _api_call(user.requester, 'github.create_repo', write=True, repo=project_name):
+            repo = user.create_repo(project_name, private=True, auto_init=True)
+        with _client_lock:
+            _repos[(github_token, repo.full_name)] = repo
+        print(f"GitHub repository '{project_name}' created successfully.")
         return repo
     except GithubException as e:
         print(f"Error creating GitHub repository: {e}")
         return None
 
-def commit_and_push(repo, file_path, commit_message, content):
+def get_github_repo(full_name, github_token):
+    key = (github_token, full_name)
+    with _client_lock:
+        repo = _repos.get(key)
+
+    if repo is not None:
+        try:
+            with _api_call(repo.requester, 'github.get_repo', repo=full_name, conditional=True):
+                repo.update()
+            return repo
+        except UnknownObjectException:
+            with _client_lock:
+                _repos.pop(key, None)
+            raise
+
+    client = get_github_client(github_token)
+    with _api_call(client.requester, 'github.get_repo', repo=full_name):
+        repo = client.get_repo(full_name)
+    with _client_lock:
+        _repos[key] = repo
+    return repo
+
+def find_github_repo(project_name, github_token, full_name=None):
+    if not full_name:
+        full_name = f"{_get_login(github_token)}/{project_name}"
+    return get_github_repo(full_name, github_token)
+
+def github_repo_exists(project_name, github_token):
     try:
-        repo.create_file(file_path, commit_message, content)
-        print(f"File '{file_path}' committed and pushed successfully.")
-    except GithubException as e:
-        print(f"Error committing and pushing file: {e}")
+        find_github_repo(project_name, github_token)
+        return True
+    except UnknownObjectException:
+        return False
 
-def create_github_workflows(project_dir, environment, project_name, aws_region):
-    workflows_dir = os.path.join(project_dir, '.github', 'workflows')
-    os.makedirs(workflows_dir, exist_ok=True)
+def github_token_scopes(github_token):
+    # Classic tokens report their OAuth scopes on every response; fine-grained
+    # tokens and app tokens report none, and None is returned for them
+    _get_login(github_token)
+    return get_github_client(github_token).oauth_scopes
 
-    template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
-    jinja_env = Environment(loader=FileSystemLoader(template_dir))
+def _get_ref(repo, branch):
+    # get_git_ref is lazy; reading the target makes the request
+    with _api_call(repo.requester, 'github.get_git_ref', branch=branch):
+        ref = repo.get_git_ref(f"heads/{branch}")
+        ref.object
+    return ref
 
-    workflow_files = ['deploy.yml', 'destroy.yml']
+def _get_commit(repo, sha):
+    with _api_call(repo.requester, 'github.get_git_commit'):
+        return repo.get_git_commit(sha)
 
-    for file in workflow_files:
-        template = jinja_env.get_template(f'github_workflows/{file}.j2')
-        rendered_content = template.render(
-            environment=environment,
-            project_name=project_name,
-            aws_region=aws_region
-        )
+def _move_ref(ref, sha, force=False):
+    with _api_call(ref.requester, 'github.update_git_ref', write=True, ref=ref.ref):
+        ref.edit(sha, force=force)
 
-        with open(os.path.join(workflows_dir, file), 'w') as f:
-            f.write(rendered_content)
+def create_tree_commit(repo, files, commit_message, parent, uploaded=None):
+    # files are (path, artifact) pairs. Blob contents are sent inline with the
+    # tree, so the number of API calls does not grow with the number of files;
+    # blobs whose hash is in uploaded are already in the repository and are
+    # referenced by hash instead. Hashes sent are added to uploaded.
+    uploaded = set() if uploaded is None else uploaded
+    tree_elements = [
+        InputGitTreeElement(repo_path, artifact['mode'], 'blob', sha=artifact['sha']) if artifact['sha'] in uploaded else
+        InputGitTreeElement(repo_path, artifact['mode'], 'blob', content=artifact_text(artifact))
+        for repo_path, artifact in files
+    ]
+    with _api_call(repo.requester, 'github.create_git_tree', write=True, files=len(tree_elements)):
+        tree = repo.create_git_tree(tree_elements, base_tree=parent.tree)
+    uploaded.update(artifact['sha'] for _, artifact in files)
+    with _api_call(repo.requester, 'github.create_git_commit', write=True):
+        return repo.create_git_commit(commit_message, tree, [parent])
 
-    print(f"Created GitHub workflow files: {', '.join(workflow_files)}")
-    return [os.path.join(workflows_dir, file) for file in workflow_files]
+def find_changed_files(repo, branch, files):
+    # Compare the artifacts' blob hashes and modes against the branch's current
+    # tree, which takes two API calls however many files there are. Also
+    # returns the hashes of the blobs already in that tree.
+    ref = _get_ref(repo, branch)
+    with _api_call(repo.requester, 'github.get_git_tree', branch=branch):
+        tree = repo.get_git_tree(ref.object.sha, recursive=True)
+    current = {element.path: (element.sha, element.mode) for element in tree.tree if element.type == 'blob'}
+    changed = [
+        (repo_path, artifact) for repo_path, artifact in files
+        if current.get(repo_path) != (artifact['sha'], artifact['mode'])
+    ]
+    return ref, changed, {sha for sha, _ in current.values()}
 
-def delete_github_repo(repo_name, github_token):
-    g = Github(github_token)
-    user = g.get_user()
+def sync_github_repo(repo, branch, files, commit_message):
+    ref, changed, existing = find_changed_files(repo, branch, files)
+    if not changed:
+        print(f"'{repo.full_name}' ({branch}) is up to date.")
+        return []
+
+    parent = _get_commit(repo, ref.object.sha)
+    commit = create_tree_commit(repo, changed, commit_message, parent, existing)
+    _move_ref(ref, commit.sha)
+    print(f"Committed {len(changed)} changed files to '{repo.full_name}' ({branch}): {', '.join(path for path, _ in changed)}")
+    return [path for path, _ in changed]
+
+def bootstrap_github_repo(repo, branches, commit_message):
+    # branches maps each environment to its files, in order; the first becomes
+    # the default branch. Every environment gets its own commit built on top of
+    # the auto-init commit and its branch points straight at the result.
+    environments = list(branches)
+    default_branch = repo.default_branch
+    default_ref = _get_ref(repo, default_branch)
+    parent = _get_commit(repo, default_ref.object.sha)
+    if default_branch in branches and parent.message == commit_message and parent.parents:
+        # An earlier, interrupted run already switched the default branch; build
+        # on the commit it started from so no environment inherits another's files
+        parent = _get_commit(repo, parent.parents[0].sha)
 
+    # Files shared by several environments are uploaded with the first one only
+    commits = {}
+    uploaded = set()
+    for environment in environments:
+        files = branches[environment]
+        commit = create_tree_commit(repo, files, commit_message, parent, uploaded)
+        commits[environment] = commit
+
+        if environment == default_branch:
+            _move_ref(default_ref, commit.sha, force=True)
+            print(f"Committed {len(files)} files to '{environment}' in a single commit.")
+            continue
+        try:
+            with _api_call(repo.requester, 'github.create_git_ref', write=True, branch=environment):
+                repo.create_git_ref(ref=f"refs/heads/{environment}", sha=commit.sha)
+        except GithubException as e:
+            if e.status != 422:
+                raise
+            # The branch was left behind by an interrupted run
+            _move_ref(_get_ref(repo, environment), commit.sha, force=True)
+        print(f"Committed {len(files)} files to new branch '{environment}' in a single commit.")
+
+    if default_branch not in branches:
+        # Set the first environment's branch as the default and delete the old default branch
+        with _api_call(repo.requester, 'github.edit_repo', write=True):
+            repo.edit(default_branch=environments[0])
+        with _api_call(repo.requester, 'github.delete_git_ref', write=True, branch=default_branch):
+            default_ref.delete()
+        print(f"Set '{environments[0]}' as the default branch and deleted '{default_branch}'.")
+    return commits
+
+def delete_github_repo(repo_name, github_token):
     try:
-        repo = user.get_repo(repo_name)
-        repo.delete()
+        # The login is only fetched once per process; the repository needs no read before the delete
+        full_name = f"{_get_login(github_token)}/{repo_name}"
+        repo = get_github_client(github_token).get_repo(full_name, lazy=True)
+        with _api_call(repo.requester, 'github.delete_repo', write=True, repo=repo_name):
+            repo.delete()
+        with _client_lock:
+            _repos.pop((github_token, full_name), None)
         print(f"GitHub repository '{repo_name}' deleted successfully.")
         return True
     except GithubException as e:
@@ -78,40 +362,109 @@ def delete_github_repo(repo_name, github_token):
             print(f"Error deleting GitHub repository '{repo_name}': {e}")
         return False
 
-def init_local_repo_and_push(project_dir, repo_url, environment):
+def list_github_branches(repo_name, github_token):
+    # One request for a repository with up to 30 branches; raises
+    # UnknownObjectException when the repository does not exist
+    full_name = f"{_get_login(github_token)}/{repo_name}"
+    repo = get_github_client(github_token).get_repo(full_name, lazy=True)
+    with _api_call(repo.requester, 'github.get_branches', repo=repo_name):
+        return [branch.name for branch in repo.get_branches()]
+
+def delete_github_branches(repo_name, github_token, branches, default_branch):
+    # Deletes the branches of some environments while the repository stays in
+    # use by others, moving the default to default_branch first if needed
     try:
-        # Create .gitignore file from template
-        template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
-        jinja_env = Environment(loader=FileSystemLoader(template_dir))
-        gitignore_template = jinja_env.get_template('.gitignore.j2')
-        gitignore_content = gitignore_template.render()
-
-        with open(os.path.join(project_dir, '.gitignore'), 'w') as f:
-            f.write(gitignore_content)
-        print("Created .gitignore file from template.")
-
-        # Initialize local Git repository
-        subprocess.run(['git', 'init'], cwd=project_dir, check=True)
-        print("Initialized local Git repository.")
+        repo = get_github_repo(f"{_get_login(github_token)}/{repo_name}", github_token)
+        if repo.default_branch in branches:
+            with _api_call(repo.requester, 'github.edit_repo', write=True):
+                repo.edit(default_branch=default_branch)
+            print(f"Set '{default_branch}' as the default branch of GitHub repository '{repo_name}'.")
+        for branch in branches:
+            try:
+                ref = _get_ref(repo, branch)
+            except UnknownObjectException:
+                print(f"Branch '{branch}' not found in GitHub repository '{repo_name}'.")
+                continue
+            with _api_call(repo.requester, 'github.delete_git_ref', write=True, branch=branch):
+                ref.delete()
+            print(f"Deleted branch '{branch}' from GitHub repository '{repo_name}'.")
+        return True
+    except GithubException as e:
+        print(f"Error deleting branches from GitHub repository '{repo_name}': {e}")
+        return False
 
-        # Add all files (including .gitignore) to staging
-        subprocess.run(['git', 'add', '.'], cwd=project_dir, check=True)
-        print("Added all files (including .gitignore) to staging.")
+def _run_git(args, project_dir, check=True, **kwargs):
+    with span(f"git {args[0]}", 'git'):
+        return subprocess.run(['git'] + args, cwd=project_dir, check=check, **kwargs)
 
-        # Commit changes
-        subprocess.run(['git', 'commit', '-m', f"Initial commit for {environment} environment"], cwd=project_dir, check=True)
-        print(f"Committed changes for {environment} environment, including .gitignore.")
+def _git_output(args, project_dir, **kwargs):
+    return _run_git(args, project_dir, capture_output=True, text=True, **kwargs).stdout
 
-        # Add remote
-        subprocess.run(['git', 'remote', 'add', 'origin', repo_url], cwd=project_dir, check=True)
+def init_local_repo_and_push(project_dir, repo_url, environment, files):
+    # files is the environment's artifact tree, already written to project_dir.
+    # The local commit is built from it directly: blobs are stored as loose
+    # objects under their known hashes and the tree is assembled in the index
+    # on top of the fetched branch, so git never reads or hashes the files
+    # again. If the branch on GitHub already has every file, nothing is
+    # committed or pushed.
+    try:
+        # Add the .gitignore from the template unless the project files already include it
+        if '.gitignore' not in files:
+            gitignore = {'.gitignore': make_artifact('.gitignore', render_template('.gitignore.j2'))}
+            write_artifacts(project_dir, gitignore)
+            files = dict(files, **gitignore)
+            print("Created .gitignore file from template.")
+
+        # Initialize local Git repository, on the environment's branch unless an earlier run already did
+        reinit = os.path.isdir(os.path.join(project_dir, '.git'))
+        _run_git(['init'] if reinit else ['init', f"--initial-branch={environment}"], project_dir)
+        print("Initialized local Git repository.")
+
+        # Add remote, or point an existing one from an earlier run at the repository
+        has_origin = _run_git(['remote', 'get-url', 'origin'], project_dir, check=False, capture_output=True).returncode == 0
+        _run_git(['remote', 'set-url' if has_origin else 'add', 'origin', repo_url], project_dir)
         print(f"Added remote: {repo_url}")
 
-        # Fetch the remote
-        subprocess.run(['git', 'fetch'], cwd=project_dir, check=True)
+        # Fetch the bootstrap commit and build on top of it so the push is a fast-forward
+        _run_git(['fetch', 'origin', environment], project_dir)
+        remote = {}
+        for entry in _git_output(['ls-tree', '-r', '-z', 'FETCH_HEAD'], project_dir).split('\0'):
+            if entry:
+                info, _, path = entry.partition('\t')
+                mode, _, sha = info.split(' ')
+                remote[path] = (mode, sha)
+        changed = sorted(path for path, artifact in files.items() if remote.get(path) != (artifact['mode'], artifact['sha']))
+
+        # The index starts from the fetched tree. Files of the branch that were
+        # not generated (such as the initial README) are checked out; the
+        # generated ones are already in place.
+        _run_git(['read-tree', 'FETCH_HEAD'], project_dir)
+        missing = [path for path in remote if path not in files and not os.path.exists(os.path.join(project_dir, path))]
+        if missing:
+            _run_git(['checkout-index', '--'] + missing, project_dir)
 
-        # Push to remote, setting upstream branch
-        subprocess.run(['git', 'push', '-u', 'origin', f"HEAD:{environment}"], cwd=project_dir, check=True)
-        print(f"Pushed to '{environment}' branch in remote repository, including .gitignore.")
+        if changed:
+            changed_files = {path: files[path] for path in changed}
+            write_loose_objects(os.path.join(project_dir, '.git'), changed_files)
+            _run_git(['update-index', '--index-info'], project_dir, input=index_info(changed_files), text=True)
+            tree = _git_output(['write-tree'], project_dir).strip()
+            commit = _git_output(['commit-tree', tree, '-p', 'FETCH_HEAD', '-m', f"Initial commit for {environment} environment"], project_dir).strip()
+            print(f"Committed {len(changed)} changed files for {environment} environment: {', '.join(changed)}")
+        else:
+            commit = 'FETCH_HEAD'
+        _run_git(['update-ref', f"refs/heads/{environment}", commit], project_dir)
+        with open(os.path.join(project_dir, '.git', 'HEAD'), 'r') as f:
+            on_branch = f.read().strip() == f"ref: refs/heads/{environment}"
+        if not on_branch:
+            _run_git(['symbolic-ref', 'HEAD', f"refs/heads/{environment}"], project_dir)
+
+        if changed:
+            # Push to remote, setting upstream branch
+            _run_git(['push', '-u', 'origin', environment], project_dir)
+            print(f"Pushed to '{environment}' branch in remote repository, including .gitignore.")
+        else:
+            _run_git(['branch', f"--set-upstream-to=origin/{environment}", environment], project_dir, capture_output=True)
+            print(f"The '{environment}' branch on GitHub already has every file; nothing to push.")
 
         return True
     except subprocess.CalledProcessError as e:
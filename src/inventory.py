@@ -0,0 +1,127 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+DEFAULT_INVENTORY_PATH = os.environ.get(
+    'PROJECT_FACTORY_INVENTORY',
+    os.path.join(os.path.expanduser('~'), '.project-factory', 'inventory.db')
+)
+
+S3_BUCKET = 's3_bucket'
+DYNAMODB_TABLE = 'dynamodb_table'
+GITHUB_REPO = 'github_repo'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS resources (
+    project_name TEXT NOT NULL,
+    environment TEXT NOT NULL,
+    resource_type TEXT NOT NULL,
+    resource_name TEXT NOT NULL,
+    region TEXT,
+    url TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (project_name, environment, resource_type, resource_name)
+);
+CREATE INDEX IF NOT EXISTS resources_by_name ON resources (resource_type, resource_name);
+"""
+
+_inventory_path = DEFAULT_INVENTORY_PATH
+_initialized = set()
+_init_lock = threading.Lock()
+
+def configure_inventory(path):
+    global _inventory_path
+    _inventory_path = path
+
+def _connect():
+    path = _inventory_path
+    with _init_lock:
+        if path not in _initialized:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(_SCHEMA)
+            conn.close()
+            _initialized.add(path)
+
+    # A connection per call keeps the inventory safe to use from any thread
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+def record_resource(project_name, environment, resource_type, resource_name, region=None, url=None):
+    now = _now()
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO resources (project_name, environment, resource_type, resource_name, region, url, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (project_name, environment, resource_type, resource_name)
+                DO UPDATE SET region = excluded.region, url = excluded.url, updated_at = excluded.updated_at
+                """,
+                (project_name, environment, resource_type, resource_name, region, url, now, now)
+            )
+    finally:
+        conn.close()
+
+def remove_resource(project_name, environment, resource_type, resource_name):
+    conn = _connect()
+    try:
+        with conn:
+            conn.execute(
+                "DELETE FROM resources WHERE project_name = ? AND environment = ? AND resource_type = ? AND resource_name = ?",
+                (project_name, environment, resource_type, resource_name)
+            )
+    finally:
+        conn.close()
+
+def remove_resources(project_name, environment, resource_types):
+    conn = _connect()
+    try:
+        with conn:
+            conn.executemany(
+                "DELETE FROM resources WHERE project_name = ? AND environment = ? AND resource_type = ?",
+                [(project_name, environment, resource_type) for resource_type in resource_types]
+            )
+    finally:
+        conn.close()
+
+def lookup_resources(project_name=None, environment=None, resource_type=None):
+    clauses = []
+    params = []
+    for column, value in (('project_name', project_name), ('environment', environment), ('resource_type', resource_type)):
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            f"SELECT * FROM resources {where} ORDER BY project_name, environment, resource_type, resource_name",
+            params
+        ).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+def lookup_resource_names(project_name, environment, resource_type):
+    return [row['resource_name'] for row in lookup_resources(project_name, environment, resource_type)]
+
+def print_inventory(rows):
+    if not rows:
+        print(f"No resources recorded in {_inventory_path}.")
+        return
+
+    print(f"{'PROJECT':<28} {'ENVIRONMENT':<12} {'TYPE':<15} {'REGION':<14} {'CREATED':<26} NAME")
+    for row in rows:
+        name = row['url'] or row['resource_name']
+        print(f"{row['project_name']:<28} {row['environment']:<12} {row['resource_type']:<15} {row['region'] or '-':<14} {row['created_at']:<26} {name}")
@@ -0,0 +1,44 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+JOURNAL_DIR = '.project-factory'
+
+_journal_lock = threading.Lock()
+
+def journal_path(working_dir, project_name, environment):
+    return os.path.join(working_dir, JOURNAL_DIR, f"{project_name}-{environment}.journal.json")
+
+def _read(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'steps': {}}
+
+# Returns the recorded output of every completed step, keyed by step name
+def load_journal(path):
+    with _journal_lock:
+        steps = _read(path)['steps']
+    return {name: step['output'] for name, step in steps.items()}
+
+def record_step(path, step, output):
+    with _journal_lock:
+        journal = _read(path)
+        journal['steps'][step] = {
+            'output': output,
+            'completed_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        }
+
+        # Write to a temporary file first so a crash never leaves a truncated journal
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(journal, f, indent=2)
+        os.replace(tmp_path, path)
+
+def remove_journal(path):
+    with _journal_lock:
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from src.aws_utils import (get_aws_session, get_aws_client, list_matching_s3_buckets, set_state_locking_tag,
+                           delete_lock_tables, DEFAULT_TABLE_WORKERS)
+from src.inventory import DYNAMODB_TABLE, remove_resource
+from src.tracing import span, submit_in_context
+
+# Moves backends whose projects already use S3 native locking off their lock
+# tables. Each target is a dict with project_name, environment, aws_sso_profile,
+# aws_region, lock_table and bucket_names (None to look the buckets up).
+
+def _tag_buckets(s3_client, target):
+    bucket_names = target['bucket_names']
+    if bucket_names is None:
+        bucket_names = list_matching_s3_buckets(s3_client, target['project_name'], target['environment'])
+    if not bucket_names:
+        return False, 'no state bucket found'
+    try:
+        for bucket_name in bucket_names:
+            set_state_locking_tag(s3_client, bucket_name, 's3')
+    except ClientError as e:
+        return False, f"could not tag '{bucket_name}': {e.response['Error']['Code']}"
+    return True, ', '.join(bucket_names)
+
+def migrate_lock_tables(targets, dry_run=False, max_workers=DEFAULT_TABLE_WORKERS):
+    # Buckets are tagged first, so the audit and the reaper know the backend no
+    # longer has a table; only then are the tables deleted, per account and in bulk
+    groups = {}
+    for target in targets:
+        groups.setdefault((target['aws_sso_profile'], target['aws_region']), []).append(target)
+
+    outcomes = []
+    for (profile, region), group in groups.items():
+        session = get_aws_session(profile, region)
+        s3_client = get_aws_client(session, 's3')
+        dynamodb_client = get_aws_client(session, 'dynamodb')
+        if dry_run:
+            for target in group:
+                print(f"  would migrate {target['project_name']} ({target['environment']}): delete '{target['lock_table']}' in {region}")
+            outcomes += [True] * len(group)
+            continue
+
+        with span('tag_buckets', 'step', region=region, backends=len(group)):
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [submit_in_context(executor, _tag_buckets, s3_client, target) for target in group]
+                tagged = [future.result() for future in futures]
+        ready = [target for target, (ok, _) in zip(group, tagged) if ok]
+        for target, (ok, detail) in zip(group, tagged):
+            if not ok:
+                print(f"  FAILED {target['project_name']} ({target['environment']}): {detail}; its lock table is kept")
+
+        with span('delete_lock_tables', 'step', region=region, tables=len(ready)):
+            deleted = delete_lock_tables(dynamodb_client, [target['lock_table'] for target in ready], max_workers)
+        for target in ready:
+            ok, detail = deleted[target['lock_table']]
+            if ok:
+                remove_resource(target['project_name'], target['environment'], DYNAMODB_TABLE, target['lock_table'])
+            print(f"  {'OK    ' if ok else 'FAILED'} {target['project_name']} ({target['environment']}): lock table '{target['lock_table']}' {detail}")
+        outcomes += [False] * (len(group) - len(ready)) + [deleted[target['lock_table']][0] for target in ready]
+
+    failed = outcomes.count(False)
+    verb = 'would be migrated' if dry_run else 'migrated'
+    print(f"{len(outcomes) - failed} of {len(outcomes)} backends {verb} to S3 native locking, {failed} failed.")
+    return not failed
@@ -0,0 +1,183 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from botocore.exceptions import BotoCoreError, ClientError
+from src.audit import LOCK_TABLE_SUFFIX, find_lock_tables
+from src.aws_utils import get_aws_session, get_aws_client
+from src.github_utils import github_repo_exists, github_token_scopes
+from src.journal import journal_path, load_journal
+from src.regions import state_region
+from src.secrets_manager import get_secrets
+from src.template_utils import TEMPLATE_DIR
+from src.tracing import span, submit_in_context
+
+DEFAULT_PREFLIGHT_WORKERS = 32
+# Checks are read-only lookups; anything still unanswered by then is reported as failed
+DEFAULT_PREFLIGHT_TIMEOUT = 15
+REQUIRED_SCOPES = {
+    'provision': ('repo',),
+    'sync': ('repo',),
+    'destroy': ('repo', 'delete_repo'),
+}
+
+def _error_detail(e):
+    if isinstance(e, ClientError):
+        error = e.response.get('Error', {})
+        return f"{error.get('Code')}: {error.get('Message')}"
+    return str(e)
+
+def check_secrets(config):
+    try:
+        get_secrets(config)
+    except ValueError as e:
+        return {'ok': False, 'detail': str(e)}
+    except OSError as e:
+        return {'ok': False, 'detail': f"could not run the 1Password CLI: {e}"}
+    return {'ok': True, 'detail': f"1Password item '{config['onepassword_item']}' has a GitHub token"}
+
+def check_aws_identity(profile, region):
+    try:
+        identity = get_aws_client(get_aws_session(profile, region), 'sts').get_caller_identity()
+    except (BotoCoreError, ClientError) as e:
+        return {'ok': False, 'detail': f"no valid credentials for profile '{profile}' ({_error_detail(e)}); run `aws sso login --profile {profile}`"}
+    return {'ok': True, 'detail': f"signed in as {identity['Arn']}"}
+
+def list_lock_tables(profile, region):
+    return find_lock_tables(get_aws_client(get_aws_session(profile, region), 'dynamodb'))
+
+def check_table_free(tables_future, table_name):
+    try:
+        tables = tables_future.result()
+    except (BotoCoreError, ClientError) as e:
+        return {'ok': False, 'detail': f"could not list DynamoDB tables: {_error_detail(e)}"}
+    if table_name in tables:
+        return {'ok': False, 'detail': f"DynamoDB table '{table_name}' already exists"}
+    return {'ok': True, 'detail': f"DynamoDB table '{table_name}' does not exist yet"}
+
+def check_token_scopes(config, action):
+    try:
+        scopes = github_token_scopes(get_secrets(config)['github_token'])
+    except ValueError as e:
+        return {'ok': False, 'detail': f"no GitHub token: {e}"}
+    except Exception as e:
+        return {'ok': False, 'detail': f"GitHub rejected the token: {e}"}
+    if scopes is None:
+        return {'ok': True, 'detail': 'token does not report OAuth scopes (fine-grained or app token)'}
+    missing = [scope for scope in REQUIRED_SCOPES[action] if scope not in scopes]
+    if missing:
+        return {'ok': False, 'detail': f"token is missing the {', '.join(missing)} scope{'s' if len(missing) > 1 else ''} (has: {', '.join(scopes) or 'none'})"}
+    return {'ok': True, 'detail': f"token has the {', '.join(REQUIRED_SCOPES[action])} scopes"}
+
+def check_repo_free(config):
+    try:
+        exists = github_repo_exists(config['project_name'], get_secrets(config)['github_token'])
+    except ValueError as e:
+        return {'ok': False, 'detail': f"no GitHub token: {e}"}
+    except Exception as e:
+        return {'ok': False, 'detail': f"could not look up the repository: {e}"}
+    if exists:
+        return {'ok': False, 'detail': f"GitHub repository '{config['project_name']}' already exists"}
+    return {'ok': True, 'detail': f"GitHub repository name '{config['project_name']}' is free"}
+
+def check_tfvars_template(environment):
+    template = os.path.join('vars', f"{environment}.tfvars.j2")
+    if not os.path.isfile(os.path.join(TEMPLATE_DIR, template)):
+        return {'ok': False, 'detail': f"no template templates/{template} for environment '{environment}'"}
+    return {'ok': True, 'detail': f"templates/{template} exists"}
+
+def check_working_dir(working_dir):
+    # The directory is created on demand, so the nearest existing parent has to be writable
+    path = os.path.abspath(working_dir)
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    if not os.path.isdir(path):
+        return {'ok': False, 'detail': f"'{path}' is not a directory"}
+    if not os.access(path, os.W_OK | os.X_OK):
+        return {'ok': False, 'detail': f"'{path}' is not writable"}
+    return {'ok': True, 'detail': f"'{working_dir}' is writable"}
+
+def _environments(config):
+    environments = config['environment']
+    return [environments] if isinstance(environments, str) else list(environments)
+
+def _completed_steps(config, environment):
+    return load_journal(journal_path(config['working_dir'], config['project_name'], environment))
+
+def plan_checks(configs, action):
+    # Returns {(check, subject): (function, args)} and, for every config, the
+    # checks it depends on. Checks shared by several projects (a 1Password item,
+    # an AWS account, a token) are planned once. Steps an interrupted run already
+    # completed are not checked again: their table or repository is expected.
+    planned = {}
+    needs = []
+    for config in configs:
+        keys = []
+        def need(key, function, *args):
+            planned.setdefault(key, (function, args))
+            keys.append(key)
+
+        profile, region = config['aws_sso_profile'], config['aws_region']
+        item = f"{config['onepassword_vault']}/{config['onepassword_item']}"
+        need(('1password item', item), check_secrets, config)
+        need(('github token scopes', item), check_token_scopes, config, action)
+        if action != 'sync':
+            need(('aws credentials', f"{profile} ({region})"), check_aws_identity, profile, region)
+        if action == 'provision':
+            environments = _environments(config)
+            completed = {environment: _completed_steps(config, environment) for environment in environments}
+            if not any('github_repo' in steps for steps in completed.values()):
+                need(('github repository free', config['project_name']), check_repo_free, config)
+            for environment in environments:
+                table_name = f"{config['project_name']}-{environment}{LOCK_TABLE_SUFFIX}"
+                # Once the state bucket is recorded, an existing table is the
+                # one an interrupted run was still waiting for
+                if not {'dynamodb_table', 's3_bucket'} & set(completed[environment]) and config.get('state_locking') != 's3':
+                    tables = ('lock tables', profile, state_region(config, environment))
+                    need(('dynamodb table free', table_name), check_table_free, tables, table_name)
+                need(('tfvars template', environment), check_tfvars_template, environment)
+            need(('working_dir writable', config['working_dir']), check_working_dir, config['working_dir'])
+        needs.append(keys)
+    return planned, needs
+
+def run_preflight(configs, action, max_workers=DEFAULT_PREFLIGHT_WORKERS, timeout=DEFAULT_PREFLIGHT_TIMEOUT):
+    # Runs every check concurrently; returns {(check, subject): result}, the
+    # keys each config depends on and the time taken
+    planned, needs = plan_checks(configs, action)
+    start = time.monotonic()
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='preflight')
+    listings, futures = {}, {}
+    try:
+        with span('preflight', 'step', checks=len(planned)):
+            # The lock tables of an account are listed once, for every project in it
+            for function, args in planned.values():
+                if function is check_table_free and args[0] not in listings:
+                    listings[args[0]] = submit_in_context(executor, list_lock_tables, *args[0][1:])
+            for key, (function, args) in planned.items():
+                if function is check_table_free:
+                    args = (listings[args[0]],) + args[1:]
+                futures[key] = submit_in_context(executor, function, *args)
+            wait(futures.values(), timeout=max(0.0, timeout - (time.monotonic() - start)))
+    finally:
+        # Checks still queued are dropped rather than run after the deadline;
+        # cancelling by hand keeps this working on Python 3.8
+        for future in list(listings.values()) + list(futures.values()):
+            future.cancel()
+        executor.shutdown(wait=False)
+
+    results = {}
+    for key, future in futures.items():
+        if future.cancelled() or not future.done():
+            results[key] = {'ok': False, 'detail': f"no answer within {timeout:g}s"}
+        elif future.exception():
+            results[key] = {'ok': False, 'detail': f"check failed: {future.exception()}"}
+        else:
+            results[key] = future.result()
+    return results, needs, time.monotonic() - start
+
+def print_preflight_summary(results, needs, configs, duration):
+    failed = {key: result for key, result in results.items() if not result['ok']}
+    for (check, subject), result in sorted(failed.items()):
+        print(f"  FAILED {check} ({subject}): {result['detail']}")
+    blocked = [config['project_name'] for config, keys in zip(configs, needs) if any(key in failed for key in keys)]
+    print(f"Preflight: {len(results) - len(failed)} of {len(results)} checks passed in {duration:.2f}s"
+          + (f"; {len(blocked)} of {len(configs)} projects blocked: {', '.join(blocked[:10])}{' ...' if len(blocked) > 10 else ''}" if blocked else '.'))
@@ -0,0 +1,166 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from botocore.exceptions import ClientError
+from src.audit import BACKEND_BUCKET_PATTERN, LOCK_TABLE_SUFFIX, find_backend_buckets, find_lock_tables
+from src.aws_utils import STATE_LOCKING_TAG, BACKEND_ROLE_TAG, get_aws_session, get_aws_client, delete_s3_bucket
+from src.inventory import S3_BUCKET, DYNAMODB_TABLE, lookup_resources, remove_resource
+from src.tracing import span, submit_in_context
+from src.defaults import DEFAULT_REAP_WORKERS, DEFAULT_REAP_MIN_AGE_HOURS
+
+def list_backend_buckets(s3_client, region):
+    # ListBuckets filtered to the region returns creation dates as well, so no
+    # per-bucket call is needed to find or age the candidates
+    buckets = {}
+    paginator = s3_client.get_paginator('list_buckets')
+    for page in paginator.paginate(BucketRegion=region, PaginationConfig={'PageSize': 1000}):
+        for bucket in page.get('Buckets', []):
+            if BACKEND_BUCKET_PATTERN.fullmatch(bucket['Name']):
+                buckets[bucket['Name']] = bucket.get('CreationDate')
+    return buckets
+
+def _bucket_has_objects(s3_client, bucket_name):
+    page = s3_client.list_object_versions(Bucket=bucket_name, MaxKeys=1)
+    return bool(page.get('Versions') or page.get('DeleteMarkers'))
+
+def _table_created(dynamodb_client, table_name):
+    return dynamodb_client.describe_table(TableName=table_name)['Table'].get('CreationDateTime')
+
+def find_orphans(s3_client, dynamodb_client, tagging_client, region, repo_exists=None):
+    # Returns {(resource_type, name): reason} for buckets and lock tables that
+    # have lost their partner, were superseded by a rerun, or belong to a
+    # project without a GitHub repository (when repo_exists is given). Tags tell
+    # which buckets use S3 native locking or are replicas, and so have no table
+    # by design.
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        buckets_future = submit_in_context(executor, list_backend_buckets, s3_client, region)
+        tables_future = submit_in_context(executor, find_lock_tables, dynamodb_client)
+        tags_future = submit_in_context(executor, find_backend_buckets, tagging_client)
+        buckets = buckets_future.result()
+        tables = tables_future.result()
+        tags = tags_future.result()
+    s3_locked = {bucket_name for bucket_name, bucket_tags in tags.items() if bucket_tags.get(STATE_LOCKING_TAG) == 's3'}
+    replicas = {bucket_name for bucket_name, bucket_tags in tags.items() if bucket_tags.get(BACKEND_ROLE_TAG) == 'replica'}
+
+    recorded = {row['resource_name']: row for row in lookup_resources(resource_type=S3_BUCKET)}
+    prefixes = {}
+    for bucket_name in buckets:
+        prefixes.setdefault(BACKEND_BUCKET_PATTERN.fullmatch(bucket_name).group('prefix'), []).append(bucket_name)
+
+    # Repository lookups are made once per project, concurrently
+    projects = {}
+    for prefix, bucket_names in prefixes.items():
+        names = {tags.get(bucket_name, {}).get('Project') or (recorded[bucket_name]['project_name'] if bucket_name in recorded else None)
+                 for bucket_name in bucket_names} - {None}
+        if len(names) == 1:
+            projects[prefix] = names.pop()
+    missing_repos = set()
+    if repo_exists and projects:
+        distinct = sorted(set(projects.values()))
+        with ThreadPoolExecutor(max_workers=DEFAULT_REAP_WORKERS) as executor:
+            exists = [future.result() for future in [submit_in_context(executor, repo_exists, project) for project in distinct]]
+        missing_repos = {project for project, found in zip(distinct, exists) if not found}
+
+    orphans = {}
+    for prefix, bucket_names in prefixes.items():
+        table_name = f"{prefix}{LOCK_TABLE_SUFFIX}"
+        if projects.get(prefix) in missing_repos:
+            for resource in [(S3_BUCKET, bucket_name) for bucket_name in bucket_names] + [(DYNAMODB_TABLE, table_name)]:
+                if resource[0] == S3_BUCKET or table_name in tables:
+                    orphans[resource] = f"no GitHub repository for project '{projects[prefix]}'"
+            continue
+        if table_name not in tables:
+            for bucket_name in bucket_names:
+                if bucket_name not in s3_locked | replicas:
+                    orphans[(S3_BUCKET, bucket_name)] = f"no lock table '{table_name}'"
+            continue
+        # Reruns before the journal existed left a new bucket behind each time;
+        # only the one recorded in the inventory is in use
+        in_use = [bucket_name for bucket_name in bucket_names if bucket_name in recorded]
+        if len(bucket_names) > 1 and len(in_use) == 1:
+            for bucket_name in bucket_names:
+                if bucket_name != in_use[0]:
+                    orphans[(S3_BUCKET, bucket_name)] = f"superseded by '{in_use[0]}'"
+
+    for table_name in tables:
+        bucket_names = prefixes.get(table_name[:-len(LOCK_TABLE_SUFFIX)])
+        if not bucket_names:
+            orphans[(DYNAMODB_TABLE, table_name)] = 'no state bucket'
+        elif all(bucket_name in s3_locked for bucket_name in bucket_names):
+            orphans.setdefault((DYNAMODB_TABLE, table_name), 'state bucket uses S3 native locking')
+    return orphans, buckets
+
+def _remove_from_inventory(resource_type, name):
+    for row in lookup_resources(resource_type=resource_type):
+        if row['resource_name'] == name:
+            remove_resource(row['project_name'], row['environment'], resource_type, name)
+
+def _reap(s3_client, dynamodb_client, resource_type, name):
+    if resource_type == S3_BUCKET:
+        success = delete_s3_bucket(s3_client, name)
+    else:
+        try:
+            dynamodb_client.delete_table(TableName=name)
+            print(f"DynamoDB table '{name}' deletion initiated.")
+            success = True
+        except ClientError as e:
+            success = e.response['Error']['Code'] == 'ResourceNotFoundException'
+            if not success:
+                print(f"Error deleting DynamoDB table '{name}': {e}")
+    if success:
+        _remove_from_inventory(resource_type, name)
+    return success
+
+def reap_orphans(aws_sso_profile, region, dry_run=True, max_workers=DEFAULT_REAP_WORKERS,
+                 min_age_hours=DEFAULT_REAP_MIN_AGE_HOURS, include_non_empty=False, repo_exists=None):
+    session = get_aws_session(aws_sso_profile, region)
+    s3_client = get_aws_client(session, 's3')
+    dynamodb_client = get_aws_client(session, 'dynamodb')
+    tagging_client = get_aws_client(session, 'resourcegroupstaggingapi')
+
+    with span('find_orphans', 'step'):
+        orphans, bucket_dates = find_orphans(s3_client, dynamodb_client, tagging_client, region, repo_exists)
+
+    # Ages and bucket contents are looked up concurrently, for candidates only
+    with span('inspect_orphans', 'step', candidates=len(orphans)):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            created = {resource: submit_in_context(executor, _table_created, dynamodb_client, resource[1])
+                       for resource in orphans if resource[0] == DYNAMODB_TABLE}
+            contents = {resource: submit_in_context(executor, _bucket_has_objects, s3_client, resource[1])
+                        for resource in orphans if resource[0] == S3_BUCKET}
+            candidates = []
+            cutoff = datetime.now(timezone.utc) - timedelta(hours=min_age_hours)
+            for resource, reason in sorted(orphans.items(), key=lambda item: item[0][1]):
+                resource_type, name = resource
+                try:
+                    created_at = bucket_dates[name] if resource_type == S3_BUCKET else created[resource].result()
+                    has_objects = contents[resource].result() if resource_type == S3_BUCKET else False
+                except ClientError as e:
+                    candidates.append({'type': resource_type, 'name': name, 'reason': reason, 'created': None,
+                                       'skipped': f"could not be inspected: {e.response['Error']['Code']}"})
+                    continue
+                skipped = None
+                if created_at is not None and created_at > cutoff:
+                    skipped = f"younger than {min_age_hours:g} hours"
+                elif has_objects and not include_non_empty:
+                    skipped = 'bucket is not empty'
+                candidates.append({'type': resource_type, 'name': name, 'reason': reason,
+                                   'created': created_at.isoformat() if created_at else None, 'skipped': skipped})
+
+    to_reap = [candidate for candidate in candidates if not candidate['skipped']]
+    for candidate in candidates:
+        action = f"skip ({candidate['skipped']})" if candidate['skipped'] else 'would delete' if dry_run else 'delete'
+        print(f"  {action:<36} {candidate['type']:<15} {candidate['name']}: {candidate['reason']}")
+
+    if not dry_run and to_reap:
+        with span('reap', 'step', resources=len(to_reap)):
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [submit_in_context(executor, _reap, s3_client, dynamodb_client, candidate['type'], candidate['name'])
+                           for candidate in to_reap]
+                for candidate, future in zip(to_reap, futures):
+                    candidate['deleted'] = future.result()
+
+    failed = [candidate for candidate in to_reap if candidate.get('deleted') is False]
+    verb = 'would be deleted' if dry_run else 'deleted'
+    print(f"{len(candidates)} orphaned resources found in {region}: {len(to_reap) - len(failed)} {verb}, "
+          f"{len(candidates) - len(to_reap)} skipped, {len(failed)} failed.")
+    return not failed
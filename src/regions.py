@@ -0,0 +1,29 @@
+import re
+
+# A project keeps its Terraform backend in aws_region and, optionally, in the
+# further 'backend_regions'. Each environment runs in its 'environment_regions'
+# entry (aws_region by default) and keeps its state in the backend region
+# nearest to it; the environment's buckets in the other regions are replicas.
+REGION_PATTERN = re.compile(r'[a-z]{2}(-[a-z]+)+-\d+')
+
+def nearest_region(region, candidates):
+    # The same region, else one in the same area (us, eu, ap ...) and, within
+    # it, the same part (us-east, eu-west ...); ties go to the earlier candidate
+    parts = region.split('-')
+    def closeness(candidate):
+        candidate_parts = candidate.split('-')
+        return (candidate == region, candidate_parts[0] == parts[0], candidate_parts[:-1] == parts[:-1])
+    return max(candidates, key=closeness)
+
+def backend_regions(config):
+    return list(dict.fromkeys([config['aws_region']] + list(config.get('backend_regions', []))))
+
+def environment_region(config, environment):
+    return config.get('environment_regions', {}).get(environment, config['aws_region'])
+
+def state_region(config, environment):
+    return nearest_region(environment_region(config, environment), backend_regions(config))
+
+def replica_regions(config, environment):
+    home = state_region(config, environment)
+    return [region for region in backend_regions(config) if region != home]
@@ -1,28 +1,86 @@
 import subprocess
 import json
+import threading
+import time
+from src.tracing import span
 
-def get_secret(vault, item, field):
-    try:
+DEFAULT_SECRETS_CACHE_TTL = 300
+
+# Item fields are kept in memory only, keyed by (vault, item), so every project in
+# a process that uses the same item shares a single `op` call. Nothing is ever
+# written to disk.
+_cache_lock = threading.Lock()
+_item_cache = {}
+_fetch_locks = {}
+
+def _fetch_item_fields(vault, item):
+    with span('op item get', 'op', vault=vault, item=item):
         result = subprocess.run(
-            ['op', 'item', 'get', item, '--vault', vault, '--field', field],
+            ['op', 'item', 'get', item, '--vault', vault, '--format', 'json'],
             capture_output=True, text=True, check=True
         )
-        return result.stdout.strip()
+    fields = {}
+    for field in json.loads(result.stdout).get('fields', []):
+        if 'value' not in field:
+            continue
+        for key in (field.get('label'), field.get('id')):
+            if key:
+                fields.setdefault(key, field['value'])
+    return fields
+
+def get_item_fields(vault, item, ttl=DEFAULT_SECRETS_CACHE_TTL):
+    key = (vault, item)
+    with _cache_lock:
+        fetch_lock = _fetch_locks.setdefault(key, threading.Lock())
+
+    # Concurrent lookups of the same item wait for one fetch instead of all calling `op`
+    with fetch_lock:
+        with _cache_lock:
+            cached = _item_cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+
+        fields = _fetch_item_fields(vault, item)
+        if ttl > 0:
+            with _cache_lock:
+                _item_cache[key] = (time.monotonic() + ttl, fields)
+        return fields
+
+def invalidate_secrets_cache(vault=None, item=None):
+    with _cache_lock:
+        for key in list(_item_cache):
+            if (vault is None or key[0] == vault) and (item is None or key[1] == item):
+                del _item_cache[key]
+
+def get_secret(vault, item, field):
+    try:
+        return get_item_fields(vault, item).get(field)
     except subprocess.CalledProcessError as e:
         print(f"Error retrieving secret '{field}' from 1Password: {e}")
         return None
+    except json.JSONDecodeError as e:
+        print(f"Error parsing 1Password item '{item}': {e}")
+        return None
 
 def get_secrets(config):
     vault = config['onepassword_vault']
     item = config['onepassword_item']
+    ttl = config.get('onepassword_cache_ttl', DEFAULT_SECRETS_CACHE_TTL)
 
     required_secrets = [
         'github_token'
     ]
 
+    try:
+        fields = get_item_fields(vault, item, ttl)
+    except subprocess.CalledProcessError as e:
+        raise ValueError(f"Failed to retrieve item '{item}' from 1Password vault '{vault}': {e}")
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Failed to parse item '{item}' from 1Password: {e}")
+
     secrets = {}
     for secret_name in required_secrets:
-        secret_value = get_secret(vault, item, secret_name)
+        secret_value = fields.get(secret_name)
         if secret_value is None:
             raise ValueError(f"Failed to retrieve required secret '{secret_name}' from 1Password")
         secrets[secret_name] = secret_value
@@ -0,0 +1,297 @@
+import contextvars
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from src.tracing import trace_project, collect_spans
+from src.defaults import DEFAULT_SERVER_WORKERS, DEFAULT_MAX_QUEUE, DEFAULT_LISTEN
+
+# Finished jobs are kept for status queries, oldest evicted first, together with
+# their output and trace spans
+MAX_FINISHED_JOBS = 500
+MAX_JOB_OUTPUT = 1024 * 1024
+JOB_ACTIONS = ('provision', 'destroy', 'sync')
+
+_job_output = contextvars.ContextVar('job_output', default=None)
+
+class JobOutput:
+    # Collects what a job prints, up to MAX_JOB_OUTPUT characters
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._chunks = []
+        self._size = 0
+        self.truncated = False
+
+    def write(self, text):
+        with self._lock:
+            if self._size + len(text) > MAX_JOB_OUTPUT:
+                self.truncated = True
+                text = text[:max(0, MAX_JOB_OUTPUT - self._size)]
+            self._chunks.append(text)
+            self._size += len(text)
+
+    def getvalue(self):
+        with self._lock:
+            return ''.join(self._chunks)
+
+class ContextStdout:
+    # Routes print() from a job's threads to that job's output; everything else
+    # goes to the real stdout
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        output = _job_output.get()
+        if output is None:
+            return self._stream.write(text)
+        output.write(text)
+        return len(text)
+
+    def flush(self):
+        self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+def _percentiles(values):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {
+        'count': len(ordered),
+        'p50': round(statistics.median(ordered), 3),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+        'max': round(ordered[-1], 3),
+    }
+
+class JobQueue:
+    # run_job(action, config) does the work and returns success. describe_job(config)
+    # validates a configuration and returns its (project, environment) pairs,
+    # which no two active jobs may share; it raises ValueError for invalid ones.
+    def __init__(self, run_job, describe_job, workers=DEFAULT_SERVER_WORKERS, max_queue=DEFAULT_MAX_QUEUE):
+        self._run_job = run_job
+        self._describe_job = describe_job
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._finished = []
+        self._claimed = {}
+        self.workers = workers
+        self.max_queue = max_queue
+        self.started_at = time.time()
+
+    def submit(self, action, config):
+        # Returns (job, None) or (None, (http_status, message))
+        if action not in JOB_ACTIONS:
+            return None, (400, f"action must be one of {', '.join(JOB_ACTIONS)}")
+        try:
+            keys = self._describe_job(config)
+        except ValueError as e:
+            return None, (400, f"invalid config: {e}")
+
+        with self._lock:
+            busy = [key for key in keys if key in self._claimed]
+            if busy:
+                project_name, environment = busy[0]
+                return None, (409, f"job {self._claimed[busy[0]]} is already working on project '{project_name}' in environment '{environment}'")
+            # A job only waits once every worker is busy, so a queue limit of 0
+            # still accepts jobs while a worker is free
+            active = sum(1 for job in self._jobs.values() if job['status'] in ('queued', 'running'))
+            if active >= self.workers + self.max_queue:
+                return None, (503, f"the queue is full (all {self.workers} workers busy, {active - self.workers} jobs waiting)")
+            job = {
+                'id': uuid.uuid4().hex[:12],
+                'action': action,
+                'project_name': config.get('project_name'),
+                'environments': [environment for _, environment in keys],
+                'status': 'queued',
+                'success': None,
+                'error': None,
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'keys': keys,
+                'output': JobOutput(),
+                'spans': [],
+            }
+            self._jobs[job['id']] = job
+            for key in keys:
+                self._claimed[key] = job['id']
+        self._executor.submit(self._run, job, config)
+        return job, None
+
+    def _run(self, job, config):
+        with self._lock:
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+        token = _job_output.set(job['output'])
+        try:
+            label = f"{job['project_name']} ({', '.join(job['environments'])})"
+            with trace_project(label), collect_spans() as spans:
+                job['spans'] = spans
+                job['success'] = bool(self._run_job(job['action'], config))
+            if not job['success']:
+                job['error'] = f"{job['action']} reported failure"
+        except Exception as e:
+            job['success'] = False
+            job['error'] = str(e)
+        finally:
+            _job_output.reset(token)
+            with self._lock:
+                job['status'] = 'succeeded' if job['success'] else 'failed'
+                job['finished_at'] = time.time()
+                for key in job['keys']:
+                    if self._claimed.get(key) == job['id']:
+                        del self._claimed[key]
+                self._finished.append(job['id'])
+                while len(self._finished) > MAX_FINISHED_JOBS:
+                    self._jobs.pop(self._finished.pop(0), None)
+
+    def _summary(self, job):
+        summary = {key: job[key] for key in ('id', 'action', 'project_name', 'environments', 'status', 'success', 'error',
+                                              'submitted_at', 'started_at', 'finished_at')}
+        now = time.time()
+        summary['queue_seconds'] = round((job['started_at'] or now) - job['submitted_at'], 3)
+        summary['run_seconds'] = round((job['finished_at'] or now) - job['started_at'], 3) if job['started_at'] else None
+        return summary
+
+    def get(self, job_id, output=False, spans=False):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            details = self._summary(job)
+            if output:
+                details['output'] = job['output'].getvalue()
+                details['output_truncated'] = job['output'].truncated
+                details['steps'] = [
+                    {'name': item['name'], 'duration': round(item['duration'], 3), 'outcome': item['outcome']}
+                    for item in job['spans'] if item['category'] == 'step'
+                ]
+            if spans:
+                details['spans'] = list(job['spans'])
+            return details
+
+    def list(self, status=None):
+        with self._lock:
+            return [self._summary(job) for job in self._jobs.values() if status is None or job['status'] == status]
+
+    def status(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        finished = [job for job in jobs if job['finished_at']]
+        counts = {}
+        for job in jobs:
+            counts[job['status']] = counts.get(job['status'], 0) + 1
+        return {
+            'uptime_seconds': round(time.time() - self.started_at, 3),
+            'workers': self.workers,
+            'running': counts.get('running', 0),
+            'queue_depth': counts.get('queued', 0),
+            'max_queue': self.max_queue,
+            'jobs': counts,
+            'latency': {
+                'queue_seconds': _percentiles([job['started_at'] - job['submitted_at'] for job in jobs if job['started_at']]),
+                'run_seconds': _percentiles([job['finished_at'] - job['started_at'] for job in finished]),
+                'total_seconds': _percentiles([job['finished_at'] - job['submitted_at'] for job in finished]),
+            },
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'project-factory'
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, indent=2).encode('utf-8') + b'\n'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        jobs = self.server.jobs
+        path, _, query = self.path.partition('?')
+        parts = [part for part in path.split('/') if part]
+        params = dict(item.partition('=')[::2] for item in query.split('&') if item)
+        if parts == ['health']:
+            self._send(200, {'status': 'ok'})
+        elif parts == ['status']:
+            self._send(200, jobs.status())
+        elif parts == ['jobs']:
+            self._send(200, {'jobs': jobs.list(params.get('status'))})
+        elif len(parts) in (2, 3) and parts[0] == 'jobs' and parts[2:] in ([], ['trace']):
+            job = jobs.get(parts[1], output=len(parts) == 2, spans=len(parts) == 3)
+            self._send(200, job) if job else self._send(404, {'error': f"no job '{parts[1]}'"})
+        else:
+            self._send(404, {'error': f"no such endpoint: {path}"})
+
+    def do_POST(self):
+        if self.path.partition('?')[0].rstrip('/') != '/jobs':
+            self._send(404, {'error': f"no such endpoint: {self.path}"})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if not isinstance(request, dict) or not isinstance(request.get('config'), dict):
+                raise ValueError("the body must be an object with 'action' and 'config'")
+        except ValueError as e:
+            self._send(400, {'error': f"invalid request: {e}"})
+            return
+        job, error = self.server.jobs.submit(request.get('action', 'provision'), request['config'])
+        if error:
+            self._send(error[0], {'error': error[1]})
+        else:
+            self._send(202, self.server.jobs.get(job['id']))
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        sys.__stderr__.write(f"{self.address_string()} - {format % args}\n")
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('unix', 0)
+
+def serve(jobs, listen=None, socket_path=None, warm_up=None):
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = UnixHTTPServer(socket_path, RequestHandler)
+        os.chmod(socket_path, 0o600)
+        where = f"unix socket {socket_path}"
+    else:
+        host, _, port = (listen or DEFAULT_LISTEN).rpartition(':')
+        server = ThreadingHTTPServer((host or '127.0.0.1', int(port)), RequestHandler)
+        server.daemon_threads = True
+        where = f"http://{server.server_address[0]}:{server.server_address[1]}"
+    server.jobs = jobs
+
+    # Output printed by jobs is kept with each job instead of interleaving here
+    sys.stdout = ContextStdout(sys.stdout)
+    if warm_up:
+        threading.Thread(target=warm_up, name='warm-up', daemon=True).start()
+
+    print(f"Serving provisioning jobs on {where} with {jobs.workers} workers (queue limit {jobs.max_queue}).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down; waiting for running jobs to finish...")
+    finally:
+        server.server_close()
+        jobs.shutdown()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
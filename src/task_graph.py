@@ -0,0 +1,129 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from src.tracing import span, submit_in_context
+
+def _check_graph(tasks):
+    for name, (_, deps) in tasks.items():
+        unknown = [dep for dep in deps if dep not in tasks]
+        if unknown:
+            raise ValueError(f"Task '{name}' depends on unknown tasks: {', '.join(unknown)}")
+
+    # Depth-first search for cycles
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        state[name] = 'visiting'
+        for dep in tasks[name][1]:
+            visit(dep, path + [name])
+        state[name] = 'done'
+
+    for name in tasks:
+        visit(name, [])
+
+def _run_task(name, fn, dep_results):
+    start = time.monotonic()
+    try:
+        with span(name, 'step'):
+            return fn(dep_results), None, start, time.monotonic()
+    except Exception as e:
+        return None, e, start, time.monotonic()
+
+SUCCEEDED = ('ok', 'resumed')
+
+# tasks maps a task name to (fn, deps). Each task starts as soon as all of its
+# dependencies have succeeded and is called with a dict of their results. A task
+# fails by raising; everything that depends on it is skipped. Tasks found in
+# completed are not run again and their recorded result is used instead, and
+# on_success is called with the name and result of every task that finishes.
+def run_task_graph(tasks, max_workers=None, completed=None, on_success=None):
+    _check_graph(tasks)
+
+    results = {}
+    timings = {}
+    run_start = time.monotonic()
+    remaining = dict(tasks)
+    running = {}
+
+    for name, value in (completed or {}).items():
+        if name in remaining:
+            results[name] = value
+            timings[name] = {'status': 'resumed', 'error': None, 'start': None, 'end': None, 'deps': tasks[name][1]}
+            del remaining[name]
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(tasks) or 1) as executor:
+        while remaining or running:
+            for name in list(remaining):
+                fn, deps = remaining[name]
+                dep_status = [timings.get(dep, {}).get('status') for dep in deps]
+                if any(status in ('failed', 'skipped') for status in dep_status):
+                    failed = [dep for dep, status in zip(deps, dep_status) if status in ('failed', 'skipped')]
+                    timings[name] = {'status': 'skipped', 'error': f"dependency failed: {', '.join(failed)}",
+                                     'start': None, 'end': None, 'deps': deps}
+                    del remaining[name]
+                elif all(status in SUCCEEDED for status in dep_status):
+                    future = submit_in_context(executor, _run_task, name, fn, {dep: results[dep] for dep in deps})
+                    running[future] = name
+                    del remaining[name]
+
+            if not running:
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                value, error, start, end = future.result()
+                if not error and on_success:
+                    try:
+                        on_success(name, value)
+                    except Exception as e:
+                        error = e
+                timings[name] = {
+                    'status': 'failed' if error else 'ok',
+                    'error': str(error) if error else None,
+                    'start': start - run_start,
+                    'end': end - run_start,
+                    'deps': tasks[name][1],
+                }
+                if error:
+                    print(f"Step '{name}' failed: {error}")
+                else:
+                    results[name] = value
+
+    return results, timings
+
+def critical_path(timings):
+    finished = {name: timing for name, timing in timings.items() if timing['end'] is not None}
+    if not finished:
+        return []
+
+    # Walk back from the last task to finish through the dependency that released it
+    name = max(finished, key=lambda task: finished[task]['end'])
+    path = [name]
+    while True:
+        deps = [dep for dep in finished[name]['deps'] if dep in finished]
+        if not deps:
+            break
+        name = max(deps, key=lambda dep: finished[dep]['end'])
+        path.append(name)
+    return list(reversed(path))
+
+def print_task_timings(timings):
+    path = critical_path(timings)
+    wall_time = max((timing['end'] for timing in timings.values() if timing['end'] is not None), default=0.0)
+
+    print("\nStep timings:")
+    ordered = sorted(timings.items(), key=lambda item: (item[1]['start'] is None, item[1]['start'] or 0.0))
+    for name, timing in ordered:
+        marker = '*' if name in path else ' '
+        if timing['start'] is None:
+            print(f" {marker} {name:<16} {timing['status']}")
+        else:
+            duration = timing['end'] - timing['start']
+            print(f" {marker} {name:<16} {timing['status']:<7} start {timing['start']:6.2f}s  took {duration:6.2f}s")
+    print(f"Total wall time: {wall_time:.2f}s")
+    if path:
+        print(f"Critical path (*): {' -> '.join(path)}")
@@ -0,0 +1,121 @@
+import os
+import threading
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, meta
+from src.artifacts import make_artifact, write_artifacts
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
+TEMPLATE_CACHE_DIR = os.environ.get(
+    'PROJECT_FACTORY_TEMPLATE_CACHE',
+    os.path.join(os.path.expanduser('~'), '.cache', 'project-factory', 'templates')
+)
+
+TERRAFORM_FILES = ['main.tf', 'variables.tf', 'outputs.tf', 'provider.tf']
+WORKFLOW_FILES = ['deploy.yml', 'destroy.yml']
+SCRIPT_FILES = ['validate_vars.py']
+
+# Static files that are kept outside templates/. The generated tfvars validator is
+# src/tfvars_validator.py itself, so projects run the same checks as `--validate`.
+STATIC_SOURCES = {
+    'scripts/validate_vars.py': os.path.join(os.path.dirname(__file__), 'tfvars_validator.py'),
+}
+
+# Context keys whose value differs between the environments of one project
+ENVIRONMENT_KEYS = {'environment', 's3_bucket', 'dynamodb_table', 'aws_region', 'backend_region'}
+
+_env = None
+_env_lock = threading.Lock()
+_static_files = {}
+_environment_specific = {}
+
+def _bytecode_cache():
+    try:
+        os.makedirs(TEMPLATE_CACHE_DIR, exist_ok=True)
+        return FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    except OSError as e:
+        print(f"Template bytecode cache disabled: {e}")
+        return None
+
+def get_template_env():
+    # One environment per process: every template under templates/ is compiled
+    # once (or loaded from the on-disk bytecode cache) and then reused by every
+    # render in every thread.
+    global _env
+    with _env_lock:
+        if _env is None:
+            env = Environment(
+                loader=FileSystemLoader(TEMPLATE_DIR),
+                bytecode_cache=_bytecode_cache(),
+                auto_reload=False,
+                cache_size=-1
+            )
+            for name in env.list_templates(extensions=['j2']):
+                env.get_template(name)
+            _env = env
+    return _env
+
+def render_template(name, **context):
+    return get_template_env().get_template(name).render(**context)
+
+def read_static_file(name):
+    # Static files are read and hashed once per process
+    with _env_lock:
+        if name not in _static_files:
+            with open(STATIC_SOURCES.get(name, os.path.join(TEMPLATE_DIR, name)), 'rb') as f:
+                _static_files[name] = make_artifact(name, f.read())
+        return _static_files[name]
+
+def _artifacts(environment):
+    # (path relative to the project directory, template or static file)
+    artifacts = [(f"infrastructure/{file}", f"terraform/{file}.j2") for file in TERRAFORM_FILES]
+    artifacts.append((f"infrastructure/vars/{environment}.tfvars", f"vars/{environment}.tfvars.j2"))
+    artifacts += [(f"infrastructure/scripts/{file}", f"scripts/{file}") for file in SCRIPT_FILES]
+    artifacts += [(f".github/workflows/{file}", f"github_workflows/{file}.j2") for file in WORKFLOW_FILES]
+    artifacts.append(('.gitignore', '.gitignore.j2'))
+    return artifacts
+
+def is_environment_specific(name):
+    # A template is environment-specific if it references any per-environment
+    # context key; everything else renders identically for every environment.
+    if not name.endswith('.j2'):
+        return False
+    with _env_lock:
+        if name in _environment_specific:
+            return _environment_specific[name]
+    env = get_template_env()
+    source = env.loader.get_source(env, name)[0]
+    specific = bool(meta.find_undeclared_variables(env.parse(source)) & ENVIRONMENT_KEYS)
+    with _env_lock:
+        _environment_specific[name] = specific
+    return specific
+
+def _render_artifacts(context, environment_specific):
+    files = {}
+    for path, name in _artifacts(context['environment']):
+        if is_environment_specific(name) != environment_specific:
+            continue
+        if name.endswith('.j2'):
+            files[path] = make_artifact(path, render_template(name, **context))
+        else:
+            files[path] = read_static_file(name)
+    return files
+
+# The render functions return an artifact tree (see src/artifacts.py): a dict of
+# paths relative to the project directory to each file's bytes, mode and git
+# blob hash. context needs the keys project_name, aws_region, backend_region,
+# environment, s3_bucket, dynamodb_table, jira_ticket, test_email and the workflow settings
+# terraform_version, terraform_cache and skip_empty_apply.
+
+# Files that are identical for every environment of a project; render them once
+# and combine them with render_environment_files for each environment.
+def render_shared_files(context):
+    return _render_artifacts(context, False)
+
+def render_environment_files(context):
+    return _render_artifacts(context, True)
+
+def render_project_files(context):
+    return dict(render_shared_files(context), **render_environment_files(context))
+
+def write_project_files(project_dir, files):
+    write_artifacts(project_dir, files)
+    print(f"Wrote {len(files)} project files to {project_dir}")
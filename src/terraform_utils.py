@@ -1,63 +1,37 @@
-import os
-from jinja2 import Environment, FileSystemLoader
-
-def create_terraform_files(project_dir, config):
-    template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
-    jinja_env = Environment(loader=FileSystemLoader(template_dir))
-
-    tf_files = ['main.tf', 'variables.tf', 'outputs.tf', 'provider.tf']
-
-    for file in tf_files:
-        template = jinja_env.get_template(f'terraform/{file}.j2')
-        rendered_content = template.render(
-            project_name=config['project_name'],
-            aws_region=config['aws_region'],
-            environment=config['environment'],
-            s3_bucket=config['s3_bucket'],
-            dynamodb_table=config['dynamodb_table']
-        )
-
-        with open(os.path.join(project_dir, file), 'w') as f:
-            f.write(rendered_content)
-
-    print(f"Created Terraform files: {', '.join(tf_files)}")
-
-def create_tfvars_files(project_dir, config):
-    template_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
-    jinja_env = Environment(loader=FileSystemLoader(template_dir))
-
-    vars_dir = os.path.join(project_dir, 'vars')
-    os.makedirs(vars_dir, exist_ok=True)
-
-    template = jinja_env.get_template(f'vars/{config["environment"]}.tfvars.j2')
-    rendered_content = template.render(
-        project_name=config['project_name'],
-        aws_region=config['aws_region'],
-        environment=config['environment'],
-        jira_ticket=config['jira_ticket'],
-        test_email=config['test_email']
-    )
-
-    with open(os.path.join(vars_dir, f'{config["environment"]}.tfvars'), 'w') as f:
-        f.write(rendered_content)
-
-    print(f"Created .tfvars file for environment: {config['environment']}")
-
-def create_terraform_template(project_name, infrastructure_dir, s3_bucket, dynamodb_table, aws_region, environment, jira_ticket, test_email):
-    # Remove the creation of an extra project directory
-    # os.makedirs(project_dir, exist_ok=True)
-
-    config = {
-        'project_name': project_name,
-        'aws_region': aws_region,
-        'environment': environment,
-        's3_bucket': s3_bucket,
-        'dynamodb_table': dynamodb_table,
-        'jira_ticket': jira_ticket,
-        'test_email': test_email
-    }
-
-    create_terraform_files(infrastructure_dir, config)
-    create_tfvars_files(infrastructure_dir, config)
-
-    return infrastructure_dir
\ No newline at end of file
+import json
+import re
+import threading
+import urllib.request
+
+# Generated workflows pin an exact Terraform version, so every run installs the
+# same binary and the provider cache keyed on it stays valid. 'latest' in the
+# configuration is resolved once per process when the workflows are rendered.
+DEFAULT_TERRAFORM_VERSION = '1.11.4'
+TERRAFORM_VERSION_PATTERN = re.compile(r'\d+\.\d+\.\d+(-[0-9A-Za-z.]+)?')
+TERRAFORM_CHECKPOINT_URL = 'https://checkpoint-api.hashicorp.com/v1/check/terraform'
+
+_resolved_versions = {}
+_resolve_lock = threading.Lock()
+
+def _latest_terraform_version():
+    try:
+        with urllib.request.urlopen(TERRAFORM_CHECKPOINT_URL, timeout=5) as response:
+            version = json.load(response).get('current_version', '')
+    except (OSError, ValueError) as e:
+        print(f"Could not look up the latest Terraform version ({e}); pinning {DEFAULT_TERRAFORM_VERSION}.")
+        return DEFAULT_TERRAFORM_VERSION
+    return version if TERRAFORM_VERSION_PATTERN.fullmatch(version) else DEFAULT_TERRAFORM_VERSION
+
+def resolve_terraform_version(version=None):
+    version = version or DEFAULT_TERRAFORM_VERSION
+    if version != 'latest':
+        return version
+    with _resolve_lock:
+        if version not in _resolved_versions:
+            _resolved_versions[version] = _latest_terraform_version()
+        return _resolved_versions[version]
+
+
+def parse_backend_bucket(provider_tf):
+    match = re.search(r'backend\s+"s3"\s*{[^}]*?\bbucket\s*=\s*"([^"]+)"', provider_tf, re.DOTALL)
+    return match.group(1) if match else None
@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+# Checks .tfvars files against the variables declared in a Terraform module.
+#
+# This module only uses the standard library: it is copied into every generated
+# project as infrastructure/scripts/validate_vars.py, so the deploy and destroy
+# workflows run exactly the code behind `main.py --validate`.
+#
+#   validate_vars.py PATH [PATH ...]
+#
+# Each PATH is a .tfvars file, a directory of them or a Terraform module directory
+# (its vars/ subdirectory is checked). The variables of each module are indexed
+# once, however many files are checked against them. Missing required variables,
+# unknown variables and values of the wrong type are all reported, not only the
+# first problem found.
+import glob
+import os
+import re
+import sys
+
+PUNCTUATION = '{}[](),=:.?!<>+-*/%&|'
+PRIMITIVE_TYPES = ('string', 'number', 'bool', 'any')
+COLLECTION_TYPES = ('list', 'set', 'map')
+
+class ParseError(Exception):
+    def __init__(self, message, line):
+        super().__init__(message)
+        self.line = line
+
+# --- Tokenizer --------------------------------------------------------------
+# Tokens are (kind, value, line) with kind one of 'string', 'number', 'ident',
+# 'punct' and 'newline'. Comments are dropped; strings and heredocs become one
+# token each, so braces or quotes inside them never confuse the parser.
+
+def _read_string(source, pos, line):
+    chars = []
+    depth = 0
+    while pos < len(source):
+        char = source[pos]
+        if char == '\\' and pos + 1 < len(source):
+            escaped = source[pos + 1]
+            chars.append({'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\'}.get(escaped, '\\' + escaped))
+            pos += 2
+            continue
+        if char == '\n':
+            raise ParseError("unterminated string", line)
+        if char in '$%' and source.startswith('{', pos + 1) and not source.startswith(char, pos - 1):
+            depth += 1
+        elif char == '}' and depth:
+            depth -= 1
+        elif char == '"' and not depth:
+            return ''.join(chars), pos + 1
+        chars.append(char)
+        pos += 1
+    raise ParseError("unterminated string", line)
+
+def _read_heredoc(source, pos, line):
+    match = re.compile(r'<<(-?)([A-Za-z_][A-Za-z0-9_]*)[ \t]*\n').match(source, pos)
+    if not match:
+        raise ParseError("invalid heredoc", line)
+    marker = match.group(2)
+    lines = []
+    pos = match.end()
+    while pos <= len(source):
+        end = source.find('\n', pos)
+        end = len(source) if end == -1 else end
+        text = source[pos:end]
+        if text.strip() == marker:
+            if match.group(1):
+                indent = min((len(item) - len(item.lstrip()) for item in lines if item.strip()), default=0)
+                lines = [item[indent:] for item in lines]
+            return '\n'.join(lines) + '\n' if lines else '', end, len(lines) + 1
+        lines.append(text)
+        pos = end + 1
+    raise ParseError(f"heredoc '{marker}' is never closed", line)
+
+def tokenize(source):
+    tokens = []
+    pos = 0
+    line = 1
+    number = re.compile(r'\d+(\.\d+)?([eE][+-]?\d+)?')
+    ident = re.compile(r'[A-Za-z_][A-Za-z0-9_-]*')
+    while pos < len(source):
+        char = source[pos]
+        if char == '\n':
+            tokens.append(('newline', None, line))
+            line += 1
+            pos += 1
+        elif char in ' \t\r':
+            pos += 1
+        elif char == '#' or source.startswith('//', pos):
+            end = source.find('\n', pos)
+            pos = len(source) if end == -1 else end
+        elif source.startswith('/*', pos):
+            end = source.find('*/', pos + 2)
+            if end == -1:
+                raise ParseError("comment is never closed", line)
+            line += source.count('\n', pos, end)
+            pos = end + 2
+        elif char == '"':
+            value, pos = _read_string(source, pos + 1, line)
+            tokens.append(('string', value, line))
+        elif source.startswith('<<', pos):
+            value, pos, lines = _read_heredoc(source, pos, line)
+            tokens.append(('string', value, line))
+            line += lines
+        elif number.match(source, pos):
+            match = number.match(source, pos)
+            tokens.append(('number', float(match.group()), line))
+            pos = match.end()
+        elif ident.match(source, pos):
+            match = ident.match(source, pos)
+            tokens.append(('ident', match.group(), line))
+            pos = match.end()
+        elif char in PUNCTUATION:
+            tokens.append(('punct', char, line))
+            pos += 1
+        else:
+            raise ParseError(f"unexpected character {char!r}", line)
+    tokens.append(('newline', None, line))
+    return tokens
+
+class _Tokens:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else ('eof', None, self.tokens[-1][2])
+
+    def next(self):
+        token = self.peek()
+        self.pos += 1
+        return token
+
+    def is_punct(self, value):
+        kind, token_value, _ = self.peek()
+        return kind == 'punct' and token_value == value
+
+    def expect(self, value):
+        kind, token_value, line = self.next()
+        if kind != 'punct' or token_value != value:
+            raise ParseError(f"expected '{value}'", line)
+
+    def skip_newlines(self):
+        while self.peek()[0] == 'newline':
+            self.pos += 1
+
+# --- variables.tf -------------------------------------------------------------
+
+def _expression_tokens(tokens):
+    # Everything up to the end of the line, where brackets may span lines
+    collected = []
+    depth = 0
+    while True:
+        kind, value, line = tokens.peek()
+        if kind == 'eof' or (kind == 'newline' and depth == 0):
+            return collected
+        if kind == 'punct' and value in '([{':
+            depth += 1
+        elif kind == 'punct' and value in ')]}':
+            if depth == 0:
+                return collected
+            depth -= 1
+        collected.append(tokens.next())
+
+def _parse_body(tokens, blocks, nested=False):
+    # Returns the attributes of this body; nested blocks are appended to blocks
+    # as (type, labels, attributes, line)
+    attributes = {}
+    while True:
+        tokens.skip_newlines()
+        kind, value, line = tokens.next()
+        if kind == 'eof':
+            if nested:
+                raise ParseError("block is never closed", line)
+            return attributes
+        if kind == 'punct' and value == '}' and nested:
+            return attributes
+        if kind != 'ident':
+            raise ParseError("expected an attribute or block", line)
+        if tokens.is_punct('='):
+            tokens.next()
+            attributes[value] = (_expression_tokens(tokens), line)
+            continue
+        labels = []
+        while tokens.peek()[0] in ('string', 'ident'):
+            labels.append(tokens.next()[1])
+        tokens.expect('{')
+        inner = []
+        blocks.append((value, labels, _parse_body(tokens, inner, nested=True), line))
+        blocks.extend(inner)
+
+def _parse_type(tokens):
+    tokens.skip_newlines()
+    kind, value, line = tokens.next()
+    if kind == 'string':
+        # Terraform 0.11 style "string", "list" and "map"
+        return {'list': ('list', 'any'), 'map': ('map', 'any')}.get(value, value)
+    if kind != 'ident':
+        raise ParseError("invalid type expression", line)
+    if value in PRIMITIVE_TYPES:
+        return value
+    tokens.expect('(')
+    if value in COLLECTION_TYPES:
+        result = (value, _parse_type(tokens))
+    elif value == 'tuple':
+        tokens.expect('[')
+        elements = []
+        while not tokens.is_punct(']'):
+            tokens.skip_newlines()
+            elements.append(_parse_type(tokens))
+            tokens.skip_newlines()
+            if tokens.is_punct(','):
+                tokens.next()
+            tokens.skip_newlines()
+        tokens.next()
+        result = ('tuple', elements)
+    elif value == 'object':
+        tokens.expect('{')
+        attributes = {}
+        while True:
+            tokens.skip_newlines()
+            if tokens.is_punct('}'):
+                tokens.next()
+                break
+            name_kind, name, name_line = tokens.next()
+            if name_kind not in ('ident', 'string'):
+                raise ParseError("invalid object attribute", name_line)
+            tokens.expect('=')
+            attributes[name] = _parse_type(tokens)
+            tokens.skip_newlines()
+            if tokens.is_punct(','):
+                tokens.next()
+        result = ('object', attributes)
+    elif value == 'optional':
+        result = ('optional', _parse_type(tokens))
+        if tokens.is_punct(','):
+            # The default value of an optional attribute does not matter here
+            tokens.next()
+            _expression_tokens(tokens)
+    else:
+        raise ParseError(f"unknown type '{value}'", line)
+    tokens.skip_newlines()
+    tokens.expect(')')
+    return result
+
+def parse_variables(source):
+    # Returns {name: {'type': type, 'required': bool, 'line': line}}
+    blocks = []
+    _parse_body(_Tokens(tokenize(source)), blocks)
+    variables = {}
+    for block_type, labels, attributes, line in blocks:
+        if block_type != 'variable' or len(labels) != 1:
+            continue
+        variable_type = 'any'
+        if 'type' in attributes:
+            type_tokens, type_line = attributes['type']
+            variable_type = _parse_type(_Tokens(type_tokens + [('newline', None, type_line)]))
+        variables[labels[0]] = {'type': variable_type, 'required': 'default' not in attributes, 'line': line}
+    return variables
+
+def index_module(module_dir):
+    # Variables may be declared in any .tf file of the module
+    variables = {}
+    for path in sorted(glob.glob(os.path.join(module_dir, '*.tf'))):
+        with open(path, 'r') as f:
+            try:
+                declared = parse_variables(f.read())
+            except ParseError as e:
+                raise ParseError(f"{path}:{e.line}: {e}", e.line)
+        for name, variable in declared.items():
+            variables[name] = dict(variable, path=path)
+    return variables
+
+# --- .tfvars values ---------------------------------------------------------
+# Values are parsed into (kind, value) with kind one of 'string', 'number',
+# 'bool', 'null', 'tuple' (a list of values) and 'object' (a dict of values).
+
+def _parse_value(tokens):
+    tokens.skip_newlines()
+    kind, value, line = tokens.next()
+    if kind == 'string':
+        return ('string', value)
+    if kind == 'number':
+        return ('number', value)
+    if kind == 'punct' and value == '-' and tokens.peek()[0] == 'number':
+        return ('number', -tokens.next()[1])
+    if kind == 'ident' and value in ('true', 'false'):
+        return ('bool', value == 'true')
+    if kind == 'ident' and value == 'null':
+        return ('null', None)
+    if kind == 'punct' and value == '[':
+        items = []
+        while True:
+            tokens.skip_newlines()
+            if tokens.is_punct(']'):
+                tokens.next()
+                return ('tuple', items)
+            items.append(_parse_value(tokens))
+            tokens.skip_newlines()
+            if tokens.is_punct(','):
+                tokens.next()
+            elif not tokens.is_punct(']'):
+                raise ParseError("expected ',' or ']'", tokens.peek()[2])
+    if kind == 'punct' and value == '{':
+        items = {}
+        while True:
+            tokens.skip_newlines()
+            if tokens.is_punct('}'):
+                tokens.next()
+                return ('object', items)
+            key_kind, key, key_line = tokens.next()
+            if key_kind not in ('ident', 'string'):
+                raise ParseError("expected an object key", key_line)
+            if not (tokens.is_punct('=') or tokens.is_punct(':')):
+                raise ParseError("expected '=' or ':' after object key", key_line)
+            tokens.next()
+            items[key] = _parse_value(tokens)
+            if tokens.is_punct(','):
+                tokens.next()
+            elif not (tokens.is_punct('}') or tokens.peek()[0] == 'newline'):
+                raise ParseError("expected ',', a new line or '}'", tokens.peek()[2])
+    raise ParseError("variable definitions files only accept literal values", line)
+
+def parse_tfvars(source):
+    # Returns ({name: (value, line)}, [duplicate (name, line)])
+    tokens = _Tokens(tokenize(source))
+    values = {}
+    duplicates = []
+    while True:
+        tokens.skip_newlines()
+        kind, name, line = tokens.next()
+        if kind == 'eof':
+            return values, duplicates
+        if kind != 'ident':
+            raise ParseError("expected a variable name", line)
+        tokens.expect('=')
+        value = _parse_value(tokens)
+        if tokens.peek()[0] not in ('newline', 'eof'):
+            raise ParseError("expected a new line after the value", tokens.peek()[2])
+        if name in values:
+            duplicates.append((name, line))
+        values[name] = (value, line)
+
+# --- Type checks --------------------------------------------------------------
+
+def describe_type(variable_type):
+    if isinstance(variable_type, str):
+        return variable_type
+    kind, inner = variable_type
+    if kind == 'tuple':
+        return f"tuple([{', '.join(describe_type(item) for item in inner)}])"
+    if kind == 'object':
+        return f"object({{{', '.join(f'{name} = {describe_type(item)}' for name, item in inner.items())}}})"
+    return f"{kind}({describe_type(inner)})"
+
+def _describe_value(value):
+    kind, content = value
+    if kind == 'string':
+        return f'string "{content}"' if len(content) <= 40 else 'string'
+    if kind in ('number', 'bool'):
+        return f"{kind} {str(content).lower() if kind == 'bool' else f'{content:g}'}"
+    return {'tuple': 'list', 'object': 'map or object'}.get(kind, kind)
+
+def check_value(value, variable_type, where=''):
+    # Returns a list of problems, following Terraform's automatic conversions
+    # between strings, numbers and bools
+    kind, content = value
+    if kind == 'null' or variable_type == 'any':
+        return []
+    expected = describe_type(variable_type)
+    mismatch = [f"{where}expected {expected}, got {_describe_value(value)}"]
+    if variable_type == 'string':
+        return [] if kind in ('string', 'number', 'bool') else mismatch
+    if variable_type == 'number':
+        if kind == 'number' or (kind == 'string' and re.fullmatch(r'\s*-?\d+(\.\d+)?([eE][+-]?\d+)?\s*', content)):
+            return []
+        return mismatch
+    if variable_type == 'bool':
+        return [] if kind == 'bool' or (kind == 'string' and content in ('true', 'false')) else mismatch
+    if isinstance(variable_type, str):
+        return []
+
+    type_kind, inner = variable_type
+    if type_kind == 'optional':
+        return check_value(value, inner, where)
+    if type_kind in ('list', 'set', 'tuple'):
+        if kind != 'tuple':
+            return mismatch
+        if type_kind == 'tuple' and len(content) != len(inner):
+            return [f"{where}expected {expected} with {len(inner)} elements, got {len(content)}"]
+        element_types = inner if type_kind == 'tuple' else [inner] * len(content)
+        return [problem for index, (item, item_type) in enumerate(zip(content, element_types))
+                for problem in check_value(item, item_type, f"{where}element {index}: ")]
+    if kind != 'object':
+        return mismatch
+    if type_kind == 'map':
+        return [problem for key, item in content.items() for problem in check_value(item, inner, f"{where}key '{key}': ")]
+    problems = [f"{where}attribute '{name}' is required by {expected}" for name, item_type in inner.items()
+                if name not in content and not (isinstance(item_type, tuple) and item_type[0] == 'optional')]
+    for name, item in content.items():
+        if name in inner:
+            problems += check_value(item, inner[name], f"{where}attribute '{name}': ")
+    return problems
+
+# --- Validation ---------------------------------------------------------------
+
+def validate_tfvars(variables, path, environ=os.environ):
+    # Returns a list of "path[:line]: message" problems for one .tfvars file
+    try:
+        with open(path, 'r') as f:
+            values, duplicates = parse_tfvars(f.read())
+    except ParseError as e:
+        return [f"{path}:{e.line}: {e}"]
+    except OSError as e:
+        return [f"{path}: {e.strerror}"]
+
+    problems = [f"{path}:{line}: variable '{name}' is assigned more than once" for name, line in duplicates]
+    for name, (value, line) in values.items():
+        if name not in variables:
+            problems.append(f"{path}:{line}: unknown variable '{name}' is not declared in the module")
+            continue
+        for problem in check_value(value, variables[name]['type']):
+            problems.append(f"{path}:{line}: variable '{name}' has the wrong type: {problem}")
+    # Terraform also reads variables from TF_VAR_<name> environment variables
+    for name, variable in variables.items():
+        if variable['required'] and name not in values and f"TF_VAR_{name}" not in environ:
+            problems.append(f"{path}: required variable '{name}' is not defined")
+    return problems
+
+def _module_dir(tfvars_path):
+    # The nearest directory above the file that contains .tf files
+    directory = os.path.dirname(os.path.abspath(tfvars_path))
+    while True:
+        if glob.glob(os.path.join(directory, '*.tf')):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+def collect_tfvars(paths):
+    # Groups the .tfvars files named by paths by the module they belong to
+    modules = {}
+    problems = []
+    for path in paths:
+        if os.path.isfile(path):
+            files = [path]
+        elif glob.glob(os.path.join(path, '*.tf')):
+            files = sorted(glob.glob(os.path.join(path, 'vars', '*.tfvars')) + glob.glob(os.path.join(path, '*.tfvars')))
+        elif os.path.isdir(os.path.join(path, 'infrastructure')):
+            # A generated project directory
+            project_modules, project_problems = collect_tfvars([os.path.join(path, 'infrastructure')])
+            for module_dir, module_files in project_modules.items():
+                modules.setdefault(module_dir, []).extend(module_files)
+            problems += project_problems
+            continue
+        else:
+            files = sorted(glob.glob(os.path.join(path, '*.tfvars')))
+        if not files:
+            problems.append(f"{path}: no .tfvars files found")
+        for file in files:
+            module_dir = _module_dir(file)
+            if module_dir is None:
+                problems.append(f"{file}: no Terraform module (.tf files) found above it")
+                continue
+            modules.setdefault(module_dir, []).append(file)
+    return modules, problems
+
+def validate_paths(paths, out=sys.stdout):
+    modules, problems = collect_tfvars(paths)
+    checked = 0
+    for module_dir, files in modules.items():
+        try:
+            variables = index_module(module_dir)
+        except ParseError as e:
+            problems.append(str(e))
+            continue
+        for path in dict.fromkeys(files):
+            problems += validate_tfvars(variables, path)
+            checked += 1
+
+    for problem in problems:
+        print(f"Error: {problem}", file=out)
+    if problems:
+        print(f"{len(problems)} problem(s) found in {checked} tfvars file(s).", file=out)
+        return False
+    print(f"All {checked} tfvars file(s) define every required variable with the right type.", file=out)
+    return True
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(f"Usage: {os.path.basename(sys.argv[0])} PATH [PATH ...]\n"
+              "Check .tfvars files, directories of them or Terraform module directories "
+              "against the variables the module declares.")
+        return 0 if argv else 1
+    return 0 if validate_paths(argv) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Spans are kept in memory for the whole process. The project label lives in a
+# context variable, so work handed to another thread has to be submitted with
+# submit_in_context to keep its label. Inside collect_spans, spans go to that
+# context's own list instead.
+_spans = []
+_spans_lock = threading.Lock()
+_project = contextvars.ContextVar('trace_project', default=None)
+_collector = contextvars.ContextVar('trace_collector', default=None)
+
+def _record(name, category, start, end, outcome, error=None, args=None):
+    collector = _collector.get()
+    with _spans_lock:
+        (_spans if collector is None else collector).append({
+            'name': name,
+            'category': category,
+            'project': _project.get(),
+            'start': start,
+            'duration': end - start,
+            'outcome': outcome,
+            'error': error,
+            'thread': threading.current_thread().name,
+            'args': args or {},
+        })
+
+def record_span(name, category, start, end, outcome='ok', error=None, **args):
+    _record(name, category, start, end, outcome, error, args)
+
+# The yielded dict can be updated by the caller; set 'outcome' for calls that
+# report failure without raising.
+@contextmanager
+def span(name, category='step', **args):
+    details = {'outcome': 'ok', 'error': None}
+    start = time.time()
+    try:
+        yield details
+    except Exception as e:
+        details['outcome'] = 'error'
+        details['error'] = str(e)
+        raise
+    finally:
+        _record(name, category, start, time.time(), details['outcome'], details['error'], args)
+
+@contextmanager
+def trace_project(project_label):
+    token = _project.set(project_label)
+    try:
+        yield
+    finally:
+        _project.reset(token)
+
+# A long-running process keeps the spans of each job with the job, so they are
+# released together with it instead of piling up for the life of the process
+@contextmanager
+def collect_spans():
+    spans = []
+    token = _collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _collector.reset(token)
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+def get_spans():
+    with _spans_lock:
+        return list(_spans)
+
+def reset_trace():
+    with _spans_lock:
+        _spans.clear()
+
+# Writes JSONL (one span per line) for .jsonl paths and the Chrome trace-event
+# format, viewable in chrome://tracing or Perfetto, for anything else.
+def write_trace(path):
+    spans = get_spans()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+
+    if path.endswith('.jsonl'):
+        with open(path, 'w') as f:
+            for item in spans:
+                f.write(json.dumps(item) + '\n')
+    else:
+        # Each project becomes a trace "process" and each thread a named track
+        pids = {}
+        tids = {}
+        events = []
+        for item in spans:
+            label = item['project'] or 'project-factory'
+            if label not in pids:
+                pids[label] = len(pids) + 1
+                events.append({'name': 'process_name', 'ph': 'M', 'pid': pids[label], 'args': {'name': label}})
+            pid = pids[label]
+            if (pid, item['thread']) not in tids:
+                tids[(pid, item['thread'])] = len(tids) + 1
+                events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tids[(pid, item['thread'])],
+                               'args': {'name': item['thread']}})
+
+            event_args = dict(item['args'], outcome=item['outcome'])
+            if item['error']:
+                event_args['error'] = item['error']
+            events.append({
+                'name': item['name'],
+                'cat': item['category'],
+                'ph': 'X',
+                'ts': int(item['start'] * 1_000_000),
+                'dur': int(item['duration'] * 1_000_000),
+                'pid': pid,
+                'tid': tids[(pid, item['thread'])],
+                'args': event_args,
+            })
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+
+    print(f"Wrote {len(spans)} trace spans to {path}")
+
+def print_trace_summary(limit=10):
+    spans = get_spans()
+    if not spans:
+        return
+
+    def label(item):
+        return f"[{item['project']}] {item['name']}" if item['project'] else item['name']
+
+    steps = sorted((item for item in spans if item['category'] == 'step'), key=lambda item: item['duration'], reverse=True)
+    calls = sorted((item for item in spans if item['category'] != 'step'), key=lambda item: item['duration'], reverse=True)
+
+    for title, items in (("Slowest steps", steps), ("Slowest external calls", calls)):
+        if not items:
+            continue
+        print(f"\n{title}:")
+        for item in items[:limit]:
+            outcome = '' if item['outcome'] == 'ok' else f" ({item['outcome']})"
+            print(f"  {item['duration']:8.2f}s  {label(item)}{outcome}")
+
+    failed = sum(1 for item in spans if item['outcome'] != 'ok')
+    print(f"{len(spans)} spans recorded, {failed} failed.")